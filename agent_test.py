@@ -3,13 +3,37 @@ tests to run and debug your minimax and alphabeta agents locally.  The test
 cases used by the project assistant are not public.
 """
 
+import datetime
+import json
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+import timeit
 import unittest
 
+import batch_eval
+import benchmark
+import budget
+import endgame
+import eval_cache
 import isolation
 import game_agent
+import match_server
+import mcts
+import opening_book
+import ratings
+import search_stats
+import selfplay
+import tournament
+import tuning
+import transposition
 
 from importlib import reload
 
+import sample_players
 from sample_players import RandomPlayer, GreedyPlayer
 
 
@@ -29,5 +53,894 @@ class IsolationTest(unittest.TestCase):
         print(1-float(len(self.game.get_blank_spaces()))/self.game.width/self.game.height)
         print("Move history:\n{!s}".format(history))
 
+class EndgameTest(unittest.TestCase):
+    """Unit tests for the partitioned endgame solver"""
+
+    # a partitioned position whose 20-cell region takes tens of milliseconds
+    # to solve from an empty cache
+    DENSE_REGION = [(2, 4), (6, 1), (0, 5), (4, 0), (2, 6), (3, 2), (4, 5), (4, 4), (3, 3),
+                    (5, 6), (2, 5), (6, 4), (4, 6), (5, 2), (6, 5), (3, 1), (5, 3), (5, 0),
+                    (4, 1), (6, 2), (2, 0), (5, 4), (1, 2), (3, 5), (0, 4), (1, 4), (1, 6)]
+
+    # a position one move before a partition into regions of 3 and 19 cells
+    BEFORE_PARTITION = [(5, 0), (4, 4), (4, 2), (5, 6), (2, 1), (3, 5), (0, 0), (1, 6), (1, 2),
+                        (0, 4), (3, 3), (2, 5), (1, 4), (1, 3), (2, 2), (0, 5), (0, 1), (2, 6),
+                        (2, 0), (4, 5), (4, 1), (5, 3), (6, 2), (3, 4), (5, 4)]
+
+    # a position in which some children at the search horizon are partitioned
+    LATE_GAME = [(3, 3), (6, 3), (1, 2), (5, 1), (3, 1), (3, 2), (5, 0), (5, 3), (6, 2), (6, 1),
+                 (4, 3), (4, 0), (6, 4), (2, 1), (5, 2), (0, 2), (4, 4), (2, 3), (5, 6), (4, 2),
+                 (3, 5), (3, 4), (1, 4), (5, 5), (0, 6), (3, 6), (2, 5), (1, 5), (1, 3), (0, 3),
+                 (0, 5)]
+
+    def exact_value(self, game, player):
+        moves = game.get_legal_moves()
+        if not moves:
+            return float("-inf") if game.active_player == player else float("inf")
+        values = [self.exact_value(game.forecast_move(move), player) for move in moves]
+        return max(values) if game.active_player == player else min(values)
+
+    def test_solve_matches_game_tree(self):
+        rng = random.Random(5)
+        solved = unsolved = 0
+        while solved < 10 or unsolved < 10:
+            game = isolation.Board("p1", "p2", 5, 5, shuffle_moves=False)
+            for _ in range(rng.randint(8, 16)):
+                moves = game.get_legal_moves()
+                if not moves:
+                    break
+                game.apply_move(rng.choice(moves))
+            if not game.get_legal_moves():
+                continue
+            value = endgame.solve(game, "p1")
+            if endgame.partition(game) is None:
+                self.assertIsNone(value)
+                unsolved += 1
+                continue
+            self.assertEqual(value, self.exact_value(game, "p1"))
+            solved += 1
+
+    def test_abort(self):
+        game = isolation.Board("p1", "p2", shuffle_moves=False)
+        for move in self.DENSE_REGION:
+            game.apply_move(move)
+        calls = []
+
+        def check():
+            calls.append(None)
+            if len(calls) > 100:
+                raise RuntimeError()
+
+        endgame._paths.clear()
+        with self.assertRaises(RuntimeError):
+            endgame.solve(game, "p1", check=check)
+        self.assertEqual(len(calls), 101)
+        value = endgame.solve(game, "p1")
+        endgame._paths.clear()
+        self.assertEqual(endgame.solve(game, "p1"), value)
+
+        # the search counts the cells visited by the solver against its budget:
+        # the moves of this position include (1, 5), which leaves a 19-cell
+        # region to the player to move
+        player = game_agent.AlphaBetaPlayer(budget=budget.NodeLimit(50))
+        game = isolation.Board("p1", player, shuffle_moves=False)
+        for move in self.BEFORE_PARTITION:
+            game.apply_move(move)
+        endgame._paths.clear()
+        self.assertIn(player.get_move(game, lambda: float("inf")), game.get_legal_moves())
+        self.assertLessEqual(len(endgame._paths), 50)
+
+    def test_batch_leaves(self):
+        # the horizon children are scored the same way with and without
+        # batching, so the solver cannot make the two searches disagree
+        for length in (len(self.LATE_GAME) - 1, len(self.LATE_GAME)):
+            for depth in (1, 2, 3):
+                moves = []
+                for batch_leaves in (False, True):
+                    player = game_agent.AlphaBetaPlayer(budget=budget.FixedDepth(depth),
+                                                        batch_leaves=batch_leaves)
+                    game = isolation.Board(player, "p2", shuffle_moves=False)
+                    if length % 2:
+                        game.set_players("p1", player)
+                    for move in self.LATE_GAME[:length]:
+                        game.apply_move(move)
+                    moves.append(player.get_move(game, lambda: float("inf")))
+                self.assertEqual(moves[0], moves[1])
+
+
+class SymmetryTest(unittest.TestCase):
+    """Unit tests for the canonical form of board positions"""
+
+    def test_symmetric_positions_share_canonical_form(self):
+        rng = random.Random(3)
+        for board_class, width, height in [(isolation.Board, 7, 7), (isolation.BitBoard, 7, 7),
+                                           (isolation.Board, 5, 4)]:
+            symmetries = isolation.isolation.symmetries(width, height)
+            self.assertEqual(len(symmetries), 8 if width == height else 4)
+            for num_moves in range(6):
+                game = board_class("p1", "p2", width, height, shuffle_moves=False)
+                for _ in range(num_moves):
+                    game.apply_move(rng.choice(game.get_legal_moves()))
+                canonical, symmetry = game.canonical_form()
+                self.assertEqual(game.transformed(symmetries[0]).zobrist_key, game.zobrist_key)
+                self.assertEqual(canonical.move_count, game.move_count)
+                self.assertEqual(canonical.active_player, game.active_player)
+                self.assertEqual(sorted(symmetry.map_move(move) for move in game.get_legal_moves()),
+                                 sorted(canonical.get_legal_moves()))
+                for move in game.get_legal_moves():
+                    self.assertEqual(symmetry.unmap_move(symmetry.map_move(move)), move)
+                for other in symmetries:
+                    image = game.transformed(other)
+                    self.assertEqual(image.canonical_form()[0].zobrist_key, canonical.zobrist_key)
+
+
+class OpeningBookTest(unittest.TestCase):
+    """Unit tests for the opening book"""
+
+    def test_lookup(self):
+        book = opening_book.build_book(5, 5, plies=2, depth=2)
+        self.assertEqual(len(book), 1 + 6)
+        # searched in this process, and in a worker pool
+        self.assertEqual(opening_book.build_book(5, 5, plies=2, depth=2, processes=2), book)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            opening_book.write_book(path, 5, 5, 2, book)
+            reader = opening_book.OpeningBook(path)
+            game = isolation.Board("p1", "p2", 5, 5)
+            self.assertIn(reader.lookup(game), game.get_legal_moves())
+            for move in game.get_legal_moves():
+                child = game.forecast_move(move)
+                self.assertIn(reader.lookup(child), child.get_legal_moves())
+                self.assertIsNone(reader.lookup(child.forecast_move(child.get_legal_moves()[0])))
+
+            player1 = game_agent.AlphaBetaPlayer(opening_book=reader)
+            game = isolation.Board(player1, RandomPlayer(), 5, 5)
+            self.assertEqual(player1.get_move(game, lambda: 0.), reader.lookup(game))
+            reader.close()
+        finally:
+            os.remove(path)
+
+
+class PonderTest(unittest.TestCase):
+    """Unit tests for searching on the opponent's time"""
+
+    def setUp(self):
+        # the ponder helper only runs with a spare CPU
+        self.available_cpus = game_agent.available_cpus
+        game_agent.available_cpus = lambda: 2
+
+    def tearDown(self):
+        game_agent.available_cpus = self.available_cpus
+
+    def test_ponder_hit(self):
+        player1 = game_agent.AlphaBetaPlayer(ponder=True, budget=budget.FixedDepth(3))
+        game = isolation.Board(player1, RandomPlayer(), shuffle_moves=False)
+        for move in [(3, 3), (2, 4)]:
+            game.apply_move(move)
+        try:
+            move = player1.get_move(game, lambda: float("inf"))
+            self.assertIsNotNone(player1._ponder_pool)
+            self.assertIsNotNone(player1._ponder_key)
+
+            game.apply_move(move)
+            for reply in game.get_legal_moves():
+                if game.forecast_move(reply).hash() == player1._ponder_key:
+                    break
+            game.apply_move(reply)
+            move = player1.get_move(game, lambda: float("inf"))
+            self.assertIn(move, game.get_legal_moves())
+            self.assertEqual((player1.ponder_hits, player1.ponder_misses), (1, 0))
+            self.assertGreater(player1.transposition_table.used, 0)
+        finally:
+            player1.close()
+        self.assertIsNone(player1._ponder_pool)
+
+    def test_ponder_game(self):
+        player1 = game_agent.AlphaBetaPlayer(ponder=True, budget=budget.FixedDepth(2))
+        game = isolation.Board(player1, GreedyPlayer(), shuffle_moves=False)
+        try:
+            winner, history, termination = game.play(time_limit=float("inf"))
+        finally:
+            player1.close()
+        self.assertEqual(termination, "illegal move")
+        self.assertGreater(player1.ponder_hits + player1.ponder_misses, 0)
+
+    def test_cancel(self):
+        player1 = game_agent.AlphaBetaPlayer(ponder=True, budget=budget.FixedDepth(3),
+                                             ponder_limit=float("inf"))
+        game = isolation.Board(player1, RandomPlayer(), shuffle_moves=False)
+        for move in [(3, 3), (2, 4)]:
+            game.apply_move(move)
+        try:
+            player1.get_move(game, lambda: float("inf"))
+            self.assertIsNotNone(player1._ponder_key)
+            player1.stop_pondering()
+            # the helper has replied, so it no longer writes to the table
+            self.assertEqual(player1._ponder_pool._pending, [])
+            table = player1.transposition_table
+            table.clear()
+            time.sleep(0.05)
+            self.assertEqual(table.used, 0)
+        finally:
+            player1.close()
+
+    def test_no_ponder_on_single_cpu(self):
+        game_agent.available_cpus = lambda: 1
+        player1 = game_agent.AlphaBetaPlayer(ponder=True, budget=budget.FixedDepth(3))
+        game = isolation.Board(player1, RandomPlayer(), shuffle_moves=False)
+        player1.get_move(game, lambda: float("inf"))
+        self.assertIsNone(player1._ponder_pool)
+        self.assertIsNone(player1._ponder_key)
+        with self.assertRaises(ValueError):
+            game_agent.AlphaBetaPlayer(ponder=True, tt_size_mb=0)
+
+
+class BudgetTest(unittest.TestCase):
+    """Unit tests for the node and depth search budgets"""
+
+    def setUp(self):
+        self.opening = [(3, 3), (2, 4), (1, 1), (4, 2)]
+
+    def game(self, player):
+        game = isolation.Board(player, RandomPlayer(), shuffle_moves=False)
+        for move in self.opening:
+            game.apply_move(move)
+        return game
+
+    def test_node_limit(self):
+        for player_class in (game_agent.MinimaxPlayer, game_agent.AlphaBetaPlayer):
+            moves = []
+            for _ in range(2):
+                player = player_class(budget=budget.NodeLimit(300))
+                game = self.game(player)
+                # the wall clock has run out, but only the node count matters
+                moves.append(player.get_move(game, lambda: 0.))
+                self.assertIn(moves[-1], game.get_legal_moves())
+                self.assertLessEqual(player.budget.nodes, 301)
+            self.assertEqual(moves[0], moves[1])
+        # iterative deepening only stops when the budget is spent
+        self.assertEqual(player.budget.nodes, 301)
+
+        # a budget spent before any search completes still yields a legal move
+        for player_class in (game_agent.MinimaxPlayer, game_agent.AlphaBetaPlayer):
+            player = player_class(budget=budget.NodeLimit(1))
+            game = self.game(player)
+            self.assertIn(player.get_move(game, lambda: 0.), game.get_legal_moves())
+
+    def test_fixed_depth(self):
+        player = game_agent.AlphaBetaPlayer(budget=budget.FixedDepth(4), collect_stats=True)
+        game = self.game(player)
+        move = player.get_move(game, lambda: 0.)
+        self.assertIn(move, game.get_legal_moves())
+        self.assertEqual(player.move_stats[0].depth, 4)
+
+        expected = game_agent.AlphaBetaPlayer()
+        expected.time_left = lambda: float("inf")
+        for depth in range(1, 5):
+            expected_move = expected.alphabeta(self.game(expected), depth)
+        self.assertEqual(move, expected_move)
+
+    def test_invalid_budget(self):
+        self.assertRaises(ValueError, budget.NodeLimit, 0)
+        self.assertRaises(ValueError, budget.FixedDepth, 0)
+        self.assertRaises(ValueError, budget.build_budget, ("moves", 3))
+
+
+class BenchmarkTest(unittest.TestCase):
+    """Unit tests for the benchmark harness"""
+
+    def test_positions_are_reproducible(self):
+        positions = benchmark.make_positions(isolation.Board)
+        self.assertEqual(positions, benchmark.make_positions(isolation.Board))
+        for (phase, moves), (expected_phase, num_moves) in zip(positions, benchmark.PHASES):
+            self.assertEqual((phase, len(moves)), (expected_phase, num_moves))
+            game = benchmark.replay(isolation.Board, moves)
+            self.assertTrue(game.get_legal_moves(1) and game.get_legal_moves(2))
+
+    def test_compare_flags_regressions(self):
+        baseline = {"results": {"copy/opening": {"us_per_call": 2.0},
+                                "alphabeta_d6/opening": {"nodes": 10, "ms": 5.0}}}
+        report = {"results": {"copy/opening": {"us_per_call": 2.1},
+                              "alphabeta_d6/opening": {"nodes": 10, "ms": 6.0},
+                              "hash/opening": {"us_per_call": 0.1}}}
+        self.assertEqual(benchmark.compare(report, baseline, 0.1), ["alphabeta_d6/opening"])
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        run = benchmark.run
+        benchmark.run = lambda *args: report
+        try:
+            with open(path, "w") as f:
+                json.dump(baseline, f)
+            self.assertEqual(benchmark.main(["--compare", path]), 1)
+            baseline["results"]["alphabeta_d6/opening"]["ms"] = 6.0
+            with open(path, "w") as f:
+                json.dump(baseline, f)
+            self.assertEqual(benchmark.main(["--compare", path]), 0)
+            # too few repetitions to compare
+            with self.assertRaises(SystemExit):
+                benchmark.main(["--compare", path, "--repeat", "1"])
+        finally:
+            benchmark.run = run
+            os.remove(path)
+
+
+class BitBoardTest(unittest.TestCase):
+    """Unit tests for the bitmask and compact board implementations"""
+
+    def setUp(self):
+        self.player1 = RandomPlayer()
+        self.player2 = RandomPlayer()
+
+    def test_matches_board(self):
+        for board_class, width, height in [(isolation.BitBoard, 7, 7), (isolation.BitBoard, 5, 8),
+                                           (isolation.CompactBoard, 7, 7),
+                                           (isolation.CompactBoard, 5, 8)]:
+            board = isolation.Board(self.player1, self.player2, width, height)
+            bitboard = board_class(self.player1, self.player2, width, height)
+            while True:
+                for player in (self.player1, self.player2):
+                    self.assertEqual(sorted(board.get_legal_moves(player)),
+                                     sorted(bitboard.get_legal_moves(player)))
+                    self.assertEqual(board.get_player_location(player),
+                                     bitboard.get_player_location(player))
+                    self.assertEqual(board.utility(player), bitboard.utility(player))
+                self.assertEqual(board.get_blank_spaces(), bitboard.get_blank_spaces())
+                self.assertEqual(board.to_string(), bitboard.to_string())
+                self.assertEqual(board.zobrist_key, bitboard.zobrist_key)
+                legal_moves = board.get_legal_moves()
+                if not legal_moves:
+                    break
+                move = random.choice(legal_moves)
+                self.assertEqual(board.forecast_move(move).to_string(),
+                                 bitboard.forecast_move(move).to_string())
+                board.apply_move(move)
+                bitboard.apply_move(move)
+
+    def test_seeded_move_lists(self):
+        # boards sharing a seed list and shuffle the same moves, so a seeded
+        # game plays out the same on either board
+        for board_class in (isolation.BitBoard, isolation.CompactBoard):
+            board = isolation.Board("p1", "p2", rng=random.Random(3))
+            other = board_class("p1", "p2", rng=random.Random(3))
+            while True:
+                legal_moves = board.get_legal_moves()
+                self.assertEqual(legal_moves, other.get_legal_moves())
+                if not legal_moves:
+                    break
+                board.apply_move(legal_moves[0])
+                other.apply_move(legal_moves[0])
+
+    def test_undo_move(self):
+        for board_class in (isolation.Board, isolation.BitBoard, isolation.CompactBoard):
+            game = board_class(self.player1, self.player2)
+            states = []
+            while game.get_legal_moves():
+                states.append((game.to_string(), game.hash(), game.active_player, game.move_count))
+                game.apply_move(random.choice(game.get_legal_moves()))
+            while states:
+                game.undo_move()
+                self.assertEqual(states.pop(),
+                                 (game.to_string(), game.hash(), game.active_player, game.move_count))
+            self.assertRaises(RuntimeError, game.undo_move)
+
+    def test_search_restores_board(self):
+        player1 = game_agent.AlphaBetaPlayer()
+        player2 = game_agent.MinimaxPlayer()
+        game = isolation.Board(player1, player2)
+        game.apply_move((3, 3))
+        game.apply_move((2, 2))
+        before = game.to_string(), game.hash()
+        deadline = timeit.default_timer() + 0.1
+        time_left = lambda: 1000 * (deadline - timeit.default_timer())
+        player1.get_move(game, time_left)
+        player2.get_move(game, lambda: 100)
+        self.assertEqual(before, (game.to_string(), game.hash()))
+
+    def test_reproducible_moves(self):
+        for board_class in (isolation.Board, isolation.BitBoard, isolation.CompactBoard):
+            games = [board_class(self.player1, self.player2, rng=random.Random(7)),
+                     board_class(self.player1, self.player2, rng=random.Random(7)),
+                     board_class(self.player1, self.player2, shuffle_moves=False)]
+            for game in games:
+                game.apply_move((3, 3))
+            self.assertEqual(games[0].copy().get_legal_moves(self.player1),
+                             games[1].copy().get_legal_moves(self.player1))
+            self.assertEqual([games[2].get_legal_moves(self.player1) for _ in range(5)],
+                             [games[2].copy().get_legal_moves(self.player1)] * 5)
+
+    def test_pickle_without_players(self):
+        for board_class in (isolation.Board, isolation.BitBoard, isolation.CompactBoard):
+            game = board_class(self.player1, self.player2)
+            for move in [(3, 3), (2, 2), (1, 4)]:
+                game.apply_move(move)
+            restored = pickle.loads(pickle.dumps(game))
+            self.assertEqual(restored.active_player, isolation.Board.PLAYER_2)
+            self.assertEqual(restored.to_string(), game.to_string())
+            self.assertEqual(restored.hash(), game.hash())
+            restored.set_players(self.player1, self.player2)
+            self.assertIs(restored.active_player, self.player2)
+            self.assertEqual(sorted(restored.get_legal_moves()), sorted(game.get_legal_moves()))
+
+    def test_compact_board(self):
+        game = isolation.CompactBoard(self.player1, self.player2)
+        self.assertFalse(hasattr(game, "__dict__"))
+        self.assertIsNone(game.get_player_location(self.player1))
+        game.apply_move((3, 3))
+        copy = game.copy()
+        self.assertIsNot(copy._board_state, game._board_state)
+        self.assertEqual(copy.get_player_location(self.player1), (3, 3))
+        self.assertIsNone(copy.get_player_location(self.player2))
+        copy.apply_move((2, 2))
+        self.assertIsNone(game.get_player_location(self.player2))
+        self.assertIsInstance(copy.forecast_move((1, 4)), isolation.CompactBoard)
+
+    def test_knight_tables_shared(self):
+        board = isolation.Board(self.player1, self.player2, 5, 8)
+        bitboard = isolation.BitBoard(self.player1, self.player2, 5, 8)
+        tables = isolation.isolation.knight_tables(5, 8)
+        self.assertIs(board.copy()._knight_moves, tables.moves)
+        self.assertIs(bitboard.copy()._move_masks, tables.masks)
+        self.assertEqual(len(tables.moves[0]), 2)
+
+    def test_play_game(self):
+        game = isolation.BitBoard(game_agent.AlphaBetaPlayer(), GreedyPlayer())
+        winner, history, outcome = game.play(150)
+        self.assertIn(winner, (game.active_player, game.inactive_player))
+
+
+class MoveOrderingTest(unittest.TestCase):
+    """Unit tests for the alpha-beta move ordering"""
+
+    def test_principal_variation(self):
+        for tt_size_mb in (16, 0):
+            player1 = game_agent.AlphaBetaPlayer(tt_size_mb=tt_size_mb)
+            game = isolation.Board(player1, RandomPlayer())
+            game.apply_move((3, 3))
+            game.apply_move((2, 2))
+            player1.time_left = lambda: 100
+            for depth in range(1, 5):
+                move = player1.alphabeta(game, depth)
+                self.assertEqual(player1._prev_pv[0], move)
+                self.assertLessEqual(len(player1._prev_pv), depth)
+                for pv_move in player1._prev_pv:
+                    self.assertIn(pv_move, game.get_legal_moves())
+                    game.apply_move(pv_move)
+                for _ in player1._prev_pv:
+                    game.undo_move()
+
+
+@unittest.skipIf(batch_eval.np is None, "numpy is not installed")
+class BatchEvalTest(unittest.TestCase):
+    """Unit tests for the vectorized leaf evaluation"""
+
+    def test_matches_scalar_scores(self):
+        score_fns = [sample_players.null_score, sample_players.open_move_score,
+                     sample_players.improved_score, sample_players.center_score,
+                     game_agent.custom_score, game_agent.custom_score_2,
+                     game_agent.custom_score_3]
+        player1, player2 = RandomPlayer(), RandomPlayer()
+        game = isolation.Board(player1, player2)
+        game.apply_move((3, 3))
+        game.apply_move((2, 2))
+        while game.get_legal_moves():
+            moves = game.get_legal_moves()
+            for score_fn in score_fns:
+                for player in (player1, player2):
+                    self.assertEqual(batch_eval.score_children(score_fn, game, moves, player),
+                                     [score_fn(game.forecast_move(m), player) for m in moves])
+            game.apply_move(random.choice(moves))
+
+    def test_search_matches_scalar(self):
+        # with the endgame solver on, in a position where it applies
+        results = []
+        for batch_leaves in (False, True):
+            player = game_agent.AlphaBetaPlayer(batch_leaves=batch_leaves, solve_endgames=True)
+            player.time_left = lambda: float("inf")
+            game = isolation.Board("p1", player, shuffle_moves=False)
+            for move in EndgameTest.LATE_GAME:
+                game.apply_move(move)
+            for depth in (1, 2, 3):
+                move = player.alphabeta(game, depth)
+                entry = player.transposition_table.probe(game.zobrist_key)
+                results.append((batch_leaves, depth, move, entry.value, player._prev_pv))
+        for scalar, batch in zip(results[:3], results[3:]):
+            self.assertEqual(scalar[1:], batch[1:])
+
+
+class EvalCacheTest(unittest.TestCase):
+    """Unit tests for the evaluation cache"""
+
+    def test_cached_scores(self):
+        cache = eval_cache.EvaluationCache(game_agent.custom_score, 2)
+        self.assertEqual(cache.__name__, "custom_score")
+        player1, player2 = RandomPlayer(), RandomPlayer()
+        game = isolation.Board(player1, player2)
+        game.apply_move((3, 3))
+        game.apply_move((2, 2))
+        children = [game.forecast_move(m) for m in game.get_legal_moves()[:3]]
+        for child in children[:2]:
+            for player in (player1, player2):
+                self.assertEqual(cache(child, player), game_agent.custom_score(child, player))
+        self.assertEqual(cache.stats()["misses"], 4)
+        self.assertEqual(cache(children[1], player1), game_agent.custom_score(children[1], player1))
+        self.assertEqual(cache.stats()["hits"], 1)
+        cache(children[2], player1)
+        cache(children[1], player2)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["entries"], 2)
+        with self.assertRaises(ValueError):
+            eval_cache.EvaluationCache(game_agent.custom_score, 0)
+
+    def test_player_cache(self):
+        player1 = game_agent.AlphaBetaPlayer(eval_cache_size=1000)
+        game = isolation.Board(player1, RandomPlayer())
+        game.apply_move((3, 3))
+        game.apply_move((2, 2))
+        deadline = timeit.default_timer() + 0.05
+        move = player1.get_move(game, lambda: 1000 * (deadline - timeit.default_timer()))
+        self.assertIn(move, game.get_legal_moves())
+        self.assertGreater(player1.score.stats()["hits"], 0)
+        spec = tournament.agent_spec(player1)
+        self.assertEqual(spec.eval_cache_size, 1000)
+        self.assertEqual(tournament.build_player(spec).eval_cache_size, 1000)
+
+
+class MCTSTest(unittest.TestCase):
+    """Unit tests for the Monte Carlo tree search player"""
+
+    def test_rollout(self):
+        masks = mcts.move_masks(7, 7)
+        full = (1 << 49) - 1
+        self.assertFalse(mcts.rollout(masks, full, 0, 48))
+        # the player to move has one move left, after which its opponent is stuck
+        self.assertTrue(mcts.rollout(masks, full & ~(1 << 15), 0, 48))
+
+    def test_get_move_reuses_tree(self):
+        player1 = mcts.MCTSPlayer(rng=random.Random(0))
+        player2 = RandomPlayer()
+        game = isolation.Board(player1, player2, rng=random.Random(0))
+        game.apply_move((3, 3))
+        game.apply_move((2, 2))
+        for _ in range(2):
+            deadline = timeit.default_timer() + 0.05
+            move = player1.get_move(game, lambda: 1000 * (deadline - timeit.default_timer()))
+            self.assertIn(move, game.get_legal_moves())
+            game.apply_move(move)
+            game.apply_move(player2.get_move(game, lambda: 100))
+        first, second = player1.rollout_stats
+        self.assertGreater(first.rollouts, 0)
+        self.assertEqual(first.tree_size, first.rollouts + 1)
+        self.assertEqual(first.reused_visits, 0)
+        self.assertGreater(second.reused_visits, 0)
+        # a spec cannot hold the seeded generator of the player
+        self.assertRaises(ValueError, tournament.agent_spec, player1)
+
+    def test_endgame_move(self):
+        rng = random.Random(5)
+        solved = 0
+        while solved < 10:
+            game = isolation.Board("p1", "p2", 5, 5, shuffle_moves=False)
+            while game.get_legal_moves() and endgame.best_move(game) is None:
+                game.apply_move(rng.choice(game.get_legal_moves()))
+            move = endgame.best_move(game)
+            if move is None:
+                continue
+            solved += 1
+            player = game.active_player
+            self.assertEqual(endgame.solve(game.forecast_move(move), player),
+                             endgame.solve(game, player))
+
+
+class SelfPlayTest(unittest.TestCase):
+    """Unit tests for the self-play game generator"""
+
+    def test_stream_games(self):
+        specs = [selfplay.parse_agent("AlphaBetaPlayer:custom_score", budget.BudgetSpec("depth", 1)),
+                 selfplay.parse_agent("GreedyPlayer", budget.BudgetSpec("depth", 1))]
+        self.assertIsNone(specs[1].budget)
+        self.assertRaises(ValueError, selfplay.parse_agent, "NoPlayer")
+        records = selfplay.self_play(specs, 3, seed=1, shuffle_moves=False, time_limit=1000)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.jsonl")
+            self.assertEqual(selfplay.write_games(records, path), 3)
+            games = list(selfplay.read_games(path))
+        self.assertEqual(games, list(selfplay.self_play(specs, 3, seed=1, shuffle_moves=False,
+                                                        time_limit=1000)))
+        self.assertEqual(games[0].agents, ["AlphaBetaPlayer:custom_score:depth=1", "GreedyPlayer"])
+        self.assertEqual(games[1].agents, games[0].agents[::-1])
+        for record in games:
+            for game, move, outcome in selfplay.positions(record):
+                self.assertIn(move, game.get_legal_moves())
+            # the generator applies the last move once the loop asks for more
+            self.assertEqual(outcome, 1)
+            self.assertFalse(game.get_legal_moves())
+            self.assertEqual(len(record.moves) % 2, 1 - record.winner)
+
+
+class TuningTest(unittest.TestCase):
+    """Unit tests for the heuristic weight tuner"""
+
+    def test_default_weights(self):
+        game = isolation.Board("p1", "p2", shuffle_moves=False)
+        rng = random.Random(1)
+        while game.get_legal_moves():
+            game.apply_move(rng.choice(game.get_legal_moves()))
+            for heuristic in tuning.PARAMETERS:
+                score_fn = tuning.score_function(heuristic, tuning.default_weights(heuristic))
+                self.assertEqual(score_fn(game, "p1"), getattr(game_agent, heuristic)(game, "p1"))
+        self.assertRaises(ValueError, tuning.default_weights, "null_score")
+
+    def test_cached_candidates(self):
+        config = tuning.TuningConfig("custom_score", games=2, nodes=50)
+        candidates = [{"opponent_weight": 0.5}, {"opponent_weight": 1.5}]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.jsonl")
+            scores = tuning.evaluate(config, candidates, tuning.CandidateCache(path))
+            cache = tuning.CandidateCache(path)
+            self.assertEqual(len(cache), 2)
+            self.assertEqual([cache.get(config, weights) for weights in candidates], scores)
+            self.assertIsNone(cache.get(config._replace(nodes=60), candidates[0]))
+            ranking = tuning.grid_search(config, {"opponent_weight": [1.5, 0.5]}, cache)
+            self.assertEqual(sorted(score for score, _ in ranking), sorted(scores))
+        with self.assertRaises(ValueError):
+            tuning.grid_search(config, {"weight": [1.]})
+
+
+class RatingsTest(unittest.TestCase):
+    """Unit tests for the game and rating database"""
+
+    def test_record_games(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ratings.db")
+            with ratings.RatingStore(path) as store:
+                store.record_game(["A", "B"], [(0, 0), (3, 3)], 0, "illegal move", [1.5, 2.],
+                                  seed=7, played_at=datetime.datetime(2017, 1, 1))
+                a, b = store.rating("A"), store.rating("B")
+                self.assertGreater(a.rating, ratings.INITIAL_RATING)
+                self.assertAlmostEqual(a.rating + b.rating, 2 * ratings.INITIAL_RATING)
+                self.assertEqual((a.games, b.games), (1, 1))
+
+            # ratings are updated incrementally from the stored ones
+            with ratings.RatingStore(path) as store:
+                store.record_game(["C", "B"], [(1, 1), (2, 2)], 0, "timeout",
+                                  played_at=datetime.datetime(2017, 2, 1))
+                store.record_game(["B", "C"], [(1, 1), (2, 2)], 1, "illegal move")
+                self.assertEqual([r.name for r in store.ratings()], ["C", "A", "B"])
+                incremental = store.ratings()
+                store.rebuild()
+                self.assertEqual(store.ratings(), incremental)
+
+                game = store.games("A")[0]
+                self.assertEqual(game.agents, ("A", "B"))
+                self.assertEqual(game.opening, [(0, 0), (3, 3)])
+                self.assertEqual((game.seed, game.winner, game.move_times), (7, 0, [1.5, 2.]))
+                self.assertEqual(len(store.games("B")), 3)
+                self.assertEqual(len(store.games("B", since=datetime.date(2017, 1, 15))), 2)
+                self.assertEqual(len(store.games(until="2017-02-01")), 1)
+                self.assertEqual(store.games("D"), [])
+                self.assertRaises(ValueError, store.rating, "D")
+
+    def test_self_pairing(self):
+        with ratings.RatingStore(":memory:") as store:
+            store.record_game(["A", "B"], [(0, 0), (3, 3)], 0, "illegal move")
+            rating = store.rating("A")
+            store.record_game(["A", "A"], [(0, 0), (3, 3)], 0, "illegal move")
+            self.assertEqual(store.rating("A"), rating)
+            self.assertEqual(len(store.games("A")), 2)
+            store.rebuild()
+            self.assertEqual(store.rating("A"), rating)
+
+    def test_tournament_games(self):
+        agents = [tournament.Agent(RandomPlayer(), "Random"),
+                  tournament.Agent(GreedyPlayer(), "Greedy")]
+        matches = [tournament.Match(0, 1, ((3, 3), (0, 0)), seed, False) for seed in range(2)]
+        results = tournament.run_matches(agents, matches)
+        with ratings.RatingStore(":memory:") as store:
+            tournament.record_games(store, agents, matches, results)
+            games = store.games()
+            self.assertEqual([game.winner for game in games], [r[0] for r in results])
+            self.assertEqual([game.move_times for game in games],
+                             [[round(t, 3) for t in r[3]] for r in results])
+            self.assertEqual(store.spec("Greedy"), tournament.agent_spec(GreedyPlayer()))
+
+
+class SearchStatsTest(unittest.TestCase):
+    """Unit tests for the search instrumentation"""
+
+    def test_records_move_stats(self):
+        for player_class in (game_agent.AlphaBetaPlayer, game_agent.MinimaxPlayer):
+            player1 = player_class(collect_stats=True)
+            game = isolation.Board(player1, RandomPlayer())
+            game.apply_move((3, 3))
+            game.apply_move((2, 2))
+            deadline = timeit.default_timer() + 0.05
+            move = player1.get_move(game, lambda: 1000 * (deadline - timeit.default_timer()))
+            self.assertIn(move, game.get_legal_moves())
+            self.assertEqual(len(player1.move_stats), 1)
+            stats = player1.move_stats[0]
+            self.assertGreater(stats.nodes, 0)
+            self.assertGreater(stats.leaves, 0)
+            self.assertGreaterEqual(stats.depth, 1)
+            self.assertGreater(stats.effective_branching_factor, 1)
+            self.assertLessEqual(stats.movegen_time + stats.make_time + stats.score_time,
+                                 stats.total_time)
+            self.assertIs(player1.score, game_agent.custom_score)
+            summary = search_stats.summarize([stats.as_dict()])
+            self.assertEqual(summary["moves"], 1)
+
+
+class TranspositionTableTest(unittest.TestCase):
+    """Unit tests for the transposition table"""
+
+    def test_capacity(self):
+        table = transposition.TranspositionTable(size_mb=1)
+        self.assertLessEqual(table.capacity * transposition.ENTRY_BYTES, 2 ** 20)
+        self.assertEqual(table.capacity & (table.capacity - 1), 0)
+
+    def test_replacement(self):
+        for table_class, replacement, expected in [
+                (transposition.TranspositionTable, transposition.DEPTH_PREFERRED, 5),
+                (transposition.TranspositionTable, transposition.ALWAYS_REPLACE, 1),
+                (transposition.SharedTranspositionTable, transposition.DEPTH_PREFERRED, 5),
+                (transposition.SharedTranspositionTable, transposition.ALWAYS_REPLACE, 1)]:
+            table = table_class(size_mb=0, replacement=replacement)
+            table.store(1, 5, 0., transposition.EXACT, (0, 0))
+            table.store(2, 1, 0., transposition.EXACT, (0, 0))
+            self.assertIsNone(table.probe(3))
+            entry = table.probe(1) or table.probe(2)
+            self.assertEqual(entry.depth, expected)
+            table.new_search()
+            table.store(2, 1, 0., transposition.EXACT, (0, 0))
+            self.assertEqual(table.probe(2).depth, 1)
+            self.assertEqual(table.stats()["occupancy"], 1.)
+
+    def test_search_uses_table(self):
+        player1 = game_agent.AlphaBetaPlayer(tt_keep_across_turns=True)
+        game = isolation.Board(player1, RandomPlayer())
+        game.apply_move((3, 3))
+        game.apply_move((2, 2))
+        player1.time_left = lambda: 100
+        for depth in range(1, 5):
+            player1.alphabeta(game, depth)
+        stats = player1.transposition_table.stats()
+        self.assertGreater(stats["hits"], 0)
+        self.assertGreater(stats["occupancy"], 0)
+
+    def test_shared_entries(self):
+        table = transposition.SharedTranspositionTable(size_mb=0.01)
+        key = 2 ** 64 - 3
+        table.store(key, 7, float("-inf"), transposition.UPPER, (6, 2))
+        self.assertEqual(table.probe(key), transposition.Entry(key, 7, float("-inf"),
+                                                               transposition.UPPER, (6, 2), 0))
+        table.store(key, 8, 1.5, transposition.LOWER, None)
+        self.assertEqual(table.probe(key).move, None)
+        self.assertIsNone(table.probe(key ^ 1))
+        self.assertEqual(table.used, 1)
+        table.clear()
+        self.assertIsNone(table.probe(key))
+        self.assertEqual(table.used, 0)
+
+    def test_parallel_search(self):
+        player1 = game_agent.AlphaBetaPlayer(search_processes=3, budget=budget.FixedDepth(4))
+        try:
+            self.assertIsInstance(player1.transposition_table,
+                                  transposition.SharedTranspositionTable)
+            game = isolation.Board(player1, RandomPlayer())
+            game.apply_move((3, 3))
+            game.apply_move((2, 2))
+            for _ in range(2):
+                move = player1.get_move(game, lambda: 0.)
+                self.assertIn(move, game.get_legal_moves())
+        finally:
+            player1.close()
+
+        # starting and stopping the helpers does not count against a node budget
+        player1 = game_agent.AlphaBetaPlayer(search_processes=2, budget=budget.NodeLimit(300))
+        try:
+            game = isolation.Board(player1, RandomPlayer(), shuffle_moves=False)
+            game.apply_move((3, 3))
+            game.apply_move((2, 2))
+            self.assertIn(player1.get_move(game, lambda: 0.), game.get_legal_moves())
+            self.assertEqual(player1.budget.nodes, 301)
+        finally:
+            player1.close()
+
+
+class TournamentTest(unittest.TestCase):
+    """Unit tests for the tournament runner"""
+
+    def test_seeded_round_is_reproducible(self):
+        cpu_agent = tournament.Agent(RandomPlayer(), "Random")
+        test_agents = [tournament.Agent(GreedyPlayer(), "Greedy"),
+                       tournament.Agent(RandomPlayer(), "Random_2")]
+        results = []
+        for _ in range(2):
+            win_counts = {agent.player: 0 for agent in [cpu_agent] + test_agents}
+            tournament.play_round(cpu_agent, test_agents, win_counts, 3,
+                                  random.Random(11), shuffle_moves=False)
+            results.append(win_counts)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(sum(results[0].values()), 3 * 2 * len(test_agents))
+
+    def test_sprt(self):
+        self.assertAlmostEqual(tournament.score_to_elo(tournament.elo_to_score(150.)), 150.)
+        elo, low, high = tournament.elo_interval(15, 20)
+        self.assertLess(low, elo)
+        self.assertLess(elo, high)
+        state = tournament.SprtState(0, 0, 0., None)
+        for _ in range(30):
+            state = tournament.sprt_update(state, 0, 2)
+        self.assertEqual(state.decision, "H0")
+
+        cpu_agents = [tournament.Agent(RandomPlayer(), "Random")]
+        test_agents = [tournament.Agent(GreedyPlayer(), "Greedy"),
+                       tournament.Agent(RandomPlayer(), "Random_2")]
+        states = tournament.play_sprt(cpu_agents, test_agents, random.Random(3),
+                                      shuffle_moves=False, max_matches=5)
+        self.assertEqual(sorted(states), [(0, 0), (1, 0)])
+        for state in states.values():
+            games = state.wins + state.losses
+            self.assertTrue(state.decision is not None or games == 10)
+            self.assertEqual(games % 2, 0)
+            self.assertLessEqual(games, 10)
+
+    def test_agent_spec(self):
+        player = game_agent.AlphaBetaPlayer(score_fn=game_agent.custom_score_2, timeout=5.)
+        spec = tournament.agent_spec(player)
+        self.assertEqual(spec, tournament.AgentSpec("AlphaBetaPlayer", "custom_score_2", 3, 5.))
+        rebuilt = tournament.build_player(spec)
+        self.assertEqual(rebuilt.score.__name__, "custom_score_2")
+        self.assertEqual(tournament.agent_spec(rebuilt), spec)
+        self.assertRaises(ValueError, tournament.agent_spec, object())
+
+        player = game_agent.MinimaxPlayer(budget=budget.NodeLimit(500))
+        spec = tournament.agent_spec(player)
+        self.assertEqual(spec.budget, budget.BudgetSpec("nodes", 500))
+        self.assertEqual(tournament.build_player(spec).budget.limit, 500)
+        self.assertEqual(tournament.spec_from_json(json.loads(json.dumps(spec))), spec)
+
+    def test_agent_spec_options(self):
+        options = {"tt_size_mb": 0, "tt_keep_across_turns": True, "batch_leaves": True,
+                   "ponder_limit": 50., "solve_endgames": False}
+        player = game_agent.AlphaBetaPlayer(**options)
+        spec = tournament.agent_spec(player)
+        self.assertEqual(dict(spec.options), options)
+        rebuilt = tournament.build_player(spec)
+        for name, value in options.items():
+            self.assertEqual(getattr(rebuilt, name), value)
+        self.assertIsNone(rebuilt.transposition_table)
+        self.assertEqual(tournament.spec_from_json(json.loads(json.dumps(spec))), spec)
+
+        player = mcts.MCTSPlayer(timeout=5., exploration=1., reuse_tree=False)
+        rebuilt = tournament.build_player(tournament.agent_spec(player))
+        self.assertEqual((rebuilt.TIMER_THRESHOLD, rebuilt.exploration, rebuilt.reuse_tree),
+                         (5., 1., False))
+        self.assertEqual(tournament.agent_spec(game_agent.AlphaBetaPlayer()).options, ())
+        self.assertRaises(ValueError, tournament.agent_spec, RandomPlayer(rng=random.Random(1)))
+
+    def test_remote_matches(self):
+        server = match_server.MatchServer(("127.0.0.1", 0))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            agents = [tournament.Agent(RandomPlayer(), "Random"),
+                      tournament.Agent(GreedyPlayer(), "Greedy")]
+            matches = [tournament.Match(0, 1, ((3, 3), (0, 0)), seed, False) for seed in range(4)]
+            # move times are measured, so only the outcomes are compared
+            local = tournament.run_matches(agents, matches)
+            remote = tournament.run_matches(agents, matches, addresses=[server.server_address])
+            self.assertEqual([result[:3] for result in local], [result[:3] for result in remote])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_worker_count(self):
+        self.assertGreaterEqual(tournament.worker_count(0), 1)
+        self.assertEqual(tournament.worker_count(1), 1)
+        self.assertLessEqual(tournament.worker_count(10 ** 6), tournament.worker_count(0))
+
+
 if __name__ == '__main__':
     unittest.main()
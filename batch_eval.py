@@ -0,0 +1,203 @@
+"""Vectorized evaluation of sibling leaf positions with NumPy.
+
+`score_children(score_fn, game, moves, player)` returns the same values as
+
+    [score_fn(game.forecast_move(move), player) for move in moves]
+
+but computes the mobility of both players, the distance to the center and
+the terminal states of all the children at once from the parent board, so no
+board is copied and no move list is built for the children. The heuristics
+from sample_players.py and game_agent.py are vectorized, with the default
+weights of the game_agent.py heuristics; any other score function (including
+a heuristic with tuned weights) is evaluated one child at a time.
+
+Every call has a fixed NumPy overhead of about 50 microseconds, several times
+the cost of scoring one child with the scalar heuristics, so scoring the at
+most eight children of one node at once is slower than scoring them one at
+a time; see the `batch_leaves` option of `game_agent.AlphaBetaPlayer`.
+"""
+import inspect
+
+from collections import namedtuple
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; score_children() needs it
+    np = None
+
+from isolation.isolation import knight_tables
+
+# Mobility and location of the player and its opponent in every child, and
+# the number of blank cells (the same in every child)
+Features = namedtuple("Features", ["own_moves", "opp_moves", "row", "col",
+                                   "won", "lost", "blank_count"])
+
+_neighbor_arrays = {}
+
+
+def _neighbor_array(width, height):
+    """Return a (cells, 8) array of the knight destinations of every cell,
+    padded with the index `cells` of an extra always-blocked cell.
+    """
+    neighbors = _neighbor_arrays.get((width, height))
+    if neighbors is None:
+        size = width * height
+        neighbors = np.full((size, 8), size, dtype=np.intp)
+        for idx, destinations in enumerate(knight_tables(width, height).moves):
+            neighbors[idx, :len(destinations)] = [dest for dest, _ in destinations]
+        _neighbor_arrays[(width, height)] = neighbors
+    return neighbors
+
+
+def child_features(game, moves, player):
+    """Compute the Features of the positions reached by applying each move
+    to the game, from the point of view of `player`.
+    """
+    width, height = game.width, game.height
+    size = width * height
+    neighbors = _neighbor_array(width, height)
+
+    blocked = np.ones(size + 1, dtype=bool)
+    blanks = game.get_blank_spaces()
+    blocked[[r + c * height for r, c in blanks]] = False
+
+    count = len(moves)
+    move_rows = np.array([r for r, _ in moves], dtype=np.intp)
+    move_cols = np.array([c for _, c in moves], dtype=np.intp)
+    move_idx = move_rows + move_cols * height
+    children = np.repeat(blocked[None, :], count, axis=0)
+    rows = np.arange(count)
+    children[rows, move_idx] = True
+    rows = rows[:, None]
+
+    # The active player moves; the other player is next to move in the child
+    mover_moves = (~children[rows, neighbors[move_idx]]).sum(axis=1)
+    waiting = game.inactive_player
+    waiting_loc = game.get_player_location(waiting)
+    blank_count = len(blanks) - 1
+    if waiting_loc is None:
+        waiting_moves = np.full(count, blank_count)
+    else:
+        waiting_idx = waiting_loc[0] + waiting_loc[1] * height
+        waiting_moves = (~children[rows, neighbors[waiting_idx][None, :]]).sum(axis=1)
+    stuck = waiting_moves == 0
+
+    if player == waiting:
+        if waiting_loc is None:
+            row = col = None
+        else:
+            row = np.full(count, waiting_loc[0])
+            col = np.full(count, waiting_loc[1])
+        return Features(waiting_moves, mover_moves, row, col,
+                        np.zeros(count, dtype=bool), stuck, blank_count)
+    return Features(mover_moves, waiting_moves, move_rows, move_cols,
+                    stuck, np.zeros(count, dtype=bool), blank_count)
+
+
+@lru_cache(maxsize=None)
+def _weights(name):
+    """Return the default keyword weights of a heuristic of game_agent.py."""
+    import game_agent  # imported here because game_agent imports this module
+    parameters = inspect.signature(getattr(game_agent, name)).parameters
+    return {param.name: param.default for param in parameters.values()
+            if param.default is not param.empty}
+
+
+def _center_distance(game, f):
+    w, h = game.width / 2., game.height / 2.
+    return (h - f.row) ** 2 + (w - f.col) ** 2
+
+
+def _null(game, f):
+    return np.zeros(len(f.own_moves))
+
+
+def _open_move(game, f):
+    return f.own_moves.astype(float)
+
+
+def _improved(game, f):
+    return (f.own_moves - f.opp_moves).astype(float)
+
+
+def _center(game, f):
+    return _center_distance(game, f)
+
+
+def _custom(game, f):
+    return f.own_moves - _weights("custom_score")["opponent_weight"] * f.opp_moves
+
+
+def _occupied_rate(game, f):
+    return 1 - float(f.blank_count) / (game.width * game.height)
+
+
+def _custom_2(game, f):
+    weights = _weights("custom_score_2")
+    occupied_rate = _occupied_rate(game, f)
+    if occupied_rate < weights["opening_rate"]:
+        return f.own_moves - weights["center_weight"] * _center_distance(game, f) - f.opp_moves
+    if occupied_rate < weights["midgame_rate"]:
+        return (f.own_moves - f.opp_moves).astype(float)
+    return f.own_moves - weights["opponent_weight"] * f.opp_moves
+
+
+def _custom_3(game, f):
+    weights = _weights("custom_score_3")
+    if _occupied_rate(game, f) < weights["lookahead_rate"]:
+        return f.own_moves - weights["opponent_weight"] * f.opp_moves
+    return None  # looks one move further ahead; scored one child at a time
+
+
+# Vectorized versions of the score functions, keyed by (module, name) so
+# that reloaded modules still match
+VECTORIZED = {
+    ("sample_players", "null_score"): _null,
+    ("sample_players", "open_move_score"): _open_move,
+    ("sample_players", "improved_score"): _improved,
+    ("sample_players", "center_score"): _center,
+    ("game_agent", "custom_score"): _custom,
+    ("game_agent", "custom_score_2"): _custom_2,
+    ("game_agent", "custom_score_3"): _custom_3,
+}
+
+
+def score_children(score_fn, game, moves, player):
+    """Evaluate every child of a position with a score function.
+
+    Parameters
+    ----------
+    score_fn : callable
+        A heuristic with the signature score_fn(game, player).
+
+    game : `isolation.Board`
+        The parent position.
+
+    moves : list<(int, int)>
+        Legal moves of the active player in the parent position.
+
+    player : object
+        The player from whose point of view the children are scored.
+
+    Returns
+    -------
+    list<float>
+        score_fn(game.forecast_move(move), player) for each move.
+    """
+    if np is None:
+        raise ImportError("score_children() requires numpy")
+    vectorized = VECTORIZED.get((getattr(score_fn, "__module__", None),
+                                 getattr(score_fn, "__name__", None)))
+    values = None
+    if vectorized is not None and moves:
+        features = child_features(game, moves, player)
+        if features.row is not None or vectorized not in (_center, _custom_2):
+            values = vectorized(game, features)
+    if values is None:
+        return [score_fn(game.forecast_move(move), player) for move in moves]
+
+    values = values.astype(float)
+    values[features.won] = float("inf")
+    values[features.lost] = float("-inf")
+    return values.tolist()
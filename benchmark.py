@@ -0,0 +1,255 @@
+"""Benchmark the board primitives, the heuristics and the search agents on a
+fixed set of seeded positions.
+
+Every benchmark runs on the same opening, midgame and endgame positions
+(generated from a fixed seed with unshuffled move lists), so the results of
+two runs are directly comparable:
+
+    python benchmark.py --output baseline.json
+    ... change the code ...
+    python benchmark.py --compare baseline.json
+
+The results are written as JSON: microseconds per call for the primitives
+and heuristics, the node count, time in milliseconds and nodes per second of
+each fixed-depth search, and the move chosen and time taken by node-limited
+searches. Neither kind of search depends on the wall clock (see budget.py).
+With --compare, each timing is compared to the saved baseline and the script
+exits with status 1 if any benchmark is slower than the baseline by more than
+the tolerance. A single timing run varies by tens of percent from one run to
+the next, so comparisons take the best of at least MIN_COMPARE_REPEAT runs.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+
+import isolation
+import sample_players
+import game_agent
+
+from budget import FixedDepth, NodeLimit
+from search_stats import InstrumentedBoard, SearchStats, timer
+
+SEED = 20170101
+REPEAT = 5
+MIN_COMPARE_REPEAT = 5  # timing repetitions required to compare against a baseline
+TOLERANCE = 0.10  # fraction of the baseline time counted as noise
+
+# Number of moves played to reach each position
+PHASES = [("opening", 2), ("midgame", 14), ("endgame", 24)]
+
+SCORE_FUNCTIONS = [sample_players.null_score, sample_players.open_move_score,
+                   sample_players.improved_score, sample_players.center_score,
+                   game_agent.custom_score, game_agent.custom_score_2,
+                   game_agent.custom_score_3]
+
+
+def make_positions(board_class, seed=SEED):
+    """Return a list of (phase, moves) pairs: the moves of a seeded random
+    game that reach each phase with both players still able to move.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for phase, num_moves in PHASES:
+        while True:
+            game = board_class(1, 2, shuffle_moves=False)
+            moves = []
+            for _ in range(num_moves):
+                legal_moves = game.get_legal_moves()
+                if not legal_moves:
+                    break
+                move = rng.choice(legal_moves)
+                game.apply_move(move)
+                moves.append(move)
+            if (len(moves) == num_moves and game.get_legal_moves(1) and
+                    game.get_legal_moves(2)):
+                break
+        positions.append((phase, moves))
+    return positions
+
+
+def replay(board_class, moves, player_1=1, player_2=2):
+    game = board_class(player_1, player_2, shuffle_moves=False)
+    for move in moves:
+        game.apply_move(move)
+    return game
+
+
+def time_call(fn, repeat=REPEAT):
+    """Return the best time per call of fn() in microseconds."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return 1e6 * min(timer.repeat(repeat, number)) / number
+
+
+def bench_primitives(board_class, positions, repeat=REPEAT):
+    results = {}
+    for phase, moves in positions:
+        game = replay(board_class, moves)
+        move = game.get_legal_moves()[0]
+        benchmarks = [
+            ("get_legal_moves", game.get_legal_moves),
+            ("forecast_move", lambda: game.forecast_move(move)),
+            ("copy", game.copy),
+            ("hash", game.hash),
+        ]
+        for score_fn in SCORE_FUNCTIONS:
+            benchmarks.append((score_fn.__name__,
+                               lambda score_fn=score_fn: score_fn(game, game.active_player)))
+        for name, fn in benchmarks:
+            results["{}/{}".format(name, phase)] = {"us_per_call": time_call(fn, repeat)}
+    return results
+
+
+PLAYER_CLASSES = {"alphabeta": game_agent.AlphaBetaPlayer,
+                  "minimax": game_agent.MinimaxPlayer}
+
+
+def _search(board_class, moves, algorithm, budget, wrap=None):
+    """Choose a move with a new player (so that no transposition table
+    entries or move ordering statistics are carried over from an earlier
+    run) and return the move and the search time in seconds.
+    """
+    player = PLAYER_CLASSES[algorithm](score_fn=sample_players.improved_score, budget=budget)
+    if len(moves) % 2:
+        game = replay(board_class, moves, 2, player)
+    else:
+        game = replay(board_class, moves, player, 2)
+    if wrap is not None:
+        game = wrap(game)
+    start = timer()
+    move = player.get_move(game, lambda: float("inf"))
+    return move, timer() - start
+
+
+def bench_search(board_class, positions, algorithm, depth, repeat=REPEAT):
+    """Time a fixed-depth search ("time to depth") from every position and
+    count the nodes it visits (counted in a separate, untimed run).
+    """
+    results = {}
+    for phase, moves in positions:
+        stats = SearchStats()
+        _search(board_class, moves, algorithm, FixedDepth(depth),
+                lambda game: InstrumentedBoard(game, stats))
+        seconds = min(_search(board_class, moves, algorithm, FixedDepth(depth))[1]
+                      for _ in range(repeat))
+        results["{}_d{}/{}".format(algorithm, depth, phase)] = {
+            "nodes": stats.nodes,
+            "ms": 1000 * seconds,
+            "nodes_per_second": stats.nodes / seconds if seconds else 0.,
+        }
+    return results
+
+
+def bench_node_limit(board_class, positions, algorithm, nodes, repeat=REPEAT):
+    """Record the move chosen from every position by a search limited to a
+    fixed number of nodes, and the time the search takes.
+    """
+    results = {}
+    for phase, moves in positions:
+        runs = [_search(board_class, moves, algorithm, NodeLimit(nodes)) for _ in range(repeat)]
+        results["{}_n{}/{}".format(algorithm, nodes, phase)] = {
+            "move": list(runs[0][0]),
+            "ms": 1000 * min(seconds for _, seconds in runs),
+        }
+    return results
+
+
+def run(board_class, alphabeta_depth, minimax_depth, nodes, repeat=REPEAT):
+    positions = make_positions(board_class)
+    results = bench_primitives(board_class, positions, repeat)
+    results.update(bench_search(board_class, positions, "alphabeta", alphabeta_depth, repeat))
+    results.update(bench_search(board_class, positions, "minimax", minimax_depth, repeat))
+    results.update(bench_node_limit(board_class, positions, "alphabeta", nodes, repeat))
+    return {
+        "meta": {
+            "board": board_class.__name__,
+            "seed": SEED,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def _elapsed(result):
+    return result["us_per_call"] if "us_per_call" in result else result["ms"]
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """Print the change of every benchmark against the baseline and return
+    the names of the benchmarks that are slower than the baseline by more
+    than the tolerance. Primitives are timed in microseconds per call and
+    searches in milliseconds.
+    """
+    regressions = []
+    print("{:<34}{:>14}{:>14}{:>9}  {}".format("Benchmark", "Baseline", "Current", "Change", ""))
+    for name, result in sorted(report["results"].items()):
+        if name not in baseline["results"]:
+            print("{:<34}{:>14}{:>14.3f}{:>9}  new".format(name, "-", _elapsed(result), ""))
+            continue
+        old = baseline["results"][name]
+        change = _elapsed(result) / _elapsed(old) - 1 if _elapsed(old) else 0.
+        flag = ""
+        if change > tolerance:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif change < -tolerance:
+            flag = "faster"
+        if "nodes" in result and result["nodes"] != old.get("nodes"):
+            flag += " (nodes {} -> {})".format(old.get("nodes"), result["nodes"])
+        if "move" in result and result["move"] != old.get("move"):
+            flag += " (move {} -> {})".format(old.get("move"), result["move"])
+        print("{:<34}{:>14.3f}{:>14.3f}{:>+9.1%}  {}".format(
+            name, _elapsed(old), _elapsed(result), change, flag))
+    return regressions
+
+
+def main(argv=None):
+    """Run the benchmarks and return the exit status: 1 if a comparison
+    found regressions, 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--board", choices=["Board", "BitBoard", "CompactBoard"], default="Board",
+                        help="board implementation to benchmark (default: %(default)s)")
+    parser.add_argument("--alphabeta-depth", type=int, default=6)
+    parser.add_argument("--minimax-depth", type=int, default=4)
+    parser.add_argument("--nodes", type=int, default=2000,
+                        help="node limit of the searches reporting the move they choose "
+                             "(default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help="timing repetitions; the best one is kept (default: %(default)s)")
+    parser.add_argument("--output", help="file to write the JSON results to (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="slowdown tolerated before flagging a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.compare and args.repeat < MIN_COMPARE_REPEAT:
+        parser.error("--compare needs --repeat {} or more: single timings are too noisy to "
+                     "flag regressions".format(MIN_COMPARE_REPEAT))
+
+    report = run(getattr(isolation, args.board), args.alphabeta_depth, args.minimax_depth,
+                 args.nodes, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\n{} benchmark(s) regressed by more than {:.0%}".format(
+                len(regressions), args.tolerance))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
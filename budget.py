@@ -0,0 +1,106 @@
+"""Search budgets for the agents in game_agent.py.
+
+A budget decides when the search of a move stops. It works through the same
+path as the wall clock: at the start of every move the player replaces the
+`time_left` function it was given with `budget.start(time_left)`, and the
+search raises `SearchTimeout` as soon as that function returns less than the
+player's TIMER_THRESHOLD. Iterative deepening additionally stops after the
+`depth` of the budget (None for no limit) has been searched.
+
+    WallClock()       search until the move timer runs out (the default)
+    NodeLimit(n)      stop after n nodes, whatever the time
+    FixedDepth(d)     search to depth d, whatever the time
+
+Node and depth budgets do not depend on the speed or load of the machine, so
+with unshuffled boards they make the same moves on every run. Note that
+`Board.play` still enforces its own time limit.
+
+Bookkeeping outside the search (such as the deadline given to the helper
+processes of a parallel search) reads the budget with peek(), which returns
+what the function returned by start() would return without counting a node.
+"""
+from collections import namedtuple
+
+INFINITY = float("inf")
+
+# A serializable description of a budget: the budget kind (a key of BUDGETS)
+# and its limit (None for the wall clock)
+BudgetSpec = namedtuple("BudgetSpec", ["kind", "limit"])
+
+
+class WallClock:
+    """Search until the move timer runs out."""
+
+    kind = "time"
+    limit = None
+    depth = None
+
+    def __init__(self):
+        self._time_left = lambda: INFINITY
+
+    def start(self, time_left):
+        self._time_left = time_left
+        return time_left
+
+    def peek(self):
+        return self._time_left()
+
+
+class NodeLimit:
+    """Stop the search after a fixed number of nodes. The search checks its
+    budget once on entering every node, so each call to the function returned
+    by start() counts as one node.
+    """
+
+    kind = "nodes"
+    depth = None
+
+    def __init__(self, limit):
+        if limit < 1:
+            raise ValueError("The node limit must be positive: {}".format(limit))
+        self.limit = limit
+        self.nodes = 0
+
+    def start(self, time_left):
+        self.nodes = 0
+
+        def nodes_left():
+            self.nodes += 1
+            return INFINITY if self.nodes <= self.limit else -INFINITY
+        return nodes_left
+
+    def peek(self):
+        return INFINITY if self.nodes < self.limit else -INFINITY
+
+
+class FixedDepth:
+    """Search every move to a fixed depth."""
+
+    kind = "depth"
+
+    def __init__(self, limit):
+        if limit < 1:
+            raise ValueError("The search depth must be positive: {}".format(limit))
+        self.limit = limit
+        self.depth = limit
+
+    def start(self, time_left):
+        return lambda: INFINITY
+
+    def peek(self):
+        return INFINITY
+
+
+BUDGETS = {cls.kind: cls for cls in (WallClock, NodeLimit, FixedDepth)}
+
+
+def budget_spec(budget):
+    return BudgetSpec(budget.kind, budget.limit)
+
+
+def build_budget(spec):
+    """Construct a new budget from a BudgetSpec (or a (kind, limit) pair)."""
+    kind, limit = spec
+    if kind not in BUDGETS:
+        raise ValueError("Unknown budget kind: {}".format(kind))
+    return BUDGETS[kind]() if limit is None else BUDGETS[kind](limit)
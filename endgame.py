@@ -0,0 +1,157 @@
+"""Exact solution of partitioned Isolation endgames.
+
+Once no blank cell can be reached by both players, the players can no longer
+block each other, and the game is decided by the longest knight path each of
+them can make through its own region: the player to move wins if and only if
+its longest path is strictly longer than the opponent's.
+
+Cells are represented as bitmasks with one bit per cell (bit `row + col *
+height`, as in `isolation.isolation.knight_tables`). Regions are found by a
+flood fill over the knight graph of the blank cells, and the longest paths
+are found by a depth-first search memoized on (cell, unvisited region).
+
+The search of a dense region near MAX_REGION_CELLS can take tens of
+milliseconds, so the solver functions take an optional `check` function,
+called at every cell the search visits, which may raise an exception (such
+as `game_agent.SearchTimeout` when the player's time runs out) to abort it.
+"""
+from isolation.isolation import knight_tables
+
+# Partitions are only looked for when at most this many cells are blank, and
+# regions with more cells than MAX_REGION_CELLS are not solved, because the
+# longest path search grows exponentially with the size of the region
+MAX_BLANKS = 24
+MAX_REGION_CELLS = 20
+
+PATH_CACHE_SIZE = 2 ** 16  # longest path lengths kept across searches
+
+# Longest path lengths by (width, height, start cell, region); cleared when
+# it holds PATH_CACHE_SIZE entries
+_paths = {}
+
+
+def blank_mask(game):
+    """Return the bitmask of the blank cells of a game."""
+    height = game.height
+    mask = 0
+    for r, c in game.get_blank_spaces():
+        mask |= 1 << (r + c * height)
+    return mask
+
+
+def reachable(masks, start, free):
+    """Return the bitmask of the cells of `free` that can be reached from the
+    cell `start` by a sequence of knight moves through `free`.
+    """
+    region = 0
+    frontier = masks[start] & free
+    while frontier:
+        region |= frontier
+        neighbors = 0
+        while frontier:
+            low = frontier & -frontier
+            neighbors |= masks[low.bit_length() - 1]
+            frontier ^= low
+        frontier = neighbors & free & ~region
+    return region
+
+
+def partition(game):
+    """Return the regions (bitmasks) reachable by the active and the inactive
+    player if they do not share any cell, or None otherwise.
+    """
+    active_loc = game.get_player_location(game.active_player)
+    inactive_loc = game.get_player_location(game.inactive_player)
+    if active_loc is None or inactive_loc is None:
+        return None
+    height = game.height
+    masks = knight_tables(game.width, height).masks
+    free = blank_mask(game)
+    active_region = reachable(masks, active_loc[0] + active_loc[1] * height, free)
+    inactive_region = reachable(masks, inactive_loc[0] + inactive_loc[1] * height, free)
+    if active_region & inactive_region:
+        return None
+    return active_region, inactive_region
+
+
+def longest_path(width, height, start, region, check=None):
+    """Return the number of moves of the longest knight path from the cell
+    `start` that only visits cells of the bitmask `region`.
+
+    `check`, if given, is called at every cell visited that is not cached
+    yet; the lengths found before it raises stay cached.
+    """
+    key = (width, height, start, region)
+    best = _paths.get(key)
+    if best is not None:
+        return best
+    if check is not None:
+        check()
+    masks = knight_tables(width, height).masks
+    reachable_count = bin(reachable(masks, start, region)).count("1")
+    best = 0
+    options = masks[start] & region
+    while options and best < reachable_count:
+        low = options & -options
+        options ^= low
+        length = 1 + longest_path(width, height, low.bit_length() - 1, region & ~low, check)
+        if length > best:
+            best = length
+    if len(_paths) >= PATH_CACHE_SIZE:
+        _paths.clear()
+    _paths[key] = best
+    return best
+
+
+def solve(game, player, max_blanks=MAX_BLANKS, max_region_cells=MAX_REGION_CELLS, check=None):
+    """Return the exact value of a partitioned game for `player`: inf if the
+    player wins, -inf if it loses, or None if the players are not partitioned
+    (or more than `max_blanks` cells are blank) or a region is too large to
+    solve. `check` is passed on to longest_path().
+    """
+    if game.width * game.height - game.move_count > max_blanks:
+        return None
+    regions = partition(game)
+    if regions is None:
+        return None
+    active_region, inactive_region = regions
+    if max(bin(region).count("1") for region in regions) > max_region_cells:
+        return None
+    width, height = game.width, game.height
+    active_r, active_c = game.get_player_location(game.active_player)
+    inactive_r, inactive_c = game.get_player_location(game.inactive_player)
+    active_moves = longest_path(width, height, active_r + active_c * height, active_region, check)
+    inactive_moves = longest_path(width, height, inactive_r + inactive_c * height,
+                                  inactive_region, check)
+    active_wins = active_moves > inactive_moves
+    if active_wins == (player == game.active_player):
+        return float("inf")
+    return float("-inf")
+
+
+def best_move(game, max_blanks=MAX_BLANKS, max_region_cells=MAX_REGION_CELLS, check=None):
+    """Return the move of the active player starting its longest path in a
+    partitioned game, which is an optimal move, or None under the same
+    conditions as solve(). `check` is passed on to longest_path().
+    """
+    if game.width * game.height - game.move_count > max_blanks:
+        return None
+    regions = partition(game)
+    if regions is None:
+        return None
+    active_region, _ = regions
+    if max(bin(region).count("1") for region in regions) > max_region_cells:
+        return None
+    width, height = game.width, game.height
+    r, c = game.get_player_location(game.active_player)
+    masks = knight_tables(width, height).masks
+    options = masks[r + c * height] & active_region
+    move, best = None, -1
+    while options:
+        low = options & -options
+        options ^= low
+        cell = low.bit_length() - 1
+        length = longest_path(width, height, cell, active_region & ~low, check)
+        if length > best:
+            move, best = (cell % height, cell // height), length
+    return move
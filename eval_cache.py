@@ -0,0 +1,74 @@
+"""Memoization of heuristic evaluations.
+
+Iterative deepening scores many of the same leaves again at every depth, and
+heuristics such as custom_score_3 look one move ahead from every leaf. An
+`EvaluationCache` wraps a score function and remembers its values, keyed by
+the Zobrist key of the position and the side of the player scoring it, so a
+repeated leaf costs a dictionary lookup. The least recently used values are
+evicted once the cache is full.
+
+Players use it through the `eval_cache_size` argument of
+`game_agent.IsolationPlayer`. Score functions must only depend on the
+position, not on the history of the game.
+"""
+import functools
+
+from collections import OrderedDict
+
+CACHE_SIZE = 2 ** 16  # default number of cached values
+
+
+class EvaluationCache:
+    """A score function with the same signature and name as the function it
+    wraps, returning cached values when possible.
+
+    Parameters
+    ----------
+    score_fn : callable
+        The heuristic to cache, with the signature score_fn(game, player).
+
+    max_entries : int (optional)
+        The number of values kept before the least recently used value is
+        evicted.
+    """
+
+    def __init__(self, score_fn, max_entries=CACHE_SIZE):
+        if max_entries < 1:
+            raise ValueError("The cache size must be positive: {}".format(max_entries))
+        functools.update_wrapper(self, score_fn)
+        self.score_fn = score_fn
+        self.max_entries = max_entries
+        self.clear()
+
+    def clear(self):
+        """Remove every value and reset the statistics."""
+        self._values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, game, player):
+        key = (game.hash(), player == game.active_player)
+        values = self._values
+        value = values.get(key)
+        if value is not None:
+            self.hits += 1
+            values.move_to_end(key)
+            return value
+        self.misses += 1
+        value = self.score_fn(game, player)
+        values[key] = value
+        if len(values) > self.max_entries:
+            values.popitem(last=False)
+        return value
+
+    def stats(self):
+        """Return a dictionary of the number of hits and misses, the hit rate
+        and the number of cached values.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": float(self.hits) / lookups if lookups else 0.,
+            "entries": len(self._values),
+        }
@@ -2,6 +2,19 @@
 test your agent's strength against a set of known agents using tournament.py
 and include the results in your report.
 """
+from batch_eval import score_children
+from endgame import solve
+from eval_cache import EvaluationCache
+from opening_book import OpeningBook
+from budget import WallClock
+from search_stats import recording, timer
+from parallel_search import SearchPool, available_cpus
+from transposition import (TranspositionTable, SharedTranspositionTable, DEPTH_PREFERRED,
+                           EXACT, LOWER, UPPER)
+
+# Depth under which exactly solved endgame positions are stored in the
+# transposition table, so that every later probe of the position uses them
+SOLVED_DEPTH = 1000
 
 
 class SearchTimeout(Exception):
@@ -9,7 +22,7 @@ class SearchTimeout(Exception):
     pass
 
 
-def best_advantage_in_next_move(game, player, possible_moves):
+def best_advantage_in_next_move(game, player, possible_moves, opponent_weight=0.5):
     if possible_moves is None or len(possible_moves) == 0:
         return float("-inf")
 
@@ -24,11 +37,11 @@ def best_advantage_in_next_move(game, player, possible_moves):
             return float("inf")
         play_legal_moves = len(game_copy.get_legal_moves(player))
         opponent_legal_moves = len(game_copy.get_legal_moves(opponent))
-        paths.append(play_legal_moves - 0.5 * opponent_legal_moves)
+        paths.append(play_legal_moves - opponent_weight * opponent_legal_moves)
     return max(paths)
 
 
-def custom_score(game, player):
+def custom_score(game, player, opponent_weight=0.5):
     """Calculate the heuristic value of a game state from the point of view
     of the given player.
 
@@ -47,6 +60,10 @@ def custom_score(game, player):
         A player instance in the current game (i.e., an object corresponding to
         one of the player objects `game.__player_1__` or `game.__player_2__`.)
 
+    opponent_weight : float (optional)
+        The weight of the opponent's moves relative to the player's moves.
+        The weights of the custom heuristics are tuned with tuning.py.
+
     Returns
     -------
     float
@@ -61,10 +78,11 @@ def custom_score(game, player):
     my_possible_moves = len(game.get_legal_moves(player))
     opponent_possible_moves = len(game.get_legal_moves(game.get_opponent(player)))
 
-    return float(my_possible_moves - 0.5 * opponent_possible_moves)
+    return float(my_possible_moves - opponent_weight * opponent_possible_moves)
 
 
-def custom_score_2(game, player):
+def custom_score_2(game, player, center_weight=0.2, opening_rate=0.1, midgame_rate=0.3,
+                   opponent_weight=0.5):
     """Calculate the heuristic value of a game state from the point of view
     of the given player.
 
@@ -81,6 +99,16 @@ def custom_score_2(game, player):
         A player instance in the current game (i.e., an object corresponding to
         one of the player objects `game.__player_1__` or `game.__player_2__`.)
 
+    center_weight : float (optional)
+        The weight of the squared distance to the center in the opening.
+
+    opening_rate, midgame_rate : float (optional)
+        The fractions of occupied cells at which the opening and the
+        midgame end.
+
+    opponent_weight : float (optional)
+        The weight of the opponent's moves after the midgame.
+
     Returns
     -------
     float
@@ -117,14 +145,14 @@ def custom_score_2(game, player):
     2. minimise my opponent moves but with less weight
     
     """
-    if occupied_rate < 0.1:
-        return float(my_possible_moves - 0.2 * center_distance - opponent_possible_moves)
-    if occupied_rate < 0.3:
+    if occupied_rate < opening_rate:
+        return float(my_possible_moves - center_weight * center_distance - opponent_possible_moves)
+    if occupied_rate < midgame_rate:
         return float(my_possible_moves - opponent_possible_moves)
-    return float(my_possible_moves - 0.5 * opponent_possible_moves)
+    return float(my_possible_moves - opponent_weight * opponent_possible_moves)
 
 
-def custom_score_3(game, player):
+def custom_score_3(game, player, opponent_weight=0.5, lookahead_rate=0.4):
     """Calculate the heuristic value of a game state from the point of view
     of the given player.
 
@@ -141,6 +169,13 @@ def custom_score_3(game, player):
         A player instance in the current game (i.e., an object corresponding to
         one of the player objects `game.__player_1__` or `game.__player_2__`.)
 
+    opponent_weight : float (optional)
+        The weight of the opponent's moves relative to the player's moves.
+
+    lookahead_rate : float (optional)
+        The fraction of occupied cells from which the best move advantage of
+        the next move is scored instead.
+
     Returns
     -------
     float
@@ -161,16 +196,16 @@ def custom_score_3(game, player):
 
     occupied_rate = 1 - float(len(game.get_blank_spaces())) / (game.width * game.height)
 
-    if occupied_rate < 0.4:
-        return float(len_my_possible_moves - 0.5 * len_opponent_possible_moves)
-    return float(best_advantage_in_next_move(game, player, my_possible_moves))
+    if occupied_rate < lookahead_rate:
+        return float(len_my_possible_moves - opponent_weight * len_opponent_possible_moves)
+    return float(best_advantage_in_next_move(game, player, my_possible_moves, opponent_weight))
 
 
 class IsolationPlayer:
     """Base class for minimax and alphabeta agents -- this class is never
-    constructed or tested directly.
-
-    ********************  DO NOT MODIFY THIS CLASS  ********************
+    constructed or tested directly. It holds the options shared by every
+    search: the depth, score function, time budget, statistics and
+    evaluation cache.
 
     Parameters
     ----------
@@ -187,12 +222,31 @@ class IsolationPlayer:
         Time remaining (in milliseconds) when search is aborted. Should be a
         positive value large enough to allow the function to return before the
         timer expires.
+
+    collect_stats : bool (optional)
+        Record the `search_stats.SearchStats` of every move in the
+        `move_stats` list. Recording slows the search down, so it is off by
+        default.
+
+    budget : object (optional)
+        When the search of a move stops: a `budget.WallClock` (the default),
+        `budget.NodeLimit` or `budget.FixedDepth`.
+
+    eval_cache_size : int (optional)
+        If positive, wrap the score function in an `eval_cache.EvaluationCache`
+        of this many values, so repeated positions are only scored once.
     """
-    def __init__(self, search_depth=3, score_fn=custom_score, timeout=10.):
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=10., collect_stats=False,
+                 budget=None, eval_cache_size=0):
         self.search_depth = search_depth
-        self.score = score_fn
+        self.eval_cache_size = eval_cache_size
+        self.score = EvaluationCache(score_fn, eval_cache_size) if eval_cache_size else score_fn
         self.time_left = None
         self.TIMER_THRESHOLD = timeout
+        self.collect_stats = collect_stats
+        self.budget = budget if budget is not None else WallClock()
+        self.move_stats = []
+        self.current_stats = None
 
 
 class MinimaxPlayer(IsolationPlayer):
@@ -229,19 +283,30 @@ class MinimaxPlayer(IsolationPlayer):
             Board coordinates corresponding to a legal move; may return
             (-1, -1) if there are no available legal moves.
         """
-        self.time_left = time_left
+        self.time_left = self.budget.start(time_left)
+        depth = self.budget.depth or self.search_depth
 
         # Initialize the best move so that this function returns something
         # in case the search fails due to timeout
         best_move = (-1, -1)
 
-        try:
-            # The try/except block will automatically catch the exception
-            # raised when the timer is about to expire.
-            return self.minimax(game, self.search_depth)
+        with recording(self, game) as searched_game:
+            try:
+                # The try/except block will automatically catch the exception
+                # raised when the timer is about to expire.
+                best_move = self.minimax(searched_game, depth)
+                if self.current_stats is not None:
+                    self.current_stats.depth = depth
 
-        except SearchTimeout:
-            pass  # Handle any actions required after timeout as needed
+            except SearchTimeout:
+                pass  # Handle any actions required after timeout as needed
+
+        if best_move == (-1, -1):
+            # the search did not complete, e.g. because the node budget ran
+            # out: any legal move beats a forfeit
+            legal_moves = game.get_legal_moves()
+            if legal_moves:
+                best_move = legal_moves[0]
 
         # Return the best move from the last completed search iteration
         return best_move
@@ -313,25 +378,131 @@ class MinimaxPlayer(IsolationPlayer):
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
 
-        game_copy = game.forecast_move(move)
-        current_depth += 1
-        next_legal_moves = game_copy.get_legal_moves(game_copy.active_player)
-        if next_legal_moves is None or len(next_legal_moves) == 0 or current_depth >= max_depth:
-            return self.score(game_copy, self)
+        # Search the move in place and restore the board on the way out (even
+        # on timeout) rather than searching a copy made by forecast_move
+        game.apply_move(move)
+        try:
+            current_depth += 1
+            next_legal_moves = game.get_legal_moves(game.active_player)
+            if next_legal_moves is None or len(next_legal_moves) == 0 or current_depth >= max_depth:
+                return self.score(game, self)
 
-        values_for_moves_array = []
-        for next_move in next_legal_moves:
-            values_for_moves_array.append(get_next_move_value_fn(game_copy, next_move, current_depth, max_depth))
+            values_for_moves_array = []
+            for next_move in next_legal_moves:
+                values_for_moves_array.append(get_next_move_value_fn(game, next_move, current_depth, max_depth))
 
-        return policy_fn(values_for_moves_array)
+            return policy_fn(values_for_moves_array)
+        finally:
+            game.undo_move()
 
 
 class AlphaBetaPlayer(IsolationPlayer):
     """Game-playing agent that chooses a move using iterative deepening minimax
     search with alpha-beta pruning. You must finish and test this player to
     make sure it returns a good move before the search time limit expires.
+
+    Parameters
+    ----------
+    tt_size_mb : float (optional)
+        Memory budget (in megabytes) of the transposition table shared by the
+        iterative deepening passes. A falsy value disables the table.
+
+    tt_replacement : str (optional)
+        Replacement scheme of the transposition table, either
+        `transposition.DEPTH_PREFERRED` or `transposition.ALWAYS_REPLACE`.
+
+    tt_keep_across_turns : bool (optional)
+        Keep the transposition table entries from one turn to the next turn
+        of the same game instead of clearing the table before each search.
+
+    batch_leaves : bool (optional)
+        Experimental: score all the children of the nodes just above the
+        search horizon at once with `batch_eval.score_children` (requires
+        numpy) instead of visiting and scoring the children one at a time.
+        The search finds the same values and moves either way (including
+        with `solve_endgames`), which makes the option a check of the
+        vectorized heuristics against the scalar ones; it is not an
+        optimisation, as the search is about twice as slow: NumPy's overhead
+        per call outweighs the scoring of at most eight children.
+
+    ponder : bool (optional)
+        After each move, keep searching in a helper process (see
+        parallel_search.py) the position reached if the opponent plays the
+        reply expected by the principal variation, until the next call to
+        get_move() (or stop_pondering()). The transposition table is then a
+        `transposition.SharedTranspositionTable` whose entries are kept for
+        the next turn, and on a ponder hit the move ordering state is kept
+        as well. The helper only runs when this process may use more than
+        one CPU, since it would otherwise take CPU time from the opponent
+        while the opponent's clock is running, so players in the workers of
+        a tournament process pool (each pinned to one CPU) never ponder.
+        Call close() to shut the helper down.
+
+    ponder_limit : float (optional)
+        Maximum time (in milliseconds) spent pondering after a move, so that
+        the helper stops on its own once the game is over.
+
+    solve_endgames : bool (optional)
+        Replace the search below positions in which the two players can no
+        longer reach a common cell by the exact result computed by
+        `endgame.solve`, which is kept in the transposition table. Positions
+        on the search horizon are scored by the heuristic as usual: solving
+        every leaf would cost more than the search it replaces.
+
+    opening_book : str or `opening_book.OpeningBook` (optional)
+        An opening book (or the path of a book file) whose moves are played
+        without searching in the positions it covers.
+
+    search_processes : int (optional)
+        Number of processes searching each move. With more than one, the
+        transposition table is a `transposition.SharedTranspositionTable` and
+        `search_processes - 1` helper processes (see parallel_search.py) are
+        started on the first move; call close() to shut them down.
     """
 
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=10.,
+                 tt_size_mb=16, tt_replacement=DEPTH_PREFERRED, tt_keep_across_turns=False,
+                 batch_leaves=False, collect_stats=False, budget=None, ponder=False,
+                 ponder_limit=1000., solve_endgames=True, search_processes=1,
+                 opening_book=None, eval_cache_size=0):
+        super().__init__(search_depth, score_fn, timeout, collect_stats, budget, eval_cache_size)
+        self.batch_leaves = batch_leaves
+        self.solve_endgames = solve_endgames
+        if isinstance(opening_book, str):
+            opening_book = OpeningBook(opening_book)
+        self.opening_book = opening_book
+        self.search_processes = search_processes
+        self._search_pool = None
+        self.tt_size_mb = tt_size_mb
+        self.tt_replacement = tt_replacement
+        if search_processes > 1 or ponder:
+            if not tt_size_mb:
+                raise ValueError("A parallel search or pondering requires a transposition table")
+            self.transposition_table = SharedTranspositionTable(tt_size_mb, tt_replacement)
+        else:
+            self.transposition_table = TranspositionTable(tt_size_mb, tt_replacement) if tt_size_mb else None
+        self.tt_keep_across_turns = tt_keep_across_turns
+        self._tt_game_id = None
+        self._tt_move_count = -1
+
+        self.ponder = ponder
+        self.ponder_limit = ponder_limit
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+        self._ponder_pool = None
+        self._ponder_key = None
+
+        # Move ordering state: the principal variation of the last completed
+        # iteration, the principal variation table of the running iteration,
+        # two killer moves per ply, and history scores for the moves of this
+        # player (index 0) and of the opponent (index 1)
+        self._prev_pv = ()
+        self._follow_pv = False
+        self._reached_horizon = False
+        self._pv_table = []
+        self._killers = []
+        self._history = ({}, {})
+
     def get_move(self, game, time_left):
         """Search for the best move from the available legal moves and return a
         result before the time limit expires.
@@ -362,25 +533,147 @@ class AlphaBetaPlayer(IsolationPlayer):
             Board coordinates corresponding to a legal move; may return
             (-1, -1) if there are no available legal moves.
         """
-        self.time_left = time_left
+        ponder_hit = self.stop_pondering(game)
+        if self._search_pool is not None:
+            # helpers too late for the last search may still be writing to
+            # the table, which is about to be cleared
+            self._search_pool.cancel()
+        if self.opening_book is not None:
+            move = self.opening_book.lookup(game)
+            if move is not None and move in game.get_legal_moves():
+                return move
 
+        self.time_left = self.budget.start(time_left)
+        self.__prepare_transposition_table(game)
+        if not ponder_hit:
+            self._prev_pv = ()
+            self._killers = []
+            self._history = ({}, {})
+
+        pool = self.__get_search_pool()
+        with recording(self, game) as searched_game:
+            if pool is not None:
+                remaining = self.budget.peek()
+                deadline = timer() + remaining / 1000 if remaining != float("inf") else None
+                pool.start(game, self.budget.depth, deadline)
+            best_move, depth = self.iterative_deepening(searched_game, self.budget.depth)
+            if pool is not None:
+                for helper_depth, helper_move in pool.stop(self.budget.peek, self.TIMER_THRESHOLD):
+                    if helper_depth > depth:
+                        best_move, depth = helper_move, helper_depth
+
+        if best_move == (-1, -1):
+            # no iteration completed, e.g. because the endgame solver used up
+            # the time of the first one: any legal move beats a forfeit
+            legal_moves = game.get_legal_moves()
+            if legal_moves:
+                best_move = legal_moves[0]
+
+        if self.ponder:
+            self.__start_pondering(game, best_move)
+
+        # Return the best move from the last completed search iteration
+        return best_move
+
+    def iterative_deepening(self, game, max_depth=None, first_depth=0):
+        """Search increasingly deep, starting at `first_depth`, until the time
+        runs out, the whole game tree was searched or `max_depth` (None for no
+        limit) was reached.
+
+        Returns
+        -------
+        ((int, int), int)
+            The best move of the last completed iteration and its depth
+            ((-1, -1) and -1 if no iteration completed).
+        """
         # Initialize the best move so that this function returns something
         # in case the search fails due to timeout
         best_move = (-1, -1)
+        completed_depth = -1
 
         try:
             # The try/except block will automatically catch the exception
             # raised when the timer is about to expire.
-            depth = 0
+            depth = first_depth
             while 1:
                 best_move = self.alphabeta(game, depth)
+                completed_depth = depth
+                if self.current_stats is not None:
+                    self.current_stats.depth = max(depth, 1)
+                if not self._reached_horizon:
+                    break  # the whole game tree was searched
+                if max_depth is not None and depth >= max_depth:
+                    break
                 depth += 1
 
         except SearchTimeout:
             pass  # Handle any actions required after timeout as needed
 
-        # Return the best move from the last completed search iteration
-        return best_move
+        return best_move, completed_depth
+
+    def __get_search_pool(self):
+        """Return the helper processes of a parallel search, starting them on
+        the first call, or None for a single-process search.
+        """
+        if self.search_processes > 1 and self._search_pool is None:
+            self._search_pool = SearchPool(self.search_processes - 1, self.transposition_table,
+                                           self.__helper_kwargs())
+        return self._search_pool
+
+    def __helper_kwargs(self):
+        """Return the AlphaBetaPlayer arguments of the helper processes."""
+        return {"score_fn": getattr(self.score, "score_fn", self.score),
+                "eval_cache_size": self.eval_cache_size, "timeout": self.TIMER_THRESHOLD,
+                "batch_leaves": self.batch_leaves, "solve_endgames": self.solve_endgames}
+
+    def close(self):
+        """Stop pondering and shut down the helper processes, if any."""
+        self.stop_pondering()
+        for pool in (self._search_pool, self._ponder_pool):
+            if pool is not None:
+                pool.close()
+        self._search_pool = None
+        self._ponder_pool = None
+
+    def stop_pondering(self, game=None):
+        """Stop the background search started after the last move, if any,
+        and return True if `game` is the position that was pondered.
+        """
+        if self._ponder_pool is not None:
+            self._ponder_pool.cancel()
+        if self._ponder_key is None or game is None:
+            return False
+        hit = game.hash() == self._ponder_key
+        self._ponder_key = None
+        if hit:
+            self.ponder_hits += 1
+        else:
+            self.ponder_misses += 1
+        return hit
+
+    def __start_pondering(self, game, best_move):
+        """Search the position expected after `best_move` and the reply
+        predicted by the principal variation in the ponder helper process.
+        """
+        if available_cpus() < 2:
+            return
+        pv = self._prev_pv
+        if len(pv) < 2 or pv[0] != best_move:
+            return
+        expected = game.copy()
+        expected.apply_move(pv[0])
+        expected.apply_move(pv[1])
+        if not expected.get_legal_moves():
+            return
+        self._ponder_key = expected.hash()
+
+        self.transposition_table.new_search()
+        # the expected position is two plies below the root of the last search
+        self._prev_pv = pv[2:]
+        self._killers = self._killers[2:]
+        if self._ponder_pool is None:
+            self._ponder_pool = SearchPool(1, self.transposition_table, self.__helper_kwargs())
+        self._ponder_pool.start(expected, None, timer() + self.ponder_limit / 1000.)
 
     def alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf")):
         """Implement depth-limited minimax search with alpha-beta pruning as
@@ -430,7 +723,14 @@ class AlphaBetaPlayer(IsolationPlayer):
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
 
+        self._reached_horizon = False
+        self._follow_pv = True
+        self._pv_table = [()] * (depth + 2)
+        while len(self._killers) < depth + 2:
+            self._killers.append([None, None])
+
         max_value_move = self.__get_max_value_move(game, depth, alpha, beta)
+        self._prev_pv = self._pv_table[0]
         return max_value_move
 
     def __get_max_value_move(self, game, max_depth, alpha, beta):
@@ -438,58 +738,256 @@ class AlphaBetaPlayer(IsolationPlayer):
         if legal_moves is None or len(legal_moves) == 0:
             return -1, -1
 
+        tt = self.transposition_table
+        tt_move = None
+        if tt is not None:
+            entry = tt.probe(game.zobrist_key)
+            if entry is not None:
+                tt_move = entry.move
+        self.__order_moves(legal_moves, 0, 0, tt_move)
+
         move_value_dict = {}
         current_depth = 0
+        alpha_orig = alpha
         max_value = float("-inf")
-        for move in legal_moves:
-            value = self.__min_value_for_move(game, move, current_depth, max_depth, alpha, beta)
+        leaf_values = self.__leaf_values(game, legal_moves, current_depth, max_depth)
+        for idx, move in enumerate(legal_moves):
+            if leaf_values is None:
+                value = self.__min_value_for_move(game, move, current_depth, max_depth, alpha, beta)
+            else:
+                value = leaf_values[idx]
+            self._follow_pv = False
+            if alpha < value < beta and value > max_value:
+                self._pv_table[0] = (move,) + self._pv_table[1]
             max_value = max(max_value, value)
             move_value_dict[move] = value
             if max_value >= beta:
-                return move
+                self.__record_cutoff(move, 0, 0, max_depth)
+                break
             alpha = max(alpha, max_value)
 
-        return max(move_value_dict, key=move_value_dict.get)
+        best_move = max(move_value_dict, key=move_value_dict.get)
+        if tt is not None:
+            self.__store(game, max_depth, max_value, alpha_orig, beta, best_move)
+        return best_move
+
+    def __check_time(self):
+        """Raise a SearchTimeout if the time left is below the threshold."""
+        if self.time_left() < self.TIMER_THRESHOLD:
+            raise SearchTimeout()
 
     def __min_value_for_move(self, game, move, current_depth, max_depth, alpha, beta):
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
 
-        game_copy = game.forecast_move(move)
-        current_depth += 1
-        next_legal_moves = game_copy.get_legal_moves(game_copy.active_player)
-        if next_legal_moves is None or len(next_legal_moves) == 0 or current_depth >= max_depth:
-            return self.score(game_copy, self)
-
-        min_value = float("inf")
-        for next_move in next_legal_moves:
-            min_value = min(min_value, self.__max_value_for_move(game_copy, next_move, current_depth,
-                                                                 max_depth, alpha, beta))
-            if min_value <= alpha:
-                return min_value
-            beta = min(min_value, beta)
-            if alpha >= beta:
-                return beta
-
-        return min_value
+        game.apply_move(move)
+        try:
+            current_depth += 1
+            self._pv_table[current_depth] = ()
+            next_legal_moves = game.get_legal_moves(game.active_player)
+            if next_legal_moves is None or len(next_legal_moves) == 0 or current_depth >= max_depth:
+                if next_legal_moves:
+                    self._reached_horizon = True
+                return self.score(game, self)
+
+            tt = self.transposition_table
+            depth = max_depth - current_depth
+            tt_move = None
+            if tt is not None:
+                value, tt_move = self.__probe(game, depth, alpha, beta)
+                if value is not None:
+                    return value
+            if self.solve_endgames:
+                value = solve(game, self, check=self.__check_time)
+                if value is not None:
+                    if tt is not None:
+                        tt.store(game.zobrist_key, SOLVED_DEPTH, value, EXACT, None)
+                    return value
+            self.__order_moves(next_legal_moves, current_depth, 1, tt_move)
+
+            beta_orig = beta
+            min_value = float("inf")
+            best_move = None
+            leaf_values = self.__leaf_values(game, next_legal_moves, current_depth, max_depth)
+            for idx, next_move in enumerate(next_legal_moves):
+                if leaf_values is None:
+                    value = self.__max_value_for_move(game, next_move, current_depth, max_depth, alpha, beta)
+                else:
+                    value = leaf_values[idx]
+                self._follow_pv = False
+                if best_move is None or value < min_value:
+                    min_value, best_move = value, next_move
+                    if alpha < value < beta:
+                        self._pv_table[current_depth] = (next_move,) + self._pv_table[current_depth + 1]
+                if min_value <= alpha:
+                    self.__record_cutoff(next_move, current_depth, 1, depth)
+                    break
+                beta = min(min_value, beta)
+
+            if tt is not None:
+                self.__store(game, depth, min_value, alpha, beta_orig, best_move)
+            return min_value
+        finally:
+            game.undo_move()
 
     def __max_value_for_move(self, game, move, current_depth, max_depth, alpha, beta):
 
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
 
-        game_copy = game.forecast_move(move)
-        current_depth += 1
-        next_legal_moves = game_copy.get_legal_moves(game_copy.active_player)
-        if next_legal_moves is None or len(next_legal_moves) == 0 or current_depth >= max_depth:
-            return self.score(game_copy, self)
-
-        max_value = float("-inf")
-        for next_move in next_legal_moves:
-            max_value = max(max_value, self.__min_value_for_move(game_copy, next_move, current_depth, max_depth,
-                                                                 alpha, beta))
-            if max_value >= beta:
-                return max_value
-            alpha = max(alpha, max_value)
-
-        return max_value
+        game.apply_move(move)
+        try:
+            current_depth += 1
+            self._pv_table[current_depth] = ()
+            next_legal_moves = game.get_legal_moves(game.active_player)
+            if next_legal_moves is None or len(next_legal_moves) == 0 or current_depth >= max_depth:
+                if next_legal_moves:
+                    self._reached_horizon = True
+                return self.score(game, self)
+
+            tt = self.transposition_table
+            depth = max_depth - current_depth
+            tt_move = None
+            if tt is not None:
+                value, tt_move = self.__probe(game, depth, alpha, beta)
+                if value is not None:
+                    return value
+            if self.solve_endgames:
+                value = solve(game, self, check=self.__check_time)
+                if value is not None:
+                    if tt is not None:
+                        tt.store(game.zobrist_key, SOLVED_DEPTH, value, EXACT, None)
+                    return value
+            self.__order_moves(next_legal_moves, current_depth, 0, tt_move)
+
+            alpha_orig = alpha
+            max_value = float("-inf")
+            best_move = None
+            leaf_values = self.__leaf_values(game, next_legal_moves, current_depth, max_depth)
+            for idx, next_move in enumerate(next_legal_moves):
+                if leaf_values is None:
+                    value = self.__min_value_for_move(game, next_move, current_depth, max_depth, alpha, beta)
+                else:
+                    value = leaf_values[idx]
+                self._follow_pv = False
+                if best_move is None or value > max_value:
+                    max_value, best_move = value, next_move
+                    if alpha < value < beta:
+                        self._pv_table[current_depth] = (next_move,) + self._pv_table[current_depth + 1]
+                if max_value >= beta:
+                    self.__record_cutoff(next_move, current_depth, 0, depth)
+                    break
+                alpha = max(alpha, max_value)
+
+            if tt is not None:
+                self.__store(game, depth, max_value, alpha_orig, beta, best_move)
+            return max_value
+        finally:
+            game.undo_move()
+
+    def __leaf_values(self, game, moves, current_depth, max_depth):
+        """Return the scores of all the children of a node whose children lie
+        on the search horizon when batch scoring is enabled, otherwise None.
+        """
+        if not self.batch_leaves or current_depth + 1 < max_depth:
+            return None
+        if self.time_left() < self.TIMER_THRESHOLD:
+            raise SearchTimeout()
+        self._pv_table[current_depth + 1] = ()
+        self._reached_horizon = True
+        return score_children(self.score, game, moves, self)
+
+    def __order_moves(self, moves, ply, side, tt_move):
+        """Sort the moves of a node in place so that the most promising moves
+        are searched first: the move of the previous iteration's principal
+        variation, then the transposition table move, then the killer moves of
+        the ply, then the rest by history score.
+        """
+        pv_move = None
+        if self._follow_pv:
+            if ply < len(self._prev_pv) and self._prev_pv[ply] in moves:
+                pv_move = self._prev_pv[ply]
+            else:
+                self._follow_pv = False
+        killer_1, killer_2 = self._killers[ply]
+        history = self._history[side]
+
+        def priority(move):
+            if move == pv_move:
+                return 1 << 40
+            if move == tt_move:
+                return 1 << 39
+            if move == killer_1:
+                return 1 << 38
+            if move == killer_2:
+                return 1 << 37
+            return history.get(move, 0)
+
+        moves.sort(key=priority, reverse=True)
+
+    def __record_cutoff(self, move, ply, side, depth):
+        """Update the killer moves and history scores with a move that caused
+        a cutoff `depth` plies above the search horizon.
+        """
+        if self.current_stats is not None:
+            self.current_stats.cutoffs += 1
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self._history[side]
+        history[move] = history.get(move, 0) + depth * depth
+
+    def __probe(self, game, depth, alpha, beta):
+        """Look up the current position in the transposition table. Return a
+        pair (value, move), where value is the stored value if it was searched
+        at least `depth` plies deep and decides the node for the (alpha, beta)
+        window (None otherwise), and move is the stored best move (or None).
+        """
+        tt = self.transposition_table
+        entry = tt.probe(game.zobrist_key)
+        if entry is None:
+            return None, None
+        if entry.depth >= depth:
+            if (entry.bound == EXACT or
+                    entry.bound == LOWER and entry.value >= beta or
+                    entry.bound == UPPER and entry.value <= alpha):
+                tt.cutoffs += 1
+                if self.current_stats is not None:
+                    self.current_stats.cutoffs += 1
+                if abs(entry.value) != float("inf"):
+                    self._reached_horizon = True
+                return entry.value, entry.move
+        return None, entry.move
+
+    def __store(self, game, depth, value, alpha, beta, best_move):
+        """Store the value of the current position, searched `depth` plies deep
+        with the (alpha, beta) window, in the transposition table.
+        """
+        if value <= alpha:
+            bound = UPPER
+        elif value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.transposition_table.store(game.zobrist_key, depth, value, bound, best_move)
+
+    def __prepare_transposition_table(self, game):
+        """Clear the transposition table before a new search, unless entries
+        are kept across turns and the game is the one searched last turn.
+        """
+        tt = self.transposition_table
+        if tt is None:
+            return
+        # The stored values are from this player's point of view, so they are
+        # only valid while the player keeps the same seat on the same board
+        seat = (game.active_player == self) == (game.move_count % 2 == 0)
+        game_id = (seat, game.width, game.height)
+        keep = self.tt_keep_across_turns or self.ponder
+        if (not keep or game_id != self._tt_game_id or
+                game.move_count <= self._tt_move_count):
+            tt.clear()
+        else:
+            tt.new_search()
+        self._tt_game_id = game_id
+        self._tt_move_count = game.move_count
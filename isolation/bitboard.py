@@ -0,0 +1,271 @@
+"""
+This file contains the `BitBoard` class, a drop-in replacement for
+`isolation.Board` which stores the occupied cells and the player locations as
+integer bitmasks rather than as a list of cell values.
+
+Cells are indexed exactly as in `isolation.Board` (`row + column * height`),
+so bit `i` of the occupancy mask corresponds to `Board._board_state[i]`.
+"""
+import random
+
+from .isolation import Board, knight_tables, zobrist_keys
+
+
+class BitBoard(Board):
+    """Implement a model for the game Isolation assuming each player moves like
+    a knight in chess, using integer bitmasks for the board state.
+
+    The public API is identical to `isolation.Board`, so any agent or script
+    written against `Board` can use a `BitBoard` instead.
+
+    Parameters
+    ----------
+    player_1 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    player_2 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    width : int (optional)
+        The number of columns that the board should have.
+
+    height : int (optional)
+        The number of rows that the board should have.
+
+    rng : random.Random (optional)
+        The random number generator used to shuffle the legal moves. Copies
+        of the board share the generator. Defaults to the `random` module.
+
+    shuffle_moves : bool (optional)
+        Shuffle the lists of legal moves (default). If False, legal moves are
+        listed in a fixed order, which makes searches reproducible and skips
+        the cost of shuffling.
+    """
+
+    _TABLE_ATTRIBUTES = ("_move_masks", "_knight_moves", "_zobrist")
+
+    def __init__(self, player_1, player_2, width=7, height=7, rng=None, shuffle_moves=True):
+        self.width = width
+        self.height = height
+        self.rng = random if rng is None else rng
+        self.shuffle_moves = shuffle_moves
+        self.move_count = 0
+        self._player_1 = player_1
+        self._player_2 = player_2
+        self._active_player = player_1
+        self._inactive_player = player_2
+
+        # Bit i is set when cell i is blocked; the player locations are cell
+        # indices (player 1 first), or NOT_MOVED before the first move
+        self._occupied = 0
+        self._locations = [Board.NOT_MOVED, Board.NOT_MOVED]
+        self._full_mask = (1 << (width * height)) - 1
+        self._move_masks = knight_tables(width, height).masks
+        self._knight_moves = knight_tables(width, height).moves
+        self._undo_stack = []
+        self._zobrist = zobrist_keys(width, height)
+        self._zobrist_key = 0
+
+    def _load_tables(self):
+        self._move_masks = knight_tables(self.width, self.height).masks
+        self._knight_moves = knight_tables(self.width, self.height).moves
+        self._zobrist = zobrist_keys(self.width, self.height)
+
+    def copy(self):
+        """ Return a deep copy of the current board. """
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.width = self.width
+        new_board.height = self.height
+        new_board.rng = self.rng
+        new_board.shuffle_moves = self.shuffle_moves
+        new_board.move_count = self.move_count
+        new_board._player_1 = self._player_1
+        new_board._player_2 = self._player_2
+        new_board._active_player = self._active_player
+        new_board._inactive_player = self._inactive_player
+        new_board._occupied = self._occupied
+        new_board._locations = list(self._locations)
+        new_board._full_mask = self._full_mask
+        new_board._move_masks = self._move_masks
+        new_board._knight_moves = self._knight_moves
+        new_board._undo_stack = []
+        new_board._zobrist = self._zobrist
+        new_board._zobrist_key = self._zobrist_key
+        return new_board
+
+    def move_is_legal(self, move):
+        """Test whether a move is legal in the current game state.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+
+        Returns
+        -------
+        bool
+            Returns True if the move is legal, False otherwise
+        """
+        return (0 <= move[0] < self.height and 0 <= move[1] < self.width and
+                not self._occupied >> (move[0] + move[1] * self.height) & 1)
+
+    def get_blank_spaces(self):
+        """Return a list of the locations that are still available on the board.
+        """
+        return self.__cells(~self._occupied & self._full_mask)
+
+    def get_player_location(self, player):
+        """Find the current location of the specified player on the board.
+
+        Parameters
+        ----------
+        player : object
+            An object registered as a player in the current game.
+
+        Returns
+        -------
+        (int, int) or None
+            The coordinate pair (row, column) of the input player, or None
+            if the player has not moved.
+        """
+        if player == self._player_1:
+            idx = self._locations[0]
+        elif player == self._player_2:
+            idx = self._locations[1]
+        else:
+            raise RuntimeError(
+                "Invalid player in get_player_location: {}".format(player))
+        if idx == Board.NOT_MOVED:
+            return Board.NOT_MOVED
+        return (idx % self.height, idx // self.height)
+
+    def get_legal_moves(self, player=None):
+        """Return the list of all legal moves for the specified player.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the legal moves for the active player on the board.
+
+        Returns
+        -------
+        list<(int, int)>
+            The list of coordinate pairs (row, column) of all legal moves
+            for the player constrained by the current game state.
+        """
+        if player is None:
+            player = self.active_player
+        mask = self.__move_mask(player)
+        loc = self._locations[int(player == self._player_2)]
+        if loc == Board.NOT_MOVED:
+            return self.__cells(mask)  # every blank cell, unshuffled as in Board
+
+        # moves are listed in the order of Board's knight move table, so that
+        # a generator shared with a Board shuffles them the same way
+        valid_moves = [move for idx, move in self._knight_moves[loc] if mask >> idx & 1]
+        if self.shuffle_moves:
+            self.rng.shuffle(valid_moves)
+        return valid_moves
+
+    def apply_move(self, move):
+        """Move the active player to a specified location.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        idx = move[0] + move[1] * self.height
+        side = int(self._active_player == self._player_2)
+        prev_idx = self._locations[side]
+        player_keys = self._zobrist.players[side]
+        self._zobrist_key ^= self._zobrist.cells[idx] ^ player_keys[idx] ^ self._zobrist.side
+        if prev_idx != Board.NOT_MOVED:
+            self._zobrist_key ^= player_keys[prev_idx]
+        self._undo_stack.append(prev_idx)
+        self._locations[side] = idx
+        self._occupied |= 1 << idx
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count += 1
+
+    def undo_move(self):
+        """Reverse the most recent call to apply_move() in place, restoring
+        the previous location of the player who moved and the initiative.
+
+        Only moves applied to this board object can be undone; copies of the
+        board (including those returned by forecast_move) start with no moves
+        to undo. Raises a RuntimeError if there is no move to undo.
+        """
+        if not self._undo_stack:
+            raise RuntimeError("There is no move to undo on this board.")
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        side = int(self._active_player == self._player_2)
+        idx = self._locations[side]
+        prev_idx = self._undo_stack.pop()
+        player_keys = self._zobrist.players[side]
+        self._zobrist_key ^= self._zobrist.cells[idx] ^ player_keys[idx] ^ self._zobrist.side
+        if prev_idx != Board.NOT_MOVED:
+            self._zobrist_key ^= player_keys[prev_idx]
+        self._occupied ^= 1 << idx
+        self._locations[side] = prev_idx
+        self.move_count -= 1
+
+    def to_string(self, symbols=['1', '2']):
+        """Generate a string representation of the current game state, marking
+        the location of each player and indicating which cells have been
+        blocked, and which remain open.
+        """
+        p1_loc, p2_loc = self._locations
+
+        col_margin = len(str(self.height - 1)) + 1
+        prefix = "{:<" + "{}".format(col_margin) + "}"
+        offset = " " * (col_margin + 3)
+        out = offset + '   '.join(map(str, range(self.width))) + '\n\r'
+        for i in range(self.height):
+            out += prefix.format(i) + ' | '
+            for j in range(self.width):
+                idx = i + j * self.height
+                if not self._occupied >> idx & 1:
+                    out += ' '
+                elif p1_loc == idx:
+                    out += symbols[0]
+                elif p2_loc == idx:
+                    out += symbols[1]
+                else:
+                    out += '-'
+                out += ' | '
+            out += '\n\r'
+
+        return out
+
+    def __move_mask(self, player):
+        """Return a bitmask of the cells the specified player can move to."""
+        if player == self._player_1:
+            loc = self._locations[0]
+        elif player == self._player_2:
+            loc = self._locations[1]
+        else:
+            raise RuntimeError(
+                "Invalid player in get_legal_moves: {}".format(player))
+        free = ~self._occupied & self._full_mask
+        if loc == Board.NOT_MOVED:
+            return free
+
+        return self._move_masks[loc] & free
+
+    def __cells(self, mask):
+        """Convert a bitmask into a list of (row, column) coordinate pairs in
+        increasing cell index order.
+        """
+        cells = []
+        while mask:
+            low = mask & -mask
+            idx = low.bit_length() - 1
+            cells.append((idx % self.height, idx // self.height))
+            mask ^= low
+        return cells
@@ -0,0 +1,170 @@
+"""
+This file contains the `CompactBoard` class, a drop-in replacement for
+`isolation.Board` with a smaller memory footprint, for searches that keep many
+boards alive at once.
+
+A `CompactBoard` has no instance dictionary (all of its attributes are
+`__slots__`), and its state is a single `array('h')` of machine integers with
+the same layout as `Board._board_state`: one entry per cell (`row + column *
+height`, 0 when blank and 1 when blocked), followed by the initiative and the
+cell indices of player 2 and player 1. A player who has not moved yet is
+stored as NO_LOCATION rather than None, so copying a board duplicates one
+buffer.
+"""
+import random
+
+from array import array
+
+from .isolation import Board, knight_tables, zobrist_keys
+
+# Location of a player who has not moved yet in the state array
+NO_LOCATION = -1
+
+
+class CompactBoard(Board):
+    """Implement a model for the game Isolation assuming each player moves like
+    a knight in chess, storing the board state in a compact array.
+
+    The public API is identical to `isolation.Board`; in particular
+    get_player_location() returns None before the player's first move.
+
+    Parameters
+    ----------
+    player_1 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    player_2 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    width : int (optional)
+        The number of columns that the board should have.
+
+    height : int (optional)
+        The number of rows that the board should have.
+
+    rng : random.Random (optional)
+        The random number generator used to shuffle the legal moves. Copies
+        of the board share the generator. Defaults to the `random` module.
+
+    shuffle_moves : bool (optional)
+        Shuffle the lists of legal moves (default). If False, legal moves are
+        listed in a fixed order, which makes searches reproducible and skips
+        the cost of shuffling.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, player_1, player_2, width=7, height=7, rng=None, shuffle_moves=True):
+        self.width = width
+        self.height = height
+        self.rng = random if rng is None else rng
+        self.shuffle_moves = shuffle_moves
+        self.move_count = 0
+        self._player_1 = player_1
+        self._player_2 = player_2
+        self._active_player = player_1
+        self._inactive_player = player_2
+
+        # Same layout as Board._board_state, with NO_LOCATION for a player
+        # who has not moved
+        self._board_state = array("h", [Board.BLANK] * (width * height + 3))
+        self._board_state[-1] = NO_LOCATION
+        self._board_state[-2] = NO_LOCATION
+        self._knight_moves = knight_tables(width, height).moves
+        self._undo_stack = []
+        self._zobrist = zobrist_keys(width, height)
+        self._zobrist_key = 0
+
+    def copy(self):
+        """ Return a deep copy of the current board. """
+        new_board = CompactBoard.__new__(CompactBoard)
+        new_board.width = self.width
+        new_board.height = self.height
+        new_board.rng = self.rng
+        new_board.shuffle_moves = self.shuffle_moves
+        new_board.move_count = self.move_count
+        new_board._player_1 = self._player_1
+        new_board._player_2 = self._player_2
+        new_board._active_player = self._active_player
+        new_board._inactive_player = self._inactive_player
+        new_board._board_state = self._board_state[:]
+        new_board._knight_moves = self._knight_moves
+        new_board._undo_stack = []
+        new_board._zobrist = self._zobrist
+        new_board._zobrist_key = self._zobrist_key
+        return new_board
+
+    def get_player_location(self, player):
+        """Find the current location of the specified player on the board.
+
+        Parameters
+        ----------
+        player : object
+            An object registered as a player in the current game.
+
+        Returns
+        -------
+        (int, int) or None
+            The coordinate pair (row, column) of the input player, or None
+            if the player has not moved.
+        """
+        if player == self._player_1:
+            idx = self._board_state[-1]
+        elif player == self._player_2:
+            idx = self._board_state[-2]
+        else:
+            raise RuntimeError(
+                "Invalid player in get_player_location: {}".format(player))
+        if idx == NO_LOCATION:
+            return Board.NOT_MOVED
+        return (idx % self.height, idx // self.height)
+
+    def apply_move(self, move):
+        """Move the active player to a specified location.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        idx = move[0] + move[1] * self.height
+        side = int(self._active_player == self._player_2)
+        board_state = self._board_state
+        prev_idx = board_state[-1 - side]
+        player_keys = self._zobrist.players[side]
+        self._zobrist_key ^= self._zobrist.cells[idx] ^ player_keys[idx] ^ self._zobrist.side
+        if prev_idx != NO_LOCATION:
+            self._zobrist_key ^= player_keys[prev_idx]
+        self._undo_stack.append(prev_idx)
+        board_state[-1 - side] = idx
+        board_state[idx] = 1
+        board_state[-3] ^= 1
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count += 1
+
+    def undo_move(self):
+        """Reverse the most recent call to apply_move() in place, restoring
+        the previous location of the player who moved and the initiative.
+
+        Only moves applied to this board object can be undone; copies of the
+        board (including those returned by forecast_move) start with no moves
+        to undo. Raises a RuntimeError if there is no move to undo.
+        """
+        if not self._undo_stack:
+            raise RuntimeError("There is no move to undo on this board.")
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        side = int(self._active_player == self._player_2)
+        board_state = self._board_state
+        idx = board_state[-1 - side]
+        prev_idx = self._undo_stack.pop()
+        player_keys = self._zobrist.players[side]
+        self._zobrist_key ^= self._zobrist.cells[idx] ^ player_keys[idx] ^ self._zobrist.side
+        if prev_idx != NO_LOCATION:
+            self._zobrist_key ^= player_keys[prev_idx]
+        board_state[idx] = Board.BLANK
+        board_state[-1 - side] = prev_idx
+        board_state[-3] ^= 1
+        self.move_count -= 1
@@ -9,10 +9,159 @@ be available to project reviewers.
 """
 import random
 import timeit
+from collections import namedtuple
 from copy import copy
 
 TIME_LIMIT_MILLIS = 150
 
+KNIGHT_DIRECTIONS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                     (1, -2), (1, 2), (2, -1), (2, 1)]
+
+KnightTables = namedtuple("KnightTables", ["moves", "masks"])
+
+_knight_tables = {}
+
+
+def knight_tables(width, height):
+    """Return the knight move tables for a board geometry, building them the
+    first time the geometry is requested. The tables are shared by every board
+    with the same width and height and must not be modified.
+
+    Parameters
+    ----------
+    width : int
+        The number of columns on the board.
+
+    height : int
+        The number of rows on the board.
+
+    Returns
+    -------
+    KnightTables
+        `moves[idx]` is a tuple of (index, (row, column)) pairs for every cell
+        a knight can reach from cell `idx`, and `masks[idx]` is the same set
+        of destinations as a bitmask. Cells are indexed as
+        `row + column * height`.
+    """
+    tables = _knight_tables.get((width, height))
+    if tables is None:
+        moves = []
+        masks = []
+        for idx in range(width * height):
+            r, c = idx % height, idx // height
+            destinations = tuple(((r + dr) + (c + dc) * height, (r + dr, c + dc))
+                                 for dr, dc in KNIGHT_DIRECTIONS
+                                 if 0 <= r + dr < height and 0 <= c + dc < width)
+            moves.append(destinations)
+            masks.append(sum(1 << dest for dest, _ in destinations))
+        tables = KnightTables(tuple(moves), tuple(masks))
+        _knight_tables[(width, height)] = tables
+    return tables
+
+
+ZobristKeys = namedtuple("ZobristKeys", ["cells", "players", "side"])
+
+ZOBRIST_SEED = 0x15014710
+
+_zobrist_keys = {}
+
+
+def zobrist_keys(width, height):
+    """Return the random 64-bit Zobrist keys for a board geometry, building
+    them the first time the geometry is requested. The keys are drawn from a
+    fixed seed, so the same position has the same key in every process.
+
+    Parameters
+    ----------
+    width : int
+        The number of columns on the board.
+
+    height : int
+        The number of rows on the board.
+
+    Returns
+    -------
+    ZobristKeys
+        `cells[idx]` is the key of blocked cell `idx`, `players[0][idx]` and
+        `players[1][idx]` are the keys of player 1 and player 2 standing on
+        cell `idx`, and `side` is the key added while player 2 has the
+        initiative.
+    """
+    keys = _zobrist_keys.get((width, height))
+    if keys is None:
+        rng = random.Random(ZOBRIST_SEED ^ (width << 16) ^ height)
+        size = width * height
+        keys = ZobristKeys(tuple(rng.getrandbits(64) for _ in range(size)),
+                           (tuple(rng.getrandbits(64) for _ in range(size)),
+                            tuple(rng.getrandbits(64) for _ in range(size))),
+                           rng.getrandbits(64))
+        _zobrist_keys[(width, height)] = keys
+    return keys
+
+
+class Symmetry(namedtuple("Symmetry", ["cells", "inverse", "height"])):
+    """A rotation or reflection of the board: `cells[idx]` is the index of
+    the image of cell `idx` and `inverse[idx]` the index of the cell whose
+    image is cell `idx`.
+    """
+    __slots__ = ()
+
+    def map_move(self, move):
+        """Return the image of a (row, column) location."""
+        idx = self.cells[move[0] + move[1] * self.height]
+        return idx % self.height, idx // self.height
+
+    def unmap_move(self, move):
+        """Return the location whose image is a (row, column) location."""
+        idx = self.inverse[move[0] + move[1] * self.height]
+        return idx % self.height, idx // self.height
+
+
+_symmetries = {}
+
+
+def symmetries(width, height):
+    """Return the symmetries of a board geometry, starting with the identity:
+    the 8 rotations and reflections of a square board, or the 4 reflections
+    of other boards.
+
+    Parameters
+    ----------
+    width : int
+        The number of columns on the board.
+
+    height : int
+        The number of rows on the board.
+
+    Returns
+    -------
+    list<Symmetry>
+    """
+    result = _symmetries.get((width, height))
+    if result is None:
+        transforms = [lambda r, c: (r, c),
+                      lambda r, c: (height - 1 - r, c),
+                      lambda r, c: (r, width - 1 - c),
+                      lambda r, c: (height - 1 - r, width - 1 - c)]
+        if width == height:
+            transforms += [lambda r, c: (c, r),
+                           lambda r, c: (width - 1 - c, r),
+                           lambda r, c: (c, height - 1 - r),
+                           lambda r, c: (width - 1 - c, height - 1 - r)]
+        result = []
+        for transform in transforms:
+            cells = [0] * (width * height)
+            for c in range(width):
+                for r in range(height):
+                    image_r, image_c = transform(r, c)
+                    cells[r + c * height] = image_r + image_c * height
+            inverse = [0] * len(cells)
+            for idx, image in enumerate(cells):
+                inverse[image] = idx
+            result.append(Symmetry(tuple(cells), tuple(inverse), height))
+        _symmetries[(width, height)] = result
+    return result
+
 
 class Board(object):
     """Implement a model for the game Isolation assuming each player moves like
@@ -33,13 +182,38 @@ class Board(object):
 
     height : int (optional)
         The number of rows that the board should have.
+
+    rng : random.Random (optional)
+        The random number generator used to shuffle the legal moves. Copies
+        of the board share the generator. Defaults to the `random` module.
+
+    shuffle_moves : bool (optional)
+        Shuffle the lists of legal moves (default). If False, legal moves are
+        listed in a fixed order, which makes searches reproducible and skips
+        the cost of shuffling.
     """
     BLANK = 0
     NOT_MOVED = None
 
-    def __init__(self, player_1, player_2, width=7, height=7):
+    # The attributes of a board are slots, so that subclasses which declare
+    # their own __slots__ (such as CompactBoard) have no instance dictionary
+    __slots__ = ("width", "height", "rng", "shuffle_moves", "move_count",
+                 "_player_1", "_player_2", "_active_player", "_inactive_player",
+                 "_board_state", "_knight_moves", "_undo_stack", "_zobrist", "_zobrist_key")
+
+    # Stand-ins for the player objects in pickled boards
+    PLAYER_1 = 1
+    PLAYER_2 = 2
+
+    # Attributes shared by every board of the same geometry, which are left
+    # out of pickled boards and looked up again when they are unpickled
+    _TABLE_ATTRIBUTES = ("_knight_moves", "_zobrist")
+
+    def __init__(self, player_1, player_2, width=7, height=7, rng=None, shuffle_moves=True):
         self.width = width
         self.height = height
+        self.rng = random if rng is None else rng
+        self.shuffle_moves = shuffle_moves
         self.move_count = 0
         self._player_1 = player_1
         self._player_2 = player_2
@@ -51,9 +225,140 @@ class Board(object):
         self._board_state = [Board.BLANK] * (width * height + 3)
         self._board_state[-1] = Board.NOT_MOVED
         self._board_state[-2] = Board.NOT_MOVED
+        self._knight_moves = knight_tables(width, height).moves
+
+        # Previous location of the moving player for every move applied to
+        # this board object, used to reverse moves with undo_move()
+        self._undo_stack = []
+
+        # 64-bit Zobrist key of the position, updated incrementally by
+        # apply_move() and undo_move()
+        self._zobrist = zobrist_keys(width, height)
+        self._zobrist_key = 0
+
+    def _load_tables(self):
+        self._knight_moves = knight_tables(self.width, self.height).moves
+        self._zobrist = zobrist_keys(self.width, self.height)
+
+    def __getstate__(self):
+        """Return the state of the board for pickling. The player objects are
+        replaced by Board.PLAYER_1 and Board.PLAYER_2 so that the payload
+        only holds the game state; use set_players() to attach players to an
+        unpickled board.
+        """
+        state = {name: getattr(self, name) for cls in type(self).__mro__
+                 for name in getattr(cls, "__slots__", ()) if hasattr(self, name)}
+        state.update(getattr(self, "__dict__", {}))
+        for name in self._TABLE_ATTRIBUTES:
+            state.pop(name, None)
+        if self._active_player == self._player_1:
+            state["_active_player"], state["_inactive_player"] = Board.PLAYER_1, Board.PLAYER_2
+        else:
+            state["_active_player"], state["_inactive_player"] = Board.PLAYER_2, Board.PLAYER_1
+        state["_player_1"], state["_player_2"] = Board.PLAYER_1, Board.PLAYER_2
+        if state["rng"] is random:
+            state["rng"] = None
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        if self.rng is None:
+            self.rng = random
+        self._load_tables()
+
+    def set_players(self, player_1, player_2):
+        """Replace the objects registered as the players of the game, keeping
+        the game state (including which player holds initiative) unchanged.
+
+        Parameters
+        ----------
+        player_1 : object
+            The object to register as the first player.
+
+        player_2 : object
+            The object to register as the second player.
+        """
+        player_2_active = self._active_player == self._player_2
+        self._player_1 = player_1
+        self._player_2 = player_2
+        if player_2_active:
+            self._active_player, self._inactive_player = player_2, player_1
+        else:
+            self._active_player, self._inactive_player = player_1, player_2
 
     def hash(self):
-        return str(self._board_state).__hash__()
+        return self._zobrist_key
+
+    def canonical_form(self):
+        """Return the canonical image of the position among its symmetric
+        variants (see `symmetries`), as a new board, and the Symmetry that
+        maps this board to it. Symmetric positions have the same canonical
+        board, so its `zobrist_key` identifies the position up to symmetry;
+        moves chosen on the canonical board are mapped back to this board
+        with `symmetry.unmap_move`.
+
+        The canonical image is the variant whose cell states, listed in cell
+        index order (blank, blocked, player 1, player 2), are
+        lexicographically smallest.
+        """
+        symmetry = self.canonical_symmetry()
+        return self.transformed(symmetry), symmetry
+
+    def canonical_symmetry(self):
+        """Return the Symmetry mapping the position to its canonical image
+        (see canonical_form) without building the image.
+        """
+        states, _ = self.__cell_states()
+        return min(symmetries(self.width, self.height),
+                   key=lambda symmetry: [states[idx] for idx in symmetry.inverse])
+
+    def transformed(self, symmetry):
+        """Return a new board holding the image of the position under a
+        Symmetry, with the same players, initiative and move count.
+        """
+        states, locations = self.__cell_states()
+        # Replay the blocked cells as the moves of the players, ending each
+        # player's moves on its location; apply_move() does not check that
+        # the moves are legal
+        others = [idx for idx, state in enumerate(states) if state == 1]
+        paths = []
+        for count, location in zip(((self.move_count + 1) // 2, self.move_count // 2), locations):
+            if count:
+                paths.append(others[:count - 1] + [location])
+                others = others[count - 1:]
+        board = type(self)(self._player_1, self._player_2, width=self.width,
+                           height=self.height, rng=self.rng, shuffle_moves=self.shuffle_moves)
+        for turn in range(self.move_count):
+            idx = symmetry.cells[paths[turn % 2][turn // 2]]
+            board.apply_move((idx % self.height, idx // self.height))
+        return board.copy()
+
+    def __cell_states(self):
+        """Return the state of every cell (0 for blank, 1 for blocked, 2 and
+        3 for the cells of player 1 and player 2) and the cell index of each
+        player (None if not placed).
+        """
+        height = self.height
+        states = [1] * (self.width * height)
+        for r, c in self.get_blank_spaces():
+            states[r + c * height] = 0
+        locations = []
+        for seat, player in enumerate((self._player_1, self._player_2)):
+            location = self.get_player_location(player)
+            if location is not None:
+                location = location[0] + location[1] * height
+                states[location] = 2 + seat
+            locations.append(location)
+        return states, locations
+
+    @property
+    def zobrist_key(self):
+        """The 64-bit Zobrist key of the current game state, covering the
+        blocked cells, the location of each player and the player holding
+        initiative.
+        """
+        return self._zobrist_key
 
     @property
     def active_player(self):
@@ -92,11 +397,13 @@ class Board(object):
 
     def copy(self):
         """ Return a deep copy of the current board. """
-        new_board = Board(self._player_1, self._player_2, width=self.width, height=self.height)
+        new_board = Board(self._player_1, self._player_2, width=self.width, height=self.height,
+                          rng=self.rng, shuffle_moves=self.shuffle_moves)
         new_board.move_count = self.move_count
         new_board._active_player = self._active_player
         new_board._inactive_player = self._inactive_player
         new_board._board_state = copy(self._board_state)
+        new_board._zobrist_key = self._zobrist_key
         return new_board
 
     def forecast_move(self, move):
@@ -201,12 +508,41 @@ class Board(object):
         """
         idx = move[0] + move[1] * self.height
         last_move_idx = int(self.active_player == self._player_2) + 1
+        prev_idx = self._board_state[-last_move_idx]
+        player_keys = self._zobrist.players[last_move_idx - 1]
+        self._zobrist_key ^= self._zobrist.cells[idx] ^ player_keys[idx] ^ self._zobrist.side
+        if prev_idx != Board.NOT_MOVED:
+            self._zobrist_key ^= player_keys[prev_idx]
+        self._undo_stack.append(prev_idx)
         self._board_state[-last_move_idx] = idx
         self._board_state[idx] = 1
         self._board_state[-3] ^= 1
         self._active_player, self._inactive_player = self._inactive_player, self._active_player
         self.move_count += 1
 
+    def undo_move(self):
+        """Reverse the most recent call to apply_move() in place, restoring
+        the previous location of the player who moved and the initiative.
+
+        Only moves applied to this board object can be undone; copies of the
+        board (including those returned by forecast_move) start with no moves
+        to undo. Raises a RuntimeError if there is no move to undo.
+        """
+        if not self._undo_stack:
+            raise RuntimeError("There is no move to undo on this board.")
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        last_move_idx = int(self._active_player == self._player_2) + 1
+        idx = self._board_state[-last_move_idx]
+        prev_idx = self._undo_stack.pop()
+        player_keys = self._zobrist.players[last_move_idx - 1]
+        self._zobrist_key ^= self._zobrist.cells[idx] ^ player_keys[idx] ^ self._zobrist.side
+        if prev_idx != Board.NOT_MOVED:
+            self._zobrist_key ^= player_keys[prev_idx]
+        self._board_state[idx] = Board.BLANK
+        self._board_state[-last_move_idx] = prev_idx
+        self._board_state[-3] ^= 1
+        self.move_count -= 1
+
     def is_winner(self, player):
         """ Test whether the specified player has won the game. """
         return player == self._inactive_player and not self.get_legal_moves(self._active_player)
@@ -254,12 +590,11 @@ class Board(object):
         if loc == Board.NOT_MOVED:
             return self.get_blank_spaces()
 
-        r, c = loc
-        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                      (1, -2), (1, 2), (2, -1), (2, 1)]
-        valid_moves = [(r + dr, c + dc) for dr, dc in directions
-                       if self.move_is_legal((r + dr, c + dc))]
-        random.shuffle(valid_moves)
+        board_state = self._board_state
+        valid_moves = [move for idx, move in self._knight_moves[loc[0] + loc[1] * self.height]
+                       if board_state[idx] == Board.BLANK]
+        if self.shuffle_moves:
+            self.rng.shuffle(valid_moves)
         return valid_moves
 
     def print_board(self):
@@ -295,7 +630,7 @@ class Board(object):
 
         return out
 
-    def play(self, time_limit=TIME_LIMIT_MILLIS):
+    def play(self, time_limit=TIME_LIMIT_MILLIS, move_times=None):
         """Execute a match between the players by alternately soliciting them
         to select a move and applying it in the game.
 
@@ -305,6 +640,10 @@ class Board(object):
             The maximum number of milliseconds to allow before timeout
             during each turn.
 
+        move_times : list (optional)
+            If given, the number of milliseconds each player took to return
+            its move is appended to this list at every turn.
+
         Returns
         ----------
         (player, list<[(int, int),]>, str)
@@ -325,6 +664,8 @@ class Board(object):
             time_left = lambda : time_limit - (time_millis() - move_start)
             curr_move = self._active_player.get_move(game_copy, time_left)
             move_end = time_left()
+            if move_times is not None:
+                move_times.append(time_limit - move_end)
 
             if curr_move is None:
                 curr_move = Board.NOT_MOVED
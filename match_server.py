@@ -0,0 +1,115 @@
+"""Play tournament games on behalf of another process or host.
+
+A worker listens on a TCP port and plays one game at a time, so start one
+worker per core that should be used:
+
+    python match_server.py --port 5007
+
+and list the workers in `tournament.WORKER_ADDRESSES`. Each request is a
+single JSON line holding the AgentSpec of every agent in the round and the
+Match to play; the reply is a JSON line with the index of the winner in the
+match, the reason the game ended and the search statistics of the players.
+Players are rebuilt from their specs on the worker, so no live objects are
+sent over the connection.
+"""
+import argparse
+import json
+import queue
+import socket
+import socketserver
+
+from concurrent.futures import ThreadPoolExecutor
+
+from tournament import Match, build_player, play_match, spec_from_json
+
+DEFAULT_PORT = 5007
+
+
+def encode_request(specs, match):
+    return (json.dumps({"agents": [list(spec) for spec in specs],
+                        "match": list(match)}) + "\n").encode()
+
+
+def decode_request(line):
+    request = json.loads(line)
+    specs = [spec_from_json(spec) for spec in request["agents"]]
+    player_1, player_2, opening, seed, shuffle_moves = request["match"]
+    match = Match(player_1, player_2, tuple(tuple(move) for move in opening),
+                  seed, shuffle_moves)
+    return specs, match
+
+
+class MatchHandler(socketserver.StreamRequestHandler):
+    """Play every match requested on a connection, one at a time."""
+
+    def handle(self):
+        for line in self.rfile:
+            specs, match = decode_request(line)
+            result = play_match(self.server.players_for(specs), match)
+            self.wfile.write((json.dumps(result) + "\n").encode())
+            self.wfile.flush()
+
+
+class MatchServer(socketserver.TCPServer):
+    """TCP server playing the matches sent by run_remote_matches(). The
+    players of the most recent round are kept between requests so that they
+    are only built once per round.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, MatchHandler)
+        self._round = None
+        self._players = None
+
+    def players_for(self, specs):
+        if specs != self._round:
+            self._round = specs
+            self._players = [build_player(spec) for spec in specs]
+        return self._players
+
+
+def run_remote_matches(addresses, specs, matches):
+    """Play the matches on the workers listening at `addresses` and return
+    their results in the same order as the matches.
+    """
+    connections = queue.Queue()
+    sockets = [socket.create_connection(address) for address in addresses]
+    for sock in sockets:
+        connections.put(sock.makefile("rwb"))
+
+    def play(match):
+        connection = connections.get()
+        try:
+            connection.write(encode_request(specs, match))
+            connection.flush()
+            winner_idx, termination, move_stats, move_times = json.loads(connection.readline())
+            return winner_idx, termination, move_stats, move_times
+        finally:
+            connections.put(connection)
+
+    try:
+        with ThreadPoolExecutor(len(sockets)) as executor:
+            return list(executor.map(play, matches))
+    finally:
+        while not connections.empty():
+            connections.get().close()
+        for sock in sockets:
+            sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play tournament games for remote clients.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port to listen on (default: %(default)s)")
+    args = parser.parse_args()
+
+    with MatchServer((args.host, args.port)) as server:
+        print("Serving matches on {}:{}".format(*server.server_address))
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""Monte Carlo tree search (UCT) player.
+
+`MCTSPlayer` grows a search tree by repeatedly selecting a path with the UCT
+rule, adding one node to it, and scoring the new node with a random playout
+to the end of the game, until the time left in the turn falls below its
+TIMER_THRESHOLD; it then plays the most visited move.
+
+The search never copies the board: a position is three integers, the bitmask
+of the blocked cells (bit `row + col * height`, as in
+`isolation.isolation.knight_tables`) and the cell indices of the player to
+move and its opponent, so playouts only do integer operations on the knight
+move masks. The tree is a set of parallel arrays indexed by node rather than
+one object per node, so that tens of thousands of nodes cost the garbage
+collector nothing; full collections over that many objects take long enough
+to make either player in the game overrun its turn.
+
+The tree is kept across turns: at its next move the player re-roots the tree
+on the node of the move its opponent actually played, and the visits made
+below that node during the previous search are reused. Once the players are
+partitioned (see `endgame`), the player plays the move starting its longest
+path instead of searching.
+
+The statistics of every search (playouts, playouts per second, tree size) are
+appended to the `rollout_stats` list of the player.
+"""
+import math
+import random
+
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+
+from endgame import best_move, blank_mask
+from game_agent import SearchTimeout
+from isolation.isolation import knight_tables
+from search_stats import timer
+
+UCT_EXPLORATION = math.sqrt(2)  # exploration constant of the UCT rule
+
+# Cell index of a player who has not moved yet, and of the root of a tree
+NO_LOCATION = -1
+
+# The statistics of the search of one move: the number of playouts made, the
+# playouts per second, the number of nodes in the tree when the move was
+# chosen, the number of root visits reused from the previous search, and the
+# search time in milliseconds
+MCTSStats = namedtuple("MCTSStats", ["rollouts", "rollouts_per_second", "tree_size",
+                                     "reused_visits", "time"])
+
+
+@lru_cache(maxsize=None)
+def move_masks(width, height):
+    """Return the knight move masks of a board size, followed by the mask of
+    every cell, so that `move_masks(width, height)[NO_LOCATION]` holds the
+    moves of a player who has not moved yet.
+    """
+    return tuple(knight_tables(width, height).masks) + ((1 << (width * height)) - 1,)
+
+
+def rollout(masks, occupied, loc, other, rand=random.random):
+    """Play random moves from a position until a player cannot move.
+
+    Parameters
+    ----------
+    masks : sequence of int
+        The move masks returned by move_masks().
+
+    occupied : int
+        The bitmask of the blocked cells.
+
+    loc, other : int
+        The cell index of the player to move and of its opponent, or
+        NO_LOCATION.
+
+    rand : callable (optional)
+        A function returning random floats in [0, 1).
+
+    Returns
+    -------
+    bool
+        True if the player to move wins the playout.
+    """
+    to_move_wins = False
+    while True:
+        options = masks[loc] & ~occupied
+        if not options:
+            return to_move_wins
+        k = int(rand() * bin(options).count("1"))
+        while k:
+            options &= options - 1
+            k -= 1
+        low = options & -options
+        occupied |= low
+        loc, other = other, low.bit_length() - 1
+        to_move_wins = not to_move_wins
+
+
+class SearchTree:
+    """A search tree stored as parallel arrays indexed by node.
+
+    For each node: the cell of the move leading to it, its visits, the
+    playouts won by the player who made that move, the number of nodes of its
+    subtree, its first child and next sibling (-1 for none), and the number
+    of its moves not expanded yet (-1 until they are counted).
+    """
+    __slots__ = ("cell", "visits", "wins", "size", "child", "sibling", "moves_left")
+
+    def __init__(self):
+        self.cell = array("h")
+        self.visits = array("i")
+        self.wins = array("i")
+        self.size = array("i")
+        self.child = array("i")
+        self.sibling = array("i")
+        self.moves_left = array("h")
+
+    def __len__(self):
+        return len(self.cell)
+
+    def add(self, cell, parent=-1):
+        """Add a node as the first child of `parent` (-1 for a root) and
+        return its index. The sizes of the ancestors are left to the caller.
+        """
+        index = len(self.cell)
+        self.cell.append(cell)
+        self.visits.append(0)
+        self.wins.append(0)
+        self.size.append(1)
+        self.child.append(-1)
+        self.moves_left.append(-1)
+        if parent < 0:
+            self.sibling.append(-1)
+        else:
+            self.sibling.append(self.child[parent])
+            self.child[parent] = index
+        return index
+
+    def find_child(self, node, cell):
+        """Return the child of a node reached by the move `cell`, or -1."""
+        child = self.child[node]
+        while child >= 0 and self.cell[child] != cell:
+            child = self.sibling[child]
+        return child
+
+
+class MCTSPlayer:
+    """Game-playing agent that chooses a move with Monte Carlo tree search.
+
+    Parameters
+    ----------
+    timeout : float (optional)
+        Time remaining (in milliseconds) when search is aborted. Should be a
+        positive value large enough to allow the function to return before the
+        timer expires.
+
+    exploration : float (optional)
+        The exploration constant of the UCT rule.
+
+    reuse_tree : bool (optional)
+        Keep the subtree of the position reached after the opponent's reply
+        for the search of the next move (default).
+
+    rng : random.Random (optional)
+        The random number generator of the playouts and of the order in which
+        moves are expanded. Defaults to the `random` module.
+
+    solve_endgames : bool (optional)
+        Play partitioned endgames exactly with `endgame.best_move` instead of
+        searching them (default).
+    """
+
+    def __init__(self, timeout=10., exploration=UCT_EXPLORATION, reuse_tree=True, rng=None,
+                 solve_endgames=True):
+        self.TIMER_THRESHOLD = timeout
+        self.exploration = exploration
+        self.reuse_tree = reuse_tree
+        self.rng = random if rng is None else rng
+        self.solve_endgames = solve_endgames
+        self.rollout_stats = []
+        self._tree = SearchTree()
+        # the root and position of the last search, and the move played
+        self._last_search = None
+
+    def get_move(self, game, time_left):
+        """Search for the best move from the available legal moves and return a
+        result before the time limit expires.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game (e.g., player locations and blocked cells).
+
+        time_left : callable
+            A function that returns the number of milliseconds left in the
+            current turn. Returning with any less than 0 ms remaining forfeits
+            the game.
+
+        Returns
+        -------
+        (int, int)
+            Board coordinates corresponding to a legal move; may return
+            (-1, -1) if there are no available legal moves.
+        """
+        start = timer()
+        height = game.height
+        masks = move_masks(game.width, height)
+        state = self.__game_state(game)
+        occupied, loc, other = state
+        legal = masks[loc] & ~occupied
+        if not legal:
+            self._last_search = None
+            return (-1, -1)
+        if self.solve_endgames:
+            def check_time():
+                if time_left() < self.TIMER_THRESHOLD:
+                    raise SearchTimeout()
+
+            try:
+                move = best_move(game, check=check_time)
+            except SearchTimeout:
+                move = None
+            if move is not None:
+                self._last_search = None
+                return move
+
+        root = self.__reroot(state)
+        tree = self._tree
+        reused_visits = tree.visits[root]
+        rollouts = 0
+        while time_left() > self.TIMER_THRESHOLD:
+            self.__iterate(root, state, masks)
+            rollouts += 1
+
+        best, best_visits = None, -1
+        child = tree.child[root]
+        while child >= 0:
+            if tree.visits[child] > best_visits:
+                best, best_visits = tree.cell[child], tree.visits[child]
+            child = tree.sibling[child]
+        if best is None:
+            best = (legal & -legal).bit_length() - 1
+        elapsed = timer() - start
+        self.rollout_stats.append(MCTSStats(rollouts, rollouts / elapsed if elapsed else 0.,
+                                            tree.size[root], reused_visits, 1000 * elapsed))
+
+        if self.reuse_tree:
+            self._last_search = (root, state, best)
+        return (best % height, best // height)
+
+    def __iterate(self, root, state, masks):
+        """Select a path with the UCT rule, expand it by one node, score the
+        node with a playout and update the statistics along the path.
+        """
+        tree = self._tree
+        cells, visits, wins, child_of, sibling, moves_left = (
+            tree.cell, tree.visits, tree.wins, tree.child, tree.sibling, tree.moves_left)
+        occupied, loc, other = state
+        node = root
+        path = [node]
+
+        # selection: descend through fully expanded nodes
+        while moves_left[node] == 0:
+            child = child_of[node]
+            if child < 0:
+                break  # the player to move has lost
+            log_visits = math.log(visits[node])
+            exploration = self.exploration
+            best_value = -1.
+            while child >= 0:
+                child_visits = visits[child]
+                value = (wins[child] / child_visits +
+                         exploration * math.sqrt(log_visits / child_visits))
+                if value > best_value:
+                    best_value, node = value, child
+                child = sibling[child]
+            path.append(node)
+            occupied |= 1 << cells[node]
+            loc, other = other, cells[node]
+
+        # expansion: add a random unexpanded move of the position
+        if moves_left[node] != 0:
+            options = masks[loc] & ~occupied
+            if moves_left[node] < 0:
+                moves_left[node] = bin(options).count("1")
+            child = child_of[node]
+            while child >= 0:
+                options &= ~(1 << cells[child])
+                child = sibling[child]
+            if options:
+                k = int(self.rng.random() * moves_left[node])
+                while k:
+                    options &= options - 1
+                    k -= 1
+                low = options & -options
+                moves_left[node] -= 1
+                size = tree.size
+                for index in path:
+                    size[index] += 1
+                node = tree.add(low.bit_length() - 1, node)
+                path.append(node)
+                occupied |= low
+                loc, other = other, cells[node]
+
+        # simulation and backpropagation; the player who moved into `node`
+        # wins if the player to move loses the playout
+        reward = 0 if rollout(masks, occupied, loc, other, self.rng.random) else 1
+        for index in reversed(path):
+            visits[index] += 1
+            wins[index] += reward
+            reward = 1 - reward
+
+    def __reroot(self, state):
+        """Return the root of the search of a position: the node of the
+        previous tree reached by the move played and the opponent's reply if
+        the position matches, or the root of a new tree otherwise.
+        """
+        last_search, self._last_search = self._last_search, None
+        if last_search is not None:
+            root, (occupied, _, _), move = last_search
+            reply = state[2]
+            if reply != NO_LOCATION and (occupied | 1 << move | 1 << reply, move, reply) == state:
+                child = self._tree.find_child(root, move)
+                node = self._tree.find_child(child, reply) if child >= 0 else -1
+                if node >= 0:
+                    return node
+        self._tree = SearchTree()
+        return self._tree.add(NO_LOCATION)
+
+    @staticmethod
+    def __game_state(game):
+        """Return the (blocked cells, location of the player to move,
+        location of its opponent) representation of a game.
+        """
+        height = game.height
+        occupied = ((1 << (game.width * height)) - 1) & ~blank_mask(game)
+        locations = []
+        for player in (game.active_player, game.inactive_player):
+            location = game.get_player_location(player)
+            locations.append(NO_LOCATION if location is None
+                             else location[0] + location[1] * height)
+        return occupied, locations[0], locations[1]
@@ -0,0 +1,170 @@
+"""Build and read opening books of precomputed moves.
+
+A book holds the move chosen by a deep fixed-depth alpha-beta search for every
+position of the first plies of a game on one board size:
+
+    python opening_book.py --plies 3 --depth 6 --output book_7x7.bin
+
+and is used by passing its path as the `opening_book` of an AlphaBetaPlayer.
+
+Positions that are mirror images or rotations of each other share one entry:
+each position is keyed by the Zobrist key of its canonical image (see
+`isolation.Board.canonical_form`), and its move is stored in the frame of
+that image.
+
+The file is an open-addressing hash table that is memory-mapped rather than
+read, so a lookup reads a few bytes of the file in constant time whatever the
+size of the book. It starts with a header (magic, board width and height,
+number of plies, number of slots) followed by the slots, each a 64-bit key
+and the index `row + col * height` of the move (EMPTY for an unused slot).
+"""
+import argparse
+import itertools
+import mmap
+import multiprocessing
+import struct
+
+from isolation import Board
+from budget import FixedDepth
+
+MAGIC = b"ISOBOOK2"
+HEADER = struct.Struct("<8sHHII")
+SLOT = struct.Struct("<QB")
+EMPTY = 0xff
+
+PLIES = 2  # number of plies covered by a book
+DEPTH = 5  # search depth of each book move
+
+
+def canonical_key(game):
+    """Return the Zobrist key of the canonical image of a position (see
+    `isolation.Board.canonical_form`) and the Symmetry mapping the position
+    to it.
+    """
+    canonical, symmetry = game.canonical_form()
+    return canonical.zobrist_key, symmetry
+
+
+def _search(game, depth):
+    """Return the cell index of the move chosen by a fixed-depth search."""
+    from game_agent import AlphaBetaPlayer, custom_score  # game_agent reads books
+
+    player = AlphaBetaPlayer(score_fn=custom_score, budget=FixedDepth(depth))
+    if game.active_player == Board.PLAYER_1:
+        game.set_players(player, Board.PLAYER_2)
+    else:
+        game.set_players(Board.PLAYER_1, player)
+    r, c = player.get_move(game, lambda: float("inf"))
+    return r + c * game.height
+
+
+def build_book(width=7, height=7, plies=PLIES, depth=DEPTH, processes=1):
+    """Search every position of the first `plies` plies, up to symmetry, in
+    a pool of `processes` worker processes (in this process if 1).
+
+    Returns
+    -------
+    dict
+        The cell index of the best move, in the frame of the canonical
+        image, for each canonical key.
+    """
+    book = {}
+    frontier = [Board(Board.PLAYER_1, Board.PLAYER_2, width, height, shuffle_moves=False)]
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    starmap = pool.starmap if pool is not None else itertools.starmap
+    try:
+        for ply in range(plies):
+            positions = {}
+            for game in frontier:
+                if game.get_legal_moves():
+                    key, symmetry = canonical_key(game)
+                    positions.setdefault(key, (game, symmetry))
+            print("ply {}: {} positions".format(ply, len(positions)), flush=True)
+            games = [game for game, _ in positions.values()]
+            # _search replaces the players of the board it is given
+            moves = list(starmap(_search, [(game.copy(), depth) for game in games]))
+            for (key, (_, symmetry)), move in zip(positions.items(), moves):
+                book[key] = symmetry.cells[move]
+            if ply + 1 < plies:
+                frontier = [game.forecast_move(move) for game in games
+                            for move in game.get_legal_moves()]
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return book
+
+
+def write_book(path, width, height, plies, book):
+    """Write a book as an open-addressing hash table with a load factor of
+    at most one half.
+    """
+    slots = 1
+    while slots < 2 * len(book):
+        slots *= 2
+    table = [None] * slots
+    for key, move in book.items():
+        idx = key & (slots - 1)
+        while table[idx] is not None:
+            idx = (idx + 1) & (slots - 1)
+        table[idx] = (key, move)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, width, height, plies, slots))
+        for slot in table:
+            f.write(SLOT.pack(*slot) if slot is not None else SLOT.pack(0, EMPTY))
+
+
+class OpeningBook:
+    """A memory-mapped opening book file written by write_book()."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.width, self.height, self.plies, self._slots = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError("Not an opening book: {}".format(path))
+
+    def close(self):
+        self._map.close()
+
+    def lookup(self, game):
+        """Return the book move of a position, or None if the position is not
+        in the book.
+        """
+        if (game.move_count >= self.plies or game.width != self.width or
+                game.height != self.height):
+            return None
+        key, symmetry = canonical_key(game)
+        mask = self._slots - 1
+        idx = key & mask
+        while True:
+            slot_key, move = SLOT.unpack_from(self._map, HEADER.size + idx * SLOT.size)
+            if move == EMPTY:
+                return None
+            if slot_key == key:
+                cell = symmetry.inverse[move]
+                return cell % self.height, cell // self.height
+            idx = (idx + 1) & mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an opening book.")
+    parser.add_argument("--width", type=int, default=7)
+    parser.add_argument("--height", type=int, default=7)
+    parser.add_argument("--plies", type=int, default=PLIES,
+                        help="number of plies covered by the book (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=DEPTH,
+                        help="search depth of each book move (default: %(default)s)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of positions searched in parallel (default: %(default)s)")
+    parser.add_argument("--output", required=True, help="book file to write")
+    args = parser.parse_args()
+
+    book = build_book(args.width, args.height, args.plies, args.depth, args.processes)
+    write_book(args.output, args.width, args.height, args.plies, book)
+    print("Wrote {} positions to {}".format(len(book), args.output))
+
+
+if __name__ == "__main__":
+    main()
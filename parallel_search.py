@@ -0,0 +1,175 @@
+"""Helper processes for a parallel ("lazy SMP") alpha-beta search.
+
+While an `AlphaBetaPlayer` built with `search_processes > 1` searches a move,
+each helper process runs the same iterative deepening search on its own copy
+of the board. All of them read and write one `SharedTranspositionTable`, so
+the helpers mostly serve to fill the table with results the main search then
+finds ready; the odd-numbered helpers start one ply deeper so that the
+processes spread over two depths instead of racing through the same tree.
+When the main search stops, the helpers are told to stop too, and the player
+plays the move of the deepest search completed by any process.
+
+Helpers honor the same deadline as the main search: they receive it as an
+absolute `timeit.default_timer()` time and stop when less than the player's
+TIMER_THRESHOLD is left, or as soon as the main search is over.
+
+Helper processes cannot be started from a daemonic process, such as a worker
+of the tournament process pool.
+
+A `SearchPool` with a single helper also serves for pondering (see
+`AlphaBetaPlayer`): the helper searches the position expected after the
+opponent's reply while the opponent thinks, and the main search later finds
+its results in the shared table. Cancelling a search waits for every helper
+to reply to it, so that no helper writes to the table once it is cleared for
+another search.
+"""
+import multiprocessing
+import os
+import timeit
+
+from collections import namedtuple
+
+timer = timeit.default_timer
+
+# A request sent to the helpers: the id of the search, the board (with the
+# player to move replaced by the helper's own player), the depth limit of the
+# search (None for none) and its deadline (None for none)
+SearchRequest = namedtuple("SearchRequest", ["search_id", "game", "max_depth", "deadline"])
+
+
+def available_cpus():
+    """Return the number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _helper_main(connection, index, active, table, player_kwargs):
+    """Serve search requests until the connection is closed."""
+    from game_agent import AlphaBetaPlayer
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        # a new player for every search, so that no move ordering state is
+        # carried over from a search of another position
+        player = AlphaBetaPlayer(tt_size_mb=0, **player_kwargs)
+        player.transposition_table = table
+        game = request.game
+        if game.active_player == game.PLAYER_1:
+            game.set_players(player, game.PLAYER_2)
+        else:
+            game.set_players(game.PLAYER_1, player)
+
+        search_id, deadline = request.search_id, request.deadline
+
+        def time_left():
+            if active.value != search_id:
+                return float("-inf")
+            if deadline is None:
+                return float("inf")
+            return 1000 * (deadline - timer())
+
+        player.time_left = time_left
+        move, depth = player.iterative_deepening(game, request.max_depth, index % 2)
+        connection.send((search_id, depth, move))
+
+
+class SearchPool:
+    """A set of helper processes searching alongside the main process.
+
+    Parameters
+    ----------
+    helpers : int
+        The number of helper processes.
+
+    table : `transposition.SharedTranspositionTable`
+        The transposition table shared with the main search.
+
+    player_kwargs : dict
+        Arguments of the AlphaBetaPlayer constructor used to build the
+        helpers' players (score function, timeout, ...).
+    """
+
+    def __init__(self, helpers, table, player_kwargs):
+        self._active = multiprocessing.RawValue("i", 0)
+        self._search_id = 0
+        self._connections = []
+        self._pending = []  # the connections of helpers yet to reply to the search
+        self._processes = []
+        for index in range(1, helpers + 1):
+            connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_helper_main, daemon=True,
+                args=(child_connection, index, self._active, table, player_kwargs))
+            process.start()
+            child_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def start(self, game, max_depth, deadline):
+        """Start the helpers searching the game, in which the searching
+        player must be the active player.
+        """
+        self._search_id += 1
+        self._active.value = self._search_id
+        request = SearchRequest(self._search_id, game, max_depth, deadline)
+        for connection in self._connections:
+            connection.send(request)
+        self._pending = list(self._connections)
+
+    def stop(self, time_left, threshold):
+        """Stop the helpers and return the (depth, move) results of those that
+        reply while more than half of the timer threshold is left. Late
+        replies are discarded by the next call.
+        """
+        self._active.value = 0
+        results = []
+        for connection in self._connections:
+            while True:
+                wait = (time_left() - threshold / 2.) / 1000
+                if not connection.poll(min(max(wait, 0.), 1.)):
+                    break
+                search_id, depth, move = connection.recv()
+                if search_id == self._search_id:
+                    results.append((depth, move))
+                    self._pending.remove(connection)
+                    break
+        return results
+
+    def cancel(self):
+        """Stop the helpers and wait until every helper has replied to the
+        current search, which it does as soon as it sees that the search is
+        over; the results are discarded. Once this returns, the helpers no
+        longer write to the table.
+        """
+        self._active.value = 0
+        for connection in self._pending:
+            try:
+                while connection.recv()[0] != self._search_id:
+                    pass  # a late reply to an earlier search
+            except EOFError:
+                pass  # the helper is gone
+        self._pending = []
+
+    def close(self):
+        """Shut the helper processes down."""
+        self._active.value = 0
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        self._pending = []
+        for process in self._processes:
+            process.join(1.)
+            if process.is_alive():
+                process.terminate()
+        self._connections = []
+        self._processes = []
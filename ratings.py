@@ -0,0 +1,272 @@
+"""Keep the results and Elo ratings of tournament games in a SQLite database.
+
+Every game recorded in a `RatingStore` is stored with the names of its
+agents in seat order, the opening moves, the seed of the board, the seat of
+the winner (0 for the first player), the reason the game ended, the number of
+milliseconds taken by every move after the opening, and the time it was
+recorded (UTC). Games are indexed by agent and by time, so the games of an
+agent or of a period can be read back without scanning the whole table.
+
+Ratings are Elo ratings updated incrementally: recording a game moves the
+ratings of its two agents by ELO_K times the difference between the result
+and the expected score, in the same transaction as the game, so the ratings
+always match the games stored and runs of the tournament (see RATINGS_DB in
+tournament.py) keep adding to them. Incremental ratings depend on the order
+of the games; rebuild() replays every stored game in order from the initial
+rating, e.g. after changing ELO_K.
+
+    python ratings.py tournament.db
+    python ratings.py tournament.db --agent AB_Custom --since 2017-01-01
+"""
+import argparse
+import datetime
+import json
+import sqlite3
+
+from collections import namedtuple
+
+from tournament import elo_to_score, spec_from_json
+
+INITIAL_RATING = 1500.  # rating of an agent before its first game
+ELO_K = 16.  # rating points at stake in every game
+
+# The rating of an agent and the number of rated games it has played
+Rating = namedtuple("Rating", ["name", "rating", "games"])
+
+# A stored game: its row id, the UTC time it was recorded (ISO 8601), the
+# names of the agents in seat order, the opening moves, the seed of the
+# board, the seat of the winner, the reason the game ended, and the
+# milliseconds taken by every move after the opening
+StoredGame = namedtuple("StoredGame", ["id", "played_at", "agents", "opening", "seed", "winner",
+                                       "termination", "move_times"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agents (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    spec TEXT,
+    rating REAL NOT NULL,
+    games INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    played_at TEXT NOT NULL,
+    player_1 INTEGER NOT NULL REFERENCES agents (id),
+    player_2 INTEGER NOT NULL REFERENCES agents (id),
+    opening TEXT NOT NULL,
+    seed INTEGER,
+    winner INTEGER NOT NULL,
+    termination TEXT NOT NULL,
+    move_times TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_player_1 ON games (player_1, played_at);
+CREATE INDEX IF NOT EXISTS games_player_2 ON games (player_2, played_at);
+CREATE INDEX IF NOT EXISTS games_played_at ON games (played_at);
+"""
+
+
+def _timestamp(value):
+    """Return the ISO 8601 string stored for a time: UTC datetimes (naive
+    ones are taken as UTC) are written with microseconds so that timestamps
+    sort as strings; dates and strings are used as given.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value.isoformat(timespec="microseconds")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def elo_update(rating_1, rating_2, score, k=ELO_K):
+    """Return the ratings of two players after a game in which the first
+    scored `score` (1 for a win, 0 for a loss).
+    """
+    delta = k * (score - elo_to_score(rating_1 - rating_2))
+    return rating_1 + delta, rating_2 - delta
+
+
+class RatingStore:
+    """A SQLite database of games and Elo ratings, created at `path` if it
+    does not exist (":memory:" for a temporary one).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _agent_id(self, name, spec=None):
+        """Return the row id of an agent, adding it at the initial rating if
+        it is new. The AgentSpec is only stored for new agents.
+        """
+        row = self._connection.execute("SELECT id FROM agents WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self._connection.execute(
+            "INSERT INTO agents (name, spec, rating) VALUES (?, ?, ?)",
+            (name, None if spec is None else json.dumps(spec), INITIAL_RATING)).lastrowid
+
+    def _update_ratings(self, agent_ids, winner):
+        if agent_ids[0] == agent_ids[1]:
+            return  # a game against itself says nothing about an agent's rating
+        ratings = [self._connection.execute("SELECT rating FROM agents WHERE id = ?",
+                                            (agent_id,)).fetchone()[0]
+                   for agent_id in agent_ids]
+        for agent_id, rating in zip(agent_ids, elo_update(ratings[0], ratings[1], 1 - winner)):
+            self._connection.execute("UPDATE agents SET rating = ?, games = games + 1 "
+                                     "WHERE id = ?", (rating, agent_id))
+
+    def record_game(self, agents, opening, winner, termination, move_times=(), seed=None,
+                    specs=None, played_at=None):
+        """Store a game and update the ratings of its agents, and return the
+        row id of the game. A game between two seats of the same agent is
+        stored without changing its rating or its count of rated games.
+
+        Parameters
+        ----------
+        agents : (str, str)
+            The names of the agents in seat order.
+
+        opening : sequence of (int, int)
+            The moves played before the agents took over.
+
+        winner : int
+            The seat of the winner (0 for the first player).
+
+        termination : str
+            The reason the game ended, as returned by `Board.play`.
+
+        move_times : sequence of float (optional)
+            The milliseconds taken by every move after the opening.
+
+        seed : int (optional)
+            The seed of the board's generator.
+
+        specs : (AgentSpec, AgentSpec) (optional)
+            The AgentSpecs of the agents, stored with agents seen for the
+            first time.
+
+        played_at : datetime.datetime (optional)
+            The time of the game in UTC; defaults to now.
+        """
+        if winner not in (0, 1):
+            raise ValueError("Invalid winner seat: {}".format(winner))
+        if played_at is None:
+            played_at = datetime.datetime.now(datetime.timezone.utc)
+        specs = specs or (None, None)
+        with self._connection:
+            agent_ids = [self._agent_id(name, spec) for name, spec in zip(agents, specs)]
+            game_id = self._connection.execute(
+                "INSERT INTO games (played_at, player_1, player_2, opening, seed, winner, "
+                "termination, move_times) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (_timestamp(played_at), agent_ids[0], agent_ids[1],
+                 json.dumps([list(move) for move in opening]), seed, winner, termination,
+                 json.dumps([round(t, 3) for t in move_times]))).lastrowid
+            self._update_ratings(agent_ids, winner)
+        return game_id
+
+    def rating(self, name):
+        """Return the Rating of an agent. Raises a ValueError for unknown
+        agents.
+        """
+        row = self._connection.execute("SELECT name, rating, games FROM agents WHERE name = ?",
+                                       (name,)).fetchone()
+        if row is None:
+            raise ValueError("Unknown agent: {}".format(name))
+        return Rating(*row)
+
+    def ratings(self):
+        """Return the Ratings of every agent from highest to lowest."""
+        return [Rating(*row) for row in self._connection.execute(
+            "SELECT name, rating, games FROM agents ORDER BY rating DESC, name")]
+
+    def spec(self, name):
+        """Return the AgentSpec stored for an agent, or None."""
+        row = self._connection.execute("SELECT spec FROM agents WHERE name = ?",
+                                       (name,)).fetchone()
+        return None if row is None or row[0] is None else spec_from_json(json.loads(row[0]))
+
+    def games(self, agent=None, since=None, until=None):
+        """Return the StoredGames recorded in a period (`since` included,
+        `until` excluded; either may be a datetime, a date or an ISO 8601
+        string), optionally only those of an agent, in the order they were
+        recorded.
+        """
+        conditions, params = [], []
+        if agent is not None:
+            row = self._connection.execute("SELECT id FROM agents WHERE name = ?",
+                                           (agent,)).fetchone()
+            if row is None:
+                return []
+            conditions.append("(g.player_1 = ? OR g.player_2 = ?)")
+            params.extend([row[0], row[0]])
+        if since is not None:
+            conditions.append("g.played_at >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            conditions.append("g.played_at < ?")
+            params.append(_timestamp(until))
+        query = ("SELECT g.id, g.played_at, a1.name, a2.name, g.opening, g.seed, g.winner, "
+                 "g.termination, g.move_times FROM games g "
+                 "JOIN agents a1 ON a1.id = g.player_1 JOIN agents a2 ON a2.id = g.player_2")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY g.id"
+        return [StoredGame(game_id, played_at, (name_1, name_2),
+                           [tuple(move) for move in json.loads(opening)], seed, winner,
+                           termination, json.loads(move_times))
+                for (game_id, played_at, name_1, name_2, opening, seed, winner, termination,
+                     move_times) in self._connection.execute(query, params)]
+
+    def rebuild(self):
+        """Recompute every rating by replaying the stored games in the order
+        they were recorded from the initial rating.
+        """
+        with self._connection:
+            self._connection.execute("UPDATE agents SET rating = ?, games = 0",
+                                     (INITIAL_RATING,))
+            for player_1, player_2, winner in self._connection.execute(
+                    "SELECT player_1, player_2, winner FROM games ORDER BY id").fetchall():
+                self._update_ratings((player_1, player_2), winner)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("database", help="SQLite database written by the tournament")
+    parser.add_argument("--agent", help="list the games of this agent")
+    parser.add_argument("--since", help="list the games recorded from this UTC date or time")
+    parser.add_argument("--until", help="list the games recorded before this UTC date or time")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute the ratings from every stored game")
+    args = parser.parse_args()
+
+    with RatingStore(args.database) as store:
+        if args.rebuild:
+            store.rebuild()
+        if args.agent or args.since or args.until:
+            for game in store.games(args.agent, args.since, args.until):
+                times = game.move_times
+                print("{:>6}  {}  {:>13} vs {:<13} winner {}  {:<12} {:>4} moves  "
+                      "{:>7.1f} ms/move".format(
+                          game.id, game.played_at[:19], game.agents[0], game.agents[1],
+                          game.agents[game.winner], game.termination, len(times),
+                          sum(times) / len(times) if times else 0.))
+            return
+        print("{:^13}{:>8}{:>7}".format("Agent", "Elo", "Games"))
+        for rating in store.ratings():
+            print("{:^13}{:>8.0f}{:>7}".format(rating.name, rating.rating, rating.games))
+
+
+if __name__ == "__main__":
+    main()
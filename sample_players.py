@@ -6,7 +6,7 @@ own agent and example heuristic functions.
     ************************************************************************
 """
 
-from random import randint
+import random
 
 
 def null_score(game, player):
@@ -134,7 +134,18 @@ def center_score(game, player):
 
 
 class RandomPlayer():
-    """Player that chooses a move randomly."""
+    """Player that chooses a move randomly.
+
+    Parameters
+    ----------
+    rng : random.Random (optional)
+        The random number generator used to select moves. Defaults to the
+        generator of the board passed to get_move() (`Board.rng`), which is
+        the `random` module unless the board was given its own generator.
+    """
+
+    def __init__(self, rng=None):
+        self.rng = rng
 
     def get_move(self, game, time_left):
         """Randomly select a move from the available legal moves.
@@ -159,7 +170,8 @@ class RandomPlayer():
         legal_moves = game.get_legal_moves()
         if not legal_moves:
             return (-1, -1)
-        return legal_moves[randint(0, len(legal_moves) - 1)]
+        rng = self.rng or getattr(game, "rng", random)
+        return legal_moves[rng.randint(0, len(legal_moves) - 1)]
 
 
 class GreedyPlayer():
@@ -0,0 +1,161 @@
+"""Per-move search instrumentation for the agents in game_agent.py.
+
+A player constructed with `collect_stats=True` records one `SearchStats`
+object per call to get_move() in its `move_stats` list: the number of nodes
+and leaves visited, the number of cutoffs, the deepest completed search
+depth, and the time spent generating moves, making and unmaking moves, and
+scoring positions. The counts and times are collected by wrapping the board
+and the score function for the duration of the move, so players that do not
+collect stats run at full speed.
+"""
+import functools
+import timeit
+
+from contextlib import contextmanager
+
+timer = timeit.default_timer
+
+
+class SearchStats:
+    """Search metrics of a single move. Times are in milliseconds."""
+
+    FIELDS = ("nodes", "leaves", "cutoffs", "depth", "movegen_time",
+              "make_time", "score_time", "total_time")
+
+    def __init__(self):
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.depth = 0
+        self.movegen_time = 0.
+        self.make_time = 0.
+        self.score_time = 0.
+        self.total_time = 0.
+        self._in_score = False
+
+    @property
+    def effective_branching_factor(self):
+        """The branching factor b of a uniform tree of the completed depth d
+        with as many nodes as were visited (b ** d = nodes).
+        """
+        if self.depth <= 0 or self.nodes <= 0:
+            return 0.
+        return self.nodes ** (1. / self.depth)
+
+    def as_dict(self):
+        record = {name: getattr(self, name) for name in SearchStats.FIELDS}
+        record["effective_branching_factor"] = self.effective_branching_factor
+        return record
+
+    def timed_score(self, score_fn):
+        """Wrap a score function so that its calls are counted as leaves and
+        timed; board operations made by the score function are attributed to
+        scoring rather than to the search.
+        """
+        @functools.wraps(score_fn)
+        def score(game, player):
+            self.leaves += 1
+            self._in_score = True
+            start = timer()
+            try:
+                return score_fn(game, player)
+            finally:
+                self.score_time += 1000 * (timer() - start)
+                self._in_score = False
+        return score
+
+
+class InstrumentedBoard:
+    """Proxy of an `isolation.Board` that counts the nodes made by the search
+    and times move generation and make/unmake operations. Every other
+    attribute is forwarded to the wrapped board.
+    """
+
+    def __init__(self, game, stats):
+        self._game = game
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._game, name)
+
+    def get_legal_moves(self, player=None):
+        if self._stats._in_score:
+            return self._game.get_legal_moves(player)
+        start = timer()
+        moves = self._game.get_legal_moves(player)
+        self._stats.movegen_time += 1000 * (timer() - start)
+        return moves
+
+    def apply_move(self, move):
+        if self._stats._in_score:
+            return self._game.apply_move(move)
+        self._stats.nodes += 1
+        start = timer()
+        self._game.apply_move(move)
+        self._stats.make_time += 1000 * (timer() - start)
+
+    def undo_move(self):
+        if self._stats._in_score:
+            return self._game.undo_move()
+        start = timer()
+        self._game.undo_move()
+        self._stats.make_time += 1000 * (timer() - start)
+
+    def forecast_move(self, move):
+        if self._stats._in_score:
+            return self._game.forecast_move(move)
+        self._stats.nodes += 1
+        start = timer()
+        new_game = self._game.forecast_move(move)
+        self._stats.make_time += 1000 * (timer() - start)
+        return InstrumentedBoard(new_game, self._stats)
+
+
+@contextmanager
+def recording(player, game):
+    """Record the SearchStats of one move of `player` if the player collects
+    stats. Yields the board the search should use (an InstrumentedBoard when
+    recording) and sets `player.current_stats` for the duration of the move.
+    """
+    if not getattr(player, "collect_stats", False):
+        yield game
+        return
+
+    stats = SearchStats()
+    score_fn = player.score
+    player.score = stats.timed_score(score_fn)
+    player.current_stats = stats
+    start = timer()
+    try:
+        yield InstrumentedBoard(game, stats)
+    finally:
+        stats.total_time = 1000 * (timer() - start)
+        player.score = score_fn
+        player.current_stats = None
+        player.move_stats.append(stats)
+
+
+def summarize(records):
+    """Summarize a list of SearchStats dictionaries (see SearchStats.as_dict)
+    as the number of moves, the mean nodes, depth and effective branching
+    factor per move, the search speed in nodes per second, and the fraction
+    of the search time spent in each phase.
+    """
+    if not records:
+        return {"moves": 0}
+    count = float(len(records))
+    total_time = sum(r["total_time"] for r in records)
+    nodes = sum(r["nodes"] for r in records)
+    summary = {
+        "moves": len(records),
+        "nodes": nodes / count,
+        "leaves": sum(r["leaves"] for r in records) / count,
+        "cutoffs": sum(r["cutoffs"] for r in records) / count,
+        "depth": sum(r["depth"] for r in records) / count,
+        "effective_branching_factor": sum(r["effective_branching_factor"] for r in records) / count,
+        "nodes_per_second": 1000 * nodes / total_time if total_time else 0.,
+    }
+    for phase in ("movegen", "make", "score"):
+        phase_time = sum(r[phase + "_time"] for r in records)
+        summary[phase + "_fraction"] = phase_time / total_time if total_time else 0.
+    return summary
@@ -0,0 +1,228 @@
+"""Generate self-play games for tuning the heuristics.
+
+Games between two agents (or an agent and a copy of itself) are played in a
+pool of worker processes and streamed to an append-only JSON lines file, one
+game per line, as they finish:
+
+    python selfplay.py --games 100000 --agent AlphaBetaPlayer:custom_score \\
+        --agent AlphaBetaPlayer:improved_score --budget depth:3 --processes 0 \\
+        --output games.jsonl
+
+Each line holds the seed of the game, the labels of the agents in seat order,
+the board size, the moves of the game (opening included) as cell indices
+`row + col * height`, the seat of the winner (0 for the first player) and the
+reason the game ended. The positions of a game are not stored: positions()
+replays them from the moves.
+
+Neither the generator nor the writer keeps finished games: games are handed
+to the workers in batches, and every record is yielded (and written) as soon
+as its game ends. Every game is played by players built afresh from their
+AgentSpec and seeded by the game seed, so with node or depth budgets (see
+budget.py) and unshuffled move lists a game can be replayed from its record.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+
+from collections import namedtuple
+
+from isolation import Board
+from budget import BudgetSpec, build_budget
+from game_agent import IsolationPlayer
+from tournament import (PLAYER_CLASSES, SCORE_FUNCTIONS, TIME_LIMIT, AgentSpec, build_player,
+                        worker_count)
+
+OPENING_PLIES = 2  # random moves played before the agents take over
+BATCH_SIZE = 256  # games handed to the worker pool at a time
+
+# A game to play: its seed, the indices of the agents in the first and
+# second seat, the number of random opening plies, the board size, the time
+# limit of every move in milliseconds, and whether legal moves are shuffled
+SelfPlayTask = namedtuple("SelfPlayTask", ["seed", "seats", "opening_plies", "width", "height",
+                                           "time_limit", "shuffle_moves"])
+
+# A finished game, as stored in the output file
+GameRecord = namedtuple("GameRecord", ["seed", "agents", "width", "height", "moves", "winner",
+                                       "termination"])
+
+
+def agent_label(spec):
+    """Return the label of an AgentSpec in game records, such as
+    "AlphaBetaPlayer:custom_score:depth=3".
+    """
+    label = spec.player_class
+    if spec.score_fn is not None:
+        label += ":" + spec.score_fn
+    if spec.budget is not None:
+        label += ":{}={}".format(*spec.budget)
+    return label
+
+
+def parse_agent(text, budget=None):
+    """Return the AgentSpec of an agent given as "PlayerClass[:score_fn]",
+    with an optional BudgetSpec that only applies to the minimax and
+    alpha-beta players. Raises a ValueError for unknown names.
+    """
+    player_class, _, score_fn = text.partition(":")
+    if player_class not in PLAYER_CLASSES:
+        raise ValueError("Unknown player class: {}".format(player_class))
+    if score_fn and score_fn not in SCORE_FUNCTIONS:
+        raise ValueError("Unknown score function: {}".format(score_fn))
+    if not issubclass(PLAYER_CLASSES[player_class], IsolationPlayer):
+        budget = None
+    return AgentSpec(player_class, score_fn or None, budget=budget)
+
+
+def play_game(specs, task):
+    """Play the game of a SelfPlayTask between new players built from the
+    AgentSpecs and return its GameRecord.
+    """
+    rng = random.Random(task.seed)
+    players = [build_player(specs[idx]) for idx in task.seats]
+    for player in players:
+        if hasattr(player, "rng"):
+            player.rng = random.Random(rng.getrandbits(32))
+    game = Board(players[0], players[1], task.width, task.height, rng=rng,
+                 shuffle_moves=task.shuffle_moves)
+    moves = []
+    for _ in range(task.opening_plies):
+        legal_moves = game.get_legal_moves()
+        if not legal_moves:
+            break
+        move = rng.choice(legal_moves)
+        game.apply_move(move)
+        moves.append(move)
+    winner, history, termination = game.play(time_limit=task.time_limit)
+    for player in players:
+        if hasattr(player, "stop_pondering"):
+            player.stop_pondering()
+    moves.extend(history)
+    return GameRecord(task.seed, [agent_label(specs[idx]) for idx in task.seats],
+                      task.width, task.height, [r + c * task.height for r, c in moves],
+                      int(winner == players[1]), termination)
+
+
+_worker_specs = None
+
+
+def _init_worker(specs):
+    global _worker_specs
+    _worker_specs = specs
+
+
+def _play_worker_game(task):
+    return play_game(_worker_specs, task)
+
+
+def self_play(specs, games, processes=1, seed=None, opening_plies=OPENING_PLIES, width=7,
+              height=7, time_limit=TIME_LIMIT, shuffle_moves=True, batch_size=BATCH_SIZE):
+    """Play games between the agents described by a list of one or two
+    AgentSpecs, alternating their seats, and yield the GameRecord of every
+    game as soon as it ends (in completion order when several processes are
+    used).
+
+    `seed` seeds the generator of the game seeds (None for a random one), and
+    `processes` is the number of worker processes (see
+    `tournament.worker_count`).
+    """
+    if not 1 <= len(specs) <= 2:
+        raise ValueError("Self-play needs one or two agents, not {}".format(len(specs)))
+    specs = list(specs) * (3 - len(specs))
+    rng = random.Random(seed)
+
+    def batches():
+        played = 0
+        while played < games:
+            batch = []
+            for idx in range(played, min(played + batch_size, games)):
+                seats = (0, 1) if idx % 2 == 0 else (1, 0)
+                batch.append(SelfPlayTask(rng.getrandbits(32), seats, opening_plies, width,
+                                          height, time_limit, shuffle_moves))
+            played += len(batch)
+            yield batch
+
+    processes = worker_count(processes)
+    if processes <= 1:
+        for batch in batches():
+            for task in batch:
+                yield play_game(specs, task)
+        return
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(specs,)) as pool:
+        for batch in batches():
+            yield from pool.imap_unordered(_play_worker_game, batch)
+
+
+def write_games(records, path):
+    """Append GameRecords to a JSON lines file as they are produced and
+    return the number of games written.
+    """
+    count = 0
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record._asdict(), separators=(",", ":")) + "\n")
+            f.flush()
+            count += 1
+    return count
+
+
+def read_games(path):
+    """Yield the GameRecords of a JSON lines file one at a time."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield GameRecord(**json.loads(line))
+
+
+def positions(record, board_class=Board):
+    """Replay a game and yield, before every move, the board, the move
+    played and the outcome for the player to move (1 for a win, -1 for a
+    loss). The players are Board.PLAYER_1 and Board.PLAYER_2.
+
+    The same board object is yielded at every step and updated in place
+    once the consumer asks for the next position; copy it to keep it.
+    """
+    game = board_class(Board.PLAYER_1, Board.PLAYER_2, record.width, record.height,
+                       shuffle_moves=False)
+    for ply, cell in enumerate(record.moves):
+        move = (cell % record.height, cell // record.height)
+        yield game, move, 1 if ply % 2 == record.winner else -1
+        game.apply_move(move)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agent", action="append", required=True,
+                        help="PlayerClass[:score_fn]; give once for self-play or twice for "
+                             "a match between two agents")
+    parser.add_argument("--budget",
+                        help="search budget of the agents as kind:limit, e.g. depth:3 or "
+                             "nodes:2000 (default: the wall clock)")
+    parser.add_argument("--games", type=int, required=True)
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes; 0 for one per CPU (default: %(default)s)")
+    parser.add_argument("--seed", type=int, help="seed of the game seeds (default: random)")
+    parser.add_argument("--opening-plies", type=int, default=OPENING_PLIES)
+    parser.add_argument("--time-limit", type=float, default=TIME_LIMIT,
+                        help="milliseconds per move (default: %(default)s)")
+    parser.add_argument("--no-shuffle", action="store_true",
+                        help="list legal moves in a fixed order, so that games with node or "
+                             "depth budgets can be replayed exactly")
+    parser.add_argument("--output", required=True, help="JSON lines file to append the games to")
+    args = parser.parse_args()
+
+    budget = None
+    if args.budget:
+        kind, _, limit = args.budget.partition(":")
+        budget = BudgetSpec(kind, int(limit) if limit else None)
+        build_budget(budget)  # validate the budget before starting the workers
+    specs = [parse_agent(agent, budget) for agent in args.agent]
+    records = self_play(specs, args.games, args.processes, args.seed, args.opening_plies,
+                        time_limit=args.time_limit, shuffle_moves=not args.no_shuffle)
+    count = write_games(records, args.output)
+    print("Wrote {} games to {}".format(count, args.output))
+
+
+if __name__ == "__main__":
+    main()
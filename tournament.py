@@ -11,20 +11,44 @@ players, and the players play each match twice -- once as the first player and
 once as the second player.  Randomizing the openings and switching the player
 order corrects for imbalances due to both starting position and initiative.
 """
+import inspect
 import itertools
+import math
+import multiprocessing
+import os
 import random
 import warnings
 
 from collections import namedtuple
 
 from isolation import Board
-from sample_players import (RandomPlayer, open_move_score,
-                            improved_score, center_score)
+from sample_players import (RandomPlayer, GreedyPlayer, null_score,
+                            open_move_score, improved_score, center_score)
 from game_agent import (MinimaxPlayer, AlphaBetaPlayer, custom_score,
                         custom_score_2, custom_score_3)
+from budget import BudgetSpec, WallClock, budget_spec, build_budget
+from mcts import MCTSPlayer
+from parallel_search import available_cpus
+from search_stats import summarize
 
 NUM_MATCHES = 10  # number of matches against each opponent
 TIME_LIMIT = 150  # number of milliseconds before timeout
+SEED = None  # random seed to replay a tournament exactly; None for a new one
+PROCESSES = 1  # number of games played in parallel; 0 for one per CPU
+WORKER_ADDRESSES = []  # (host, port) of match_server.py workers to play on
+COLLECT_STATS = False  # record and summarize the search stats of the test agents
+RATINGS_DB = None  # SQLite file to record every game and Elo rating in (see ratings.py)
+
+# Sequential probability ratio test mode: instead of NUM_MATCHES matches per
+# opponent, keep playing matches against an opponent until the test decides
+# whether the test agent is SPRT_ELO0 or SPRT_ELO1 Elo stronger than it, with
+# error rates SPRT_ALPHA and SPRT_BETA, or SPRT_MAX_MATCHES have been played
+SPRT = False
+SPRT_ELO0 = 0.
+SPRT_ELO1 = 100.
+SPRT_ALPHA = 0.05
+SPRT_BETA = 0.05
+SPRT_MAX_MATCHES = 200
 
 DESCRIPTION = """
 This script evaluates the performance of the custom_score evaluation
@@ -36,50 +60,287 @@ game_agent.py.
 
 Agent = namedtuple("Agent", ["player", "name"])
 
-
-def play_round(cpu_agent, test_agents, win_counts, num_matches):
+# A serializable description of an agent, used to rebuild an equivalent player
+# in worker processes: the names of the player class and score function, the
+# search depth and timeout passed to the constructor (None for defaults),
+# whether the player collects search statistics, the BudgetSpec of its search
+# budget (None for the default), the size of its evaluation cache, and the
+# (name, value) pairs of its other constructor arguments (see PLAYER_OPTIONS)
+AgentSpec = namedtuple("AgentSpec", ["player_class", "score_fn", "search_depth", "timeout",
+                                     "collect_stats", "budget", "eval_cache_size", "options"])
+AgentSpec.__new__.__defaults__ = (None, None, None, False, None, 0, ())
+
+PLAYER_CLASSES = {cls.__name__: cls for cls in
+                  (RandomPlayer, GreedyPlayer, MinimaxPlayer, AlphaBetaPlayer, MCTSPlayer)}
+
+# The constructor arguments of each player class held by AgentSpec.options
+# when they differ from their defaults, read from the player attributes of the
+# same name (an opening book is held by its path)
+PLAYER_OPTIONS = {
+    "AlphaBetaPlayer": ("tt_size_mb", "tt_replacement", "tt_keep_across_turns", "batch_leaves",
+                        "ponder", "ponder_limit", "solve_endgames", "search_processes",
+                        "opening_book"),
+    "MCTSPlayer": ("exploration", "reuse_tree", "solve_endgames"),
+}
+
+SCORE_FUNCTIONS = {fn.__name__: fn for fn in
+                   (null_score, open_move_score, improved_score, center_score,
+                    custom_score, custom_score_2, custom_score_3)}
+
+# A single game: the indices of the two agents in the round (player_1 moves
+# first), the two opening moves, and the seed of the board's generator
+Match = namedtuple("Match", ["player_1", "player_2", "opening", "seed", "shuffle_moves"])
+
+# The state of the SPRT of a test agent against an opponent: the games won
+# and lost by the test agent, the log-likelihood ratio of the results, and
+# the decision ("H1" if the test agent is at least elo1 stronger, "H0" if it
+# is at most elo0 stronger, None while undecided)
+SprtState = namedtuple("SprtState", ["wins", "losses", "llr", "decision"])
+
+
+def play_round(cpu_agent, test_agents, win_counts, num_matches, rng=random,
+               shuffle_moves=True, processes=1, addresses=(), search_stats=None, ratings=None):
     """Compare the test agents to the cpu agent in "fair" matches.
 
     "Fair" matches use random starting locations and force the agents to
     play as both first and second player to control for advantages resulting
     from choosing better opening moves or having first initiative to move.
+
+    The opening moves and a seed for every game are drawn from `rng` before
+    any game is played, and each board draws from its own generator seeded
+    with the game seed, so a seeded `rng` (with `shuffle_moves=False`)
+    replays the same games whether they run in one process, in a pool of
+    `processes` worker processes, or on remote workers (see run_matches).
+
+    If `search_stats` is a dictionary, the search statistics recorded by the
+    players that collect them are appended to `search_stats[player]`. If
+    `ratings` is a `ratings.RatingStore`, every game is recorded in it.
     """
-    timeout_count = 0
-    forfeit_count = 0
+    agents = [cpu_agent] + list(test_agents)
+    matches = []
     for _ in range(num_matches):
 
-        games = sum([[Board(cpu_agent.player, agent.player),
-                      Board(agent.player, cpu_agent.player)]
-                    for agent in test_agents], [])
-
         # initialize all games with a random move and response
+        game = Board(cpu_agent.player, test_agents[0].player)
+        opening = []
         for _ in range(2):
-            move = random.choice(games[0].get_legal_moves())
-            for game in games:
-                game.apply_move(move)
+            move = rng.choice(game.get_legal_moves())
+            game.apply_move(move)
+            opening.append(move)
+
+        for idx in range(1, len(agents)):
+            matches.append(Match(0, idx, tuple(opening), rng.getrandbits(32), shuffle_moves))
+            matches.append(Match(idx, 0, tuple(opening), rng.getrandbits(32), shuffle_moves))
+
+    # play all games and tally the results
+    timeout_count = 0
+    forfeit_count = 0
+    results = run_matches(agents, matches, processes, addresses)
+    if ratings is not None:
+        record_games(ratings, agents, matches, results)
+    for match, (winner_idx, termination, move_stats, _) in zip(matches, results):
+        winner = agents[match[winner_idx]].player
+        win_counts[winner] += 1
 
-        # play all games and tally the results
-        for game in games:
-            winner, _, termination = game.play(time_limit=TIME_LIMIT)
-            win_counts[winner] += 1
+        if search_stats is not None:
+            for agent_idx, records in zip(match[:2], move_stats):
+                search_stats.setdefault(agents[agent_idx].player, []).extend(records)
 
         if termination == "timeout":
             timeout_count += 1
-        elif winner not in test_agents and termination == "forfeit":
+        elif winner == cpu_agent.player and termination == "forfeit":
             forfeit_count += 1
 
     return timeout_count, forfeit_count
 
 
+def _registered(registry, obj):
+    """Test whether a class or function is registered by name, comparing the
+    defining module rather than identity so that reloaded modules match.
+    """
+    entry = registry.get(getattr(obj, "__name__", None))
+    return entry is not None and entry.__module__ == obj.__module__
+
+
+def agent_spec(player):
+    """Return the AgentSpec of a player. Raises a ValueError if the player
+    class or its score function is not registered in PLAYER_CLASSES or
+    SCORE_FUNCTIONS, or if the player draws from a random number generator of
+    its own, which a spec cannot hold.
+    """
+    name = type(player).__name__
+    if not _registered(PLAYER_CLASSES, type(player)):
+        raise ValueError("Unregistered player class: {}".format(name))
+    if getattr(player, "rng", None) not in (None, random):
+        raise ValueError("The random number generator of a {} cannot be held by an "
+                         "AgentSpec".format(name))
+    defaults = inspect.signature(type(player)).parameters
+    options = []
+    for option in PLAYER_OPTIONS.get(name, ()):
+        value = getattr(player, option)
+        if option == "opening_book" and value is not None:
+            value = value.path
+        if value != defaults[option].default:
+            options.append((option, value))
+    score_fn = getattr(player, "score", None)
+    if score_fn is not None:
+        if not _registered(SCORE_FUNCTIONS, score_fn):
+            raise ValueError("Unregistered score function: {!r}".format(score_fn))
+        score_fn = score_fn.__name__
+    budget = getattr(player, "budget", None)
+    if budget is not None:
+        budget = None if isinstance(budget, WallClock) else budget_spec(budget)
+    return AgentSpec(name, score_fn, getattr(player, "search_depth", None),
+                     getattr(player, "TIMER_THRESHOLD", None),
+                     getattr(player, "collect_stats", False), budget,
+                     getattr(player, "eval_cache_size", 0), tuple(options))
+
+
+def spec_from_json(values):
+    """Return the AgentSpec of the list of values of a spec decoded from
+    JSON, which holds lists where the spec holds tuples.
+    """
+    spec = AgentSpec(*values)
+    return spec._replace(budget=None if spec.budget is None else BudgetSpec(*spec.budget),
+                         options=tuple(tuple(option) for option in spec.options))
+
+
+def build_player(spec):
+    """Construct a new player from an AgentSpec."""
+    kwargs = {}
+    if spec.score_fn is not None:
+        kwargs["score_fn"] = SCORE_FUNCTIONS[spec.score_fn]
+    if spec.search_depth is not None:
+        kwargs["search_depth"] = spec.search_depth
+    if spec.timeout is not None:
+        kwargs["timeout"] = spec.timeout
+    if spec.collect_stats:
+        kwargs["collect_stats"] = True
+    if spec.budget is not None:
+        kwargs["budget"] = build_budget(spec.budget)
+    if spec.eval_cache_size:
+        kwargs["eval_cache_size"] = spec.eval_cache_size
+    kwargs.update(spec.options)
+    return PLAYER_CLASSES[spec.player_class](**kwargs)
+
+
+def play_match(players, match):
+    """Play a single game between two of the players.
+
+    Returns
+    -------
+    (int, str, list, list)
+        The index of the winner in the match (0 for player_1, 1 for
+        player_2), the reason the game ended, the search statistics recorded
+        by each player during the game (a list of `SearchStats.as_dict()`
+        records per player; empty for players that do not collect stats),
+        and the milliseconds taken by every move after the opening.
+    """
+    player_1 = players[match.player_1]
+    player_2 = players[match.player_2]
+    starts = [len(getattr(player, "move_stats", ())) for player in (player_1, player_2)]
+    game = Board(player_1, player_2, rng=random.Random(match.seed),
+                 shuffle_moves=match.shuffle_moves)
+    for move in match.opening:
+        game.apply_move(move)
+    move_times = []
+    winner, _, termination = game.play(time_limit=TIME_LIMIT, move_times=move_times)
+    for player in (player_1, player_2):
+        if hasattr(player, "stop_pondering"):
+            player.stop_pondering()
+    move_stats = [[stats.as_dict() for stats in getattr(player, "move_stats", ())[start:]]
+                  for player, start in zip((player_1, player_2), starts)]
+    return int(winner == player_2), termination, move_stats, move_times
+
+
+def worker_count(processes):
+    """Return the number of worker processes to use for a requested count.
+
+    Every worker needs a core of its own, or the agents lose search time to
+    each other and the per-move time limit stops being fair, so the count is
+    capped at the number of CPUs available to this process. A request of 0
+    (or less) uses every available CPU.
+    """
+    available = available_cpus()
+    if processes <= 0:
+        return available
+    return min(processes, available)
+
+
+_worker_players = None
+
+
+def _init_worker(specs, counter):
+    """Build the players in a new worker process and pin the process to a CPU
+    of its own where the platform supports it.
+    """
+    global _worker_players
+    _worker_players = [build_player(spec) for spec in specs]
+    if hasattr(os, "sched_setaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        with counter.get_lock():
+            worker_idx = counter.value
+            counter.value += 1
+        os.sched_setaffinity(0, [cpus[worker_idx % len(cpus)]])
+
+
+def _play_worker_match(match):
+    return play_match(_worker_players, match)
+
+
+def run_matches(agents, matches, processes=1, addresses=()):
+    """Play a list of matches and return their results in the same order,
+    either in this process, in a pool of worker processes, or on the
+    match_server.py workers listening at `addresses`. Workers rebuild the
+    players from their AgentSpec, so only registered agents can be sent to
+    workers.
+    """
+    players = [agent.player for agent in agents]
+    if addresses:
+        # imported here because match_server imports this module
+        from match_server import run_remote_matches
+        return run_remote_matches(addresses, [agent_spec(p) for p in players], matches)
+
+    processes = worker_count(processes)
+    if processes <= 1:
+        return [play_match(players, match) for match in matches]
+
+    if any(getattr(player, "ponder", False) for player in players):
+        warnings.warn("Pondering is disabled in the worker processes, which are pinned "
+                      "to one CPU each")
+    counter = multiprocessing.Value("i", 0)
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+                              initargs=([agent_spec(p) for p in players], counter)) as pool:
+        return pool.map(_play_worker_match, matches, chunksize=1)
+
+
+def record_games(ratings, agents, matches, results):
+    """Record the results of a list of matches in a `ratings.RatingStore`
+    under the names of the agents, with their AgentSpecs when registered.
+    """
+    specs = []
+    for agent in agents:
+        try:
+            specs.append(agent_spec(agent.player))
+        except ValueError:
+            specs.append(None)
+    for match, (winner_idx, termination, _, move_times) in zip(matches, results):
+        seats = match[:2]
+        ratings.record_game([agents[idx].name for idx in seats], match.opening, winner_idx,
+                            termination, move_times, match.seed, [specs[idx] for idx in seats])
+
+
 def update(total_wins, wins):
     for player in total_wins:
         total_wins[player] += wins[player]
     return total_wins
 
 
-def play_matches(cpu_agents, test_agents, num_matches):
+def play_matches(cpu_agents, test_agents, num_matches, rng=random,
+                 shuffle_moves=True, processes=1, addresses=(), ratings=None):
     """Play matches between the test agent and each cpu_agent individually. """
     total_wins = {agent.player: 0 for agent in test_agents}
+    search_stats = {}
     total_timeouts = 0.
     total_forfeits = 0.
     total_matches = 2 * num_matches * len(cpu_agents)
@@ -99,7 +360,8 @@ def play_matches(cpu_agents, test_agents, num_matches):
 
         print("{!s:^9}{:^13}".format(idx + 1, agent.name), end="", flush=True)
 
-        counts = play_round(agent, test_agents, wins, num_matches)
+        counts = play_round(agent, test_agents, wins, num_matches, rng, shuffle_moves, processes,
+                            addresses, search_stats, ratings)
         total_timeouts += counts[0]
         total_forfeits += counts[1]
         total_wins = update(total_wins, wins)
@@ -125,16 +387,154 @@ def play_matches(cpu_agents, test_agents, num_matches):
         print(("\nYour ID search forfeited {} games while there were still " +
                "legal moves available to play.\n").format(total_forfeits))
 
+    if search_stats:
+        print_search_stats(cpu_agents + test_agents, search_stats)
+
+
+def print_search_stats(agents, search_stats):
+    """Print a summary of the search statistics collected for each agent."""
+    print("\n{:^13}{:>7}{:>10}{:>7}{:>7}{:>9}{:>9}{:>7}{:>7}".format(
+        "Agent", "Moves", "Nodes", "Depth", "EBF", "kNodes/s", "MoveGen", "Make", "Score"))
+    for agent in agents:
+        records = search_stats.get(agent.player)
+        if not records:
+            continue
+        summary = summarize(records)
+        print("{:^13}{:>7}{:>10.0f}{:>7.2f}{:>7.2f}{:>9.1f}{:>8.0%}{:>7.0%}{:>7.0%}".format(
+            agent.name, summary["moves"], summary["nodes"], summary["depth"],
+            summary["effective_branching_factor"], summary["nodes_per_second"] / 1000,
+            summary["movegen_fraction"], summary["make_fraction"], summary["score_fraction"]))
+
+
+def elo_to_score(elo):
+    """Return the expected score of a player `elo` points stronger than its
+    opponent.
+    """
+    return 1. / (1. + 10 ** (-elo / 400.))
+
+
+def score_to_elo(score):
+    """Return the Elo difference corresponding to an expected score, which
+    is infinite for a score of 0 or 1.
+    """
+    if score <= 0.:
+        return float("-inf")
+    if score >= 1.:
+        return float("inf")
+    return -400. * math.log10(1. / score - 1.)
+
+
+def elo_interval(wins, games, z=1.96):
+    """Return the Elo difference estimated from a number of wins in a number
+    of games, with the bounds of its confidence interval (95% for z=1.96)
+    derived from the Wilson score interval of the win rate.
+    """
+    if games == 0:
+        return 0., float("-inf"), float("inf")
+    rate = float(wins) / games
+    center = (rate + z * z / (2 * games)) / (1 + z * z / games)
+    margin = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+    return score_to_elo(rate), score_to_elo(center - margin), score_to_elo(center + margin)
+
+
+def sprt_update(state, wins, losses, elo0=SPRT_ELO0, elo1=SPRT_ELO1, alpha=SPRT_ALPHA,
+                beta=SPRT_BETA):
+    """Return the SprtState after adding wins and losses of the test agent.
+
+    Isolation games cannot be drawn, so every game is a Bernoulli trial won
+    with probability elo_to_score(elo0) under H0 and elo_to_score(elo1)
+    under H1. H1 is accepted once the log-likelihood ratio reaches
+    log((1 - beta) / alpha), and H0 once it falls to log(beta / (1 - alpha)).
+    """
+    p0, p1 = elo_to_score(elo0), elo_to_score(elo1)
+    wins, losses = state.wins + wins, state.losses + losses
+    llr = wins * math.log(p1 / p0) + losses * math.log((1 - p1) / (1 - p0))
+    decision = None
+    if llr >= math.log((1 - beta) / alpha):
+        decision = "H1"
+    elif llr <= math.log(beta / (1 - alpha)):
+        decision = "H0"
+    return SprtState(wins, losses, llr, decision)
+
+
+def play_sprt(cpu_agents, test_agents, rng=random, shuffle_moves=True, processes=1,
+              addresses=(), elo0=SPRT_ELO0, elo1=SPRT_ELO1, alpha=SPRT_ALPHA, beta=SPRT_BETA,
+              max_matches=SPRT_MAX_MATCHES, ratings=None):
+    """Run a sequential probability ratio test for every pair of a test agent
+    and a cpu agent.
+
+    Games are played in rounds: every round plays one "fair" match (the same
+    random opening from either seat) for each pair still undecided, all of
+    them at once across the workers, and a pair stops as soon as its test is
+    decided or it has played `max_matches` matches. If `ratings` is a
+    `ratings.RatingStore`, every game is recorded in it.
+
+    Returns
+    -------
+    dict
+        The final SprtState of each (test agent index, cpu agent index) pair.
+    """
+    agents = list(test_agents) + list(cpu_agents)
+    states = {(t, c): SprtState(0, 0, 0., None)
+              for t in range(len(test_agents)) for c in range(len(cpu_agents))}
+    for _ in range(max_matches):
+        pending = [pair for pair, state in states.items() if state.decision is None]
+        if not pending:
+            break
+        matches = []
+        for t, c in pending:
+            game = Board(Board.PLAYER_1, Board.PLAYER_2)
+            opening = []
+            for _ in range(2):
+                move = rng.choice(game.get_legal_moves())
+                game.apply_move(move)
+                opening.append(move)
+            cpu_idx = len(test_agents) + c
+            matches.append(Match(t, cpu_idx, tuple(opening), rng.getrandbits(32), shuffle_moves))
+            matches.append(Match(cpu_idx, t, tuple(opening), rng.getrandbits(32), shuffle_moves))
+        results = run_matches(agents, matches, processes, addresses)
+        if ratings is not None:
+            record_games(ratings, agents, matches, results)
+        for idx, pair in enumerate(pending):
+            wins = sum(int(match[winner_idx] == pair[0]) for match, (winner_idx, _, _, _)
+                       in zip(matches[2 * idx:2 * idx + 2], results[2 * idx:2 * idx + 2]))
+            states[pair] = sprt_update(states[pair], wins, 2 - wins, elo0, elo1, alpha, beta)
+    return states
+
+
+def print_sprt(cpu_agents, test_agents, states, elo0=SPRT_ELO0, elo1=SPRT_ELO1):
+    """Print the result of the SPRT of every pair with the Elo difference of
+    the test agent and its 95% confidence interval.
+    """
+    print("\n{:^13}{:^13}{:>6}{:>6}{:>8}{:>9}{:^20}  {}".format(
+        "Agent", "Opponent", "Won", "Lost", "LLR", "Elo", "95% interval", "Result"))
+    for (t, c), state in sorted(states.items()):
+        elo, low, high = elo_interval(state.wins, state.wins + state.losses)
+        if state.decision == "H1":
+            result = "stronger by >= {:g} Elo".format(elo1)
+        elif state.decision == "H0":
+            result = "not stronger by > {:g} Elo".format(elo0)
+        else:
+            result = "undecided"
+        print("{:^13}{:^13}{:>6}{:>6}{:>8.2f}{:>9.0f}  [{:>7.0f}, {:>7.0f}]  {}".format(
+            test_agents[t].name, cpu_agents[c].name, state.wins, state.losses, state.llr,
+            elo, low, high, result))
+
 
 def main():
 
+    # A fixed seed makes the openings, the random agent (which draws from the
+    # board's generator) and the move order of every board reproducible
+    rng = random if SEED is None else random.Random(SEED)
+    shuffle_moves = SEED is None
+
     # Define two agents to compare -- these agents will play from the same
     # starting position against the same adversaries in the tournament
     test_agents = [
-        Agent(AlphaBetaPlayer(score_fn=improved_score), "AB_Improved"),
-        Agent(AlphaBetaPlayer(score_fn=custom_score), "AB_Custom"),
-        Agent(AlphaBetaPlayer(score_fn=custom_score_2), "AB_Custom_2"),
-        Agent(AlphaBetaPlayer(score_fn=custom_score_3), "AB_Custom_3")
+        Agent(AlphaBetaPlayer(score_fn=improved_score, collect_stats=COLLECT_STATS), "AB_Improved"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score, collect_stats=COLLECT_STATS), "AB_Custom"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score_2, collect_stats=COLLECT_STATS), "AB_Custom_2"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score_3, collect_stats=COLLECT_STATS), "AB_Custom_3")
     ]
 
     # Define a collection of agents to compete against the test agents
@@ -152,7 +552,23 @@ def main():
     print("{:^74}".format("*************************"))
     print("{:^74}".format("Playing Matches"))
     print("{:^74}".format("*************************"))
-    play_matches(cpu_agents, test_agents, NUM_MATCHES)
+
+    ratings = None
+    if RATINGS_DB is not None:
+        # imported here because ratings imports this module
+        from ratings import RatingStore
+        ratings = RatingStore(RATINGS_DB)
+    try:
+        if SPRT:
+            states = play_sprt(cpu_agents, test_agents, rng, shuffle_moves, PROCESSES,
+                               WORKER_ADDRESSES, ratings=ratings)
+            print_sprt(cpu_agents, test_agents, states)
+        else:
+            play_matches(cpu_agents, test_agents, NUM_MATCHES, rng, shuffle_moves, PROCESSES,
+                         WORKER_ADDRESSES, ratings)
+    finally:
+        if ratings is not None:
+            ratings.close()
 
 
 if __name__ == "__main__":
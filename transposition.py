@@ -0,0 +1,247 @@
+"""This file contains a fixed-size transposition table used by the search
+agents in game_agent.py to reuse the results of positions that were already
+searched, either earlier in the same iterative deepening pass, in a shallower
+pass, or (optionally) during an earlier turn of the same game.
+
+Positions are keyed by the 64-bit Zobrist key of the board (see
+`isolation.Board.zobrist_key`).
+
+`SharedTranspositionTable` keeps its entries in shared memory instead, so
+that the processes of a parallel search (see parallel_search.py) can share
+one table.
+"""
+import multiprocessing
+import struct
+
+from collections import namedtuple
+
+# Bound types of a stored value
+EXACT = 0
+LOWER = 1  # the true value is at least the stored value (fail high)
+UPPER = 2  # the true value is at most the stored value (fail low)
+
+# Replacement schemes used when two positions map to the same slot
+DEPTH_PREFERRED = "depth"
+ALWAYS_REPLACE = "always"
+
+# Approximate number of bytes used by one occupied slot (entry tuple, key,
+# value and slot reference) used to size the table from a memory budget
+ENTRY_BYTES = 192
+
+Entry = namedtuple("Entry", ["key", "depth", "value", "bound", "move", "generation"])
+
+
+class TranspositionTable:
+    """Fixed-size hash table of search results.
+
+    Parameters
+    ----------
+    size_mb : float (optional)
+        Upper bound on the memory used by the table, in megabytes. The number
+        of slots is the largest power of two that fits in the budget.
+
+    replacement : str (optional)
+        Either DEPTH_PREFERRED, which keeps the deeper of two colliding
+        entries unless the stored one is left over from an earlier search, or
+        ALWAYS_REPLACE, which always keeps the newest entry.
+    """
+
+    def __init__(self, size_mb=16, replacement=DEPTH_PREFERRED):
+        if replacement not in (DEPTH_PREFERRED, ALWAYS_REPLACE):
+            raise ValueError("Unknown replacement scheme: {}".format(replacement))
+        capacity = max(1, int(size_mb * 2 ** 20) // ENTRY_BYTES)
+        self.capacity = 1 << (capacity.bit_length() - 1)
+        self.replacement = replacement
+        self._mask = self.capacity - 1
+        self.clear()
+
+    def clear(self):
+        """Remove every entry and reset the statistics."""
+        self._slots = [None] * self.capacity
+        self._generation = 0
+        self.used = 0
+        self.probes = 0
+        self.hits = 0
+        self.cutoffs = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        """Mark the entries stored so far as belonging to an earlier search so
+        that the depth-preferred scheme can replace them.
+        """
+        self._generation += 1
+
+    def probe(self, key):
+        """Return the entry stored for the given key, or None."""
+        self.probes += 1
+        entry = self._slots[key & self._mask]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, value, bound, move):
+        """Store a search result, subject to the replacement scheme.
+
+        Parameters
+        ----------
+        key : int
+            The Zobrist key of the position.
+
+        depth : int
+            The number of plies searched below the position.
+
+        value : float
+            The value of the position from the searching player's view.
+
+        bound : int
+            One of EXACT, LOWER or UPPER.
+
+        move : (int, int) or None
+            The best move found in the position.
+        """
+        idx = key & self._mask
+        old = self._slots[idx]
+        if old is None:
+            self.used += 1
+        elif old.key != key:
+            if (self.replacement == DEPTH_PREFERRED and
+                    old.generation == self._generation and old.depth > depth):
+                return
+            self.overwrites += 1
+        self.stores += 1
+        self._slots[idx] = Entry(key, depth, value, bound, move, self._generation)
+
+    def stats(self):
+        """Return a dictionary of usage statistics: the number of probes, hits
+        and cutoffs, the hit rate, and the fraction of slots in use.
+        """
+        return {
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": float(self.hits) / self.probes if self.probes else 0.,
+            "cutoffs": self.cutoffs,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "occupancy": float(self.used) / self.capacity,
+        }
+
+
+# Layout of a slot of the shared table: the key XORed with the data words
+# (so that a slot torn by two concurrent writers reads as a miss), then the
+# value, depth, bound + 1 (0 for an empty slot), move and generation
+SHARED_KEY = struct.Struct("<Q")
+SHARED_DATA = struct.Struct("<dhhhH")
+SHARED_WORDS = struct.Struct("<QQ")
+SHARED_SLOT_BYTES = SHARED_KEY.size + SHARED_DATA.size
+SHARED_HEADER_BYTES = 16  # the generation counter and the number of slots in use
+NO_MOVE = -1
+
+
+def _encode_move(move):
+    return NO_MOVE if move is None else (move[0] << 8) | move[1]
+
+
+def _decode_move(code):
+    return None if code == NO_MOVE else (code >> 8, code & 0xff)
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """Transposition table stored in a shared memory array. Child processes
+    started with the table as an argument read and write the same entries
+    without locking; the statistics are counted separately in each process.
+
+    Parameters
+    ----------
+    size_mb : float (optional)
+        Upper bound on the size of the shared array, in megabytes.
+
+    replacement : str (optional)
+        Either DEPTH_PREFERRED or ALWAYS_REPLACE (see TranspositionTable).
+    """
+
+    def __init__(self, size_mb=16, replacement=DEPTH_PREFERRED):
+        if replacement not in (DEPTH_PREFERRED, ALWAYS_REPLACE):
+            raise ValueError("Unknown replacement scheme: {}".format(replacement))
+        capacity = max(1, int(size_mb * 2 ** 20) // SHARED_SLOT_BYTES)
+        self.capacity = 1 << (capacity.bit_length() - 1)
+        self.replacement = replacement
+        self._mask = self.capacity - 1
+        self._array = multiprocessing.RawArray(
+            "B", SHARED_HEADER_BYTES + self.capacity * SHARED_SLOT_BYTES)
+        self._buffer = memoryview(self._array).cast("B")
+        self.clear()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["_buffer"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffer = memoryview(self._array).cast("B")
+
+    def clear(self):
+        """Remove every entry and reset the statistics of this process."""
+        self._buffer[:] = bytes(len(self._buffer))
+        self.probes = 0
+        self.hits = 0
+        self.cutoffs = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def _generation(self):
+        return SHARED_KEY.unpack_from(self._buffer, 0)[0]
+
+    def new_search(self):
+        SHARED_KEY.pack_into(self._buffer, 0, (self._generation + 1) & 0xffff)
+
+    @property
+    def used(self):
+        # counted without locking, so two processes filling slots at the same
+        # time may lose an increment
+        return min(SHARED_KEY.unpack_from(self._buffer, SHARED_KEY.size)[0], self.capacity)
+
+    def _read(self, idx):
+        """Return the (key, data) of a slot, or None if the slot is empty."""
+        offset = SHARED_HEADER_BYTES + idx * SHARED_SLOT_BYTES
+        data = bytes(self._buffer[offset + SHARED_KEY.size:offset + SHARED_SLOT_BYTES])
+        value, depth, bound, move, generation = SHARED_DATA.unpack(data)
+        if not bound:
+            return None
+        low, high = SHARED_WORDS.unpack(data)
+        key = SHARED_KEY.unpack_from(self._buffer, offset)[0] ^ low ^ high
+        return Entry(key, depth, value, bound - 1, _decode_move(move), generation)
+
+    def probe(self, key):
+        """Return the entry stored for the given key, or None."""
+        self.probes += 1
+        entry = self._read(key & self._mask)
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, value, bound, move):
+        """Store a search result, subject to the replacement scheme (see
+        TranspositionTable.store).
+        """
+        idx = key & self._mask
+        generation = self._generation
+        old = self._read(idx)
+        if old is None:
+            SHARED_KEY.pack_into(self._buffer, SHARED_KEY.size,
+                                 SHARED_KEY.unpack_from(self._buffer, SHARED_KEY.size)[0] + 1)
+        elif old.key != key:
+            if (self.replacement == DEPTH_PREFERRED and
+                    old.generation == generation and old.depth > depth):
+                return
+            self.overwrites += 1
+        self.stores += 1
+        data = SHARED_DATA.pack(value, depth, bound + 1, _encode_move(move), generation)
+        low, high = SHARED_WORDS.unpack(data)
+        offset = SHARED_HEADER_BYTES + idx * SHARED_SLOT_BYTES
+        SHARED_KEY.pack_into(self._buffer, offset, key ^ low ^ high)
+        self._buffer[offset + SHARED_KEY.size:offset + SHARED_SLOT_BYTES] = data
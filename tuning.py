@@ -0,0 +1,277 @@
+"""Tune the weights of the custom heuristics by playing games.
+
+The custom heuristics of game_agent.py take their weights as keyword
+arguments (see PARAMETERS), so a candidate is a heuristic name and a
+dictionary of weights. A candidate is scored by the fraction of games won by
+an alpha-beta player using it against a reference alpha-beta player (with
+the improved_score heuristic by default) from a fixed set of seeded openings,
+each played once from either seat. Both players search a fixed number of
+nodes per move (see budget.py), so the score of a candidate does not depend
+on the speed or load of the machine and can be cached.
+
+All the games of a batch of candidates are played in a pool of worker
+processes. Every score is appended to a JSON lines cache file as soon as it
+is known, keyed by the heuristic, the weights and the settings of the games,
+so an interrupted run started again with the same arguments skips the
+candidates it has already scored:
+
+    python tuning.py custom_score_2 --method spsa --iterations 30 --games 40 \\
+        --nodes 1000 --processes 0 --cache tuning_cache.jsonl
+
+Two search methods are available: a grid over given values of each weight,
+and SPSA (simultaneous perturbation stochastic approximation), which
+estimates the gradient of the score from two candidates per iteration
+whatever the number of weights.
+
+Tuned weights only use the scalar heuristics: the vectorized versions in
+batch_eval.py implement the default weights.
+"""
+import argparse
+import functools
+import itertools
+import json
+import multiprocessing
+import os
+import random
+
+from collections import namedtuple
+
+import game_agent
+
+from isolation import Board
+from budget import NodeLimit
+from tournament import SCORE_FUNCTIONS, worker_count
+
+# A tunable weight: its keyword argument in the heuristic, its default value
+# and the bounds of the values tried
+Parameter = namedtuple("Parameter", ["name", "default", "low", "high"])
+
+PARAMETERS = {
+    "custom_score": [Parameter("opponent_weight", 0.5, 0., 2.)],
+    "custom_score_2": [Parameter("center_weight", 0.2, 0., 1.),
+                       Parameter("opening_rate", 0.1, 0., 0.5),
+                       Parameter("midgame_rate", 0.3, 0., 0.8),
+                       Parameter("opponent_weight", 0.5, 0., 2.)],
+    "custom_score_3": [Parameter("opponent_weight", 0.5, 0., 2.),
+                       Parameter("lookahead_rate", 0.4, 0., 1.)],
+}
+
+GAMES = 40  # games played by each candidate (half of them from each seat)
+NODES = 1000  # nodes searched per move by both players
+OPPONENT = "improved_score"  # heuristic of the reference player
+SEED = 20170101  # seed of the openings
+TIME_LIMIT = 60000  # per move; only guards against a stuck search
+
+# The settings a candidate's score depends on besides its weights
+TuningConfig = namedtuple("TuningConfig", ["heuristic", "games", "nodes", "opponent", "seed"])
+TuningConfig.__new__.__defaults__ = (GAMES, NODES, OPPONENT, SEED)
+
+
+def default_weights(heuristic):
+    """Return the default weights of a heuristic as a dictionary."""
+    if heuristic not in PARAMETERS:
+        raise ValueError("Unknown heuristic: {}".format(heuristic))
+    return {param.name: param.default for param in PARAMETERS[heuristic]}
+
+
+def score_function(heuristic, weights):
+    """Return the score function of a heuristic with the given weights."""
+    return functools.partial(getattr(game_agent, heuristic), **weights)
+
+
+def openings(config):
+    """Return the opening moves of the games of a candidate: one random
+    opening of two plies for every pair of games.
+    """
+    rng = random.Random(config.seed)
+    result = []
+    for _ in range((config.games + 1) // 2):
+        game = Board(1, 2, shuffle_moves=False)
+        opening = []
+        for _ in range(2):
+            move = rng.choice(game.get_legal_moves())
+            game.apply_move(move)
+            opening.append(move)
+        result.append(tuple(opening))
+    return result
+
+
+def play_game(config, weights, opening, seat):
+    """Play one game of a candidate from an opening, with the tuned player in
+    the given seat (0 to move first), and return 1 if it wins, 0 otherwise.
+    """
+    tuned = game_agent.AlphaBetaPlayer(score_fn=score_function(config.heuristic, weights),
+                                       budget=NodeLimit(config.nodes))
+    reference = game_agent.AlphaBetaPlayer(score_fn=SCORE_FUNCTIONS[config.opponent],
+                                           budget=NodeLimit(config.nodes))
+    players = (tuned, reference) if seat == 0 else (reference, tuned)
+    game = Board(players[0], players[1], shuffle_moves=False)
+    for move in opening:
+        game.apply_move(move)
+    winner, _, _ = game.play(time_limit=TIME_LIMIT)
+    return int(winner is tuned)
+
+
+def _play_task(task):
+    return play_game(*task)
+
+
+class CandidateCache:
+    """Scores of evaluated candidates, kept in memory and appended to a JSON
+    lines file (if `path` is not None) so that later runs can read them back.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._scores = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._scores[entry["key"]] = entry["score"]
+
+    @staticmethod
+    def key(config, weights):
+        """Return the cache key of a candidate: weights are rounded to six
+        decimals, so that values equal up to float noise share a key.
+        """
+        return json.dumps([list(config), sorted((name, round(value, 6))
+                                                for name, value in weights.items())])
+
+    def get(self, config, weights):
+        return self._scores.get(self.key(config, weights))
+
+    def put(self, config, weights, score):
+        key = self.key(config, weights)
+        self._scores[key] = score
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "score": score}) + "\n")
+
+    def __len__(self):
+        return len(self._scores)
+
+
+def evaluate(config, candidates, cache=None, processes=1):
+    """Return the score (fraction of games won) of each candidate in a list
+    of weight dictionaries, playing the games of the candidates missing from
+    the cache in `processes` worker processes (see
+    `tournament.worker_count`) and adding their scores to the cache.
+    """
+    cache = cache if cache is not None else CandidateCache()
+    scores = [cache.get(config, weights) for weights in candidates]
+    missing = [idx for idx, score in enumerate(scores) if score is None]
+    games = list(itertools.product(openings(config), (0, 1)))[:config.games]
+    tasks = [(config, candidates[idx], opening, seat)
+             for idx in missing for opening, seat in games]
+
+    def record(results):
+        # results come in task order, so each candidate is cached as soon as
+        # its last game ends
+        for idx in missing:
+            wins = sum(next(results) for _ in games)
+            scores[idx] = float(wins) / len(games)
+            cache.put(config, candidates[idx], scores[idx])
+
+    processes = worker_count(processes)
+    if processes <= 1:
+        record(map(_play_task, tasks))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            record(pool.imap(_play_task, tasks, chunksize=1))
+    return scores
+
+
+def grid_search(config, grid, cache=None, processes=1):
+    """Score every combination of the values of a grid (a dictionary of
+    lists of values by weight name; other weights keep their default) and
+    return the (score, weights) pairs from best to worst.
+    """
+    names = sorted(grid)
+    unknown = set(names) - set(default_weights(config.heuristic))
+    if unknown:
+        raise ValueError("Unknown weights of {}: {}".format(config.heuristic, sorted(unknown)))
+    candidates = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        weights = default_weights(config.heuristic)
+        weights.update(zip(names, values))
+        candidates.append(weights)
+    scores = evaluate(config, candidates, cache, processes)
+    return sorted(zip(scores, candidates), key=lambda pair: -pair[0])
+
+
+def spsa(config, iterations, cache=None, processes=1, a=0.1, c=0.1, seed=0):
+    """Tune the weights of a heuristic with SPSA, starting from the default
+    weights, and return the final weights.
+
+    Every iteration scores two candidates, the weights moved by +/- c_k
+    along a random +/-1 direction (in units of each weight's range), and
+    steps the weights by a_k times the estimated gradient. The gains decay
+    as a_k = a / (k + 1 + A) ** 0.602 and c_k = c / (k + 1) ** 0.101 with
+    A a tenth of the iterations. The directions are drawn from `seed`, so a
+    resumed run replays the same candidates and finds their scores cached.
+    """
+    params = PARAMETERS[config.heuristic]
+    rng = random.Random(seed)
+    theta = [(param.default - param.low) / (param.high - param.low) for param in params]
+    stability = iterations / 10.
+
+    def weights(point):
+        return {param.name: param.low + min(max(x, 0.), 1.) * (param.high - param.low)
+                for param, x in zip(params, point)}
+
+    for k in range(iterations):
+        a_k = a / (k + 1 + stability) ** 0.602
+        c_k = c / (k + 1) ** 0.101
+        delta = [rng.choice((-1, 1)) for _ in params]
+        plus = [x + c_k * d for x, d in zip(theta, delta)]
+        minus = [x - c_k * d for x, d in zip(theta, delta)]
+        score_plus, score_minus = evaluate(config, [weights(plus), weights(minus)], cache,
+                                           processes)
+        theta = [min(max(x + a_k * (score_plus - score_minus) / (2 * c_k * d), 0.), 1.)
+                 for x, d in zip(theta, delta)]
+        print("iteration {}: {:.3f} / {:.3f} -> {}".format(
+            k + 1, score_plus, score_minus, _format(weights(theta))), flush=True)
+    return weights(theta)
+
+
+def _format(weights):
+    return ", ".join("{}={:.3f}".format(name, value) for name, value in sorted(weights.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("heuristic", choices=sorted(PARAMETERS))
+    parser.add_argument("--method", choices=["spsa", "grid"], default="spsa")
+    parser.add_argument("--iterations", type=int, default=20, help="SPSA iterations")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="values of a weight in the grid (repeat for each weight)")
+    parser.add_argument("--games", type=int, default=GAMES)
+    parser.add_argument("--nodes", type=int, default=NODES)
+    parser.add_argument("--opponent", choices=sorted(SCORE_FUNCTIONS), default=OPPONENT)
+    parser.add_argument("--seed", type=int, default=SEED, help="seed of the openings")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes; 0 for one per CPU (default: %(default)s)")
+    parser.add_argument("--cache", help="JSON lines file of the scores of evaluated candidates")
+    args = parser.parse_args()
+
+    config = TuningConfig(args.heuristic, args.games, args.nodes, args.opponent, args.seed)
+    cache = CandidateCache(args.cache)
+    baseline = evaluate(config, [default_weights(args.heuristic)], cache, args.processes)[0]
+    print("default weights: {:.3f} ({})".format(baseline, _format(default_weights(args.heuristic))))
+    if args.method == "grid":
+        grid = {}
+        for entry in args.grid:
+            name, _, values = entry.partition("=")
+            grid[name] = [float(value) for value in values.split(",")]
+        for score, weights in grid_search(config, grid, cache, args.processes):
+            print("{:.3f}  {}".format(score, _format(weights)))
+    else:
+        weights = spsa(config, args.iterations, cache, args.processes)
+        score = evaluate(config, [weights], cache, args.processes)[0]
+        print("tuned weights: {:.3f} ({})".format(score, _format(weights)))
+
+
+if __name__ == "__main__":
+    main()